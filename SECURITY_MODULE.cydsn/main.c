@@ -27,6 +27,13 @@
 #define RECV_OK "K"
 #define EMPTY "EMPTY"
 #define EMPTY_BILL "*****EMPTY*****"
+#define BATCH_FLAG 'B'
+#define WINDOW_FLAG 'W'
+#define RECV_OK_WINDOW "K\0W"
+#define RESEND 'R'
+#define WITH_OK_BATCH "K\0B"
+// bills packed into each batch frame
+#define BATCH_BILLS 32
 
 /* 
  * How to read from EEPROM (persistent memory):
@@ -57,11 +64,46 @@ CY_ISR(Reset_ISR)
 }
 
 
+/*
+ * Loads bills sent as 1B index | bill, several ahead of their acks.
+ * Each bill stored, or already stored, is answered with "K" and the number
+ * of bills stored. The first bill after a missing one is answered with "R"
+ * and the same number, and later ones are dropped until the ATM resends
+ * the missing one.
+ */
+void provisionWindowed(uint8 numbills)
+{
+    uint8 message[64], ack[2], loaded = 0;
+    int resend_requested = 0;
+    
+    while (loaded < numbills) {
+        pullMessage(message);
+        
+        if (message[0] > loaded) {
+            if (resend_requested) {
+                continue;                       // dropped
+            }
+            resend_requested = 1;
+            ack[0] = RESEND;
+        } else {
+            resend_requested = 0;
+            if (message[0] == loaded) {
+                PIGGY_BANK_Write(message + 1, MONEY[loaded], BILL_LEN);
+                loaded++;
+            }
+            ack[0] = RECV_OK[0];
+        }
+        ack[1] = loaded;
+        pushMessage(ack, 2);
+    }
+}
+
+
 // provisions HSM (should only ever be called once)
 void provision()
 {
-    int i;
-    uint8 message[64], numbills;
+    int i, windowed;
+    uint8 message[64], numbills, len;
     
     for(i = 0; i < 128; i++) {
         PIGGY_BANK_Write((uint8*)EMPTY_BILL, MONEY[i], BILL_LEN);
@@ -79,10 +121,16 @@ void provision()
     PIGGY_BANK_Write(message, UUID, strlen((char*)message) + 1);
     pushMessage((uint8*)RECV_OK, strlen(RECV_OK));
     
-    // Get numbills
-    pullMessage(message);
+    // Get numbills, and whether the ATM sends bills ahead of acks
+    len = pullMessage(message);
     numbills = message[0];
+    windowed = len > 1 && message[1] == WINDOW_FLAG;
     PIGGY_BANK_Write(&numbills, BILLS_LEFT, 1u);
+    if (windowed) {
+        pushMessage((uint8*)RECV_OK_WINDOW, sizeof(RECV_OK_WINDOW) - 1);
+        provisionWindowed(numbills);
+        return;
+    }
     pushMessage((uint8*)RECV_OK, strlen(RECV_OK));
     
     // Load bills
@@ -94,9 +142,12 @@ void provision()
 }
 
 
-void dispenseBill()
+/*
+ * Copies the next bill in the stack to message and erases it
+ */
+void dispenseBill(uint8 message[])
 {
-    uint8 message[16], stackloc;
+    uint8 stackloc;
     static const uint8 STACKLOC[1] = {0x00}; // write variable
     volatile const uint8* stackptr = STACKLOC; // read variable
     volatile const uint8* billptr;
@@ -104,10 +155,8 @@ void dispenseBill()
     stackloc = *stackptr; // read stackloc from EEPROM
     billptr = MONEY[stackloc];
     
-    memset(message, 0u, 16);
+    memset(message, 0u, BILL_LEN);
     memcpy(message, (void*)billptr, BILL_LEN);
-
-    pushMessage(message, BILL_LEN);
     
     PIGGY_BANK_Write((uint8*)EMPTY_BILL, MONEY[stackloc], 16);
     stackloc = (stackloc + 1) % 128;
@@ -115,6 +164,29 @@ void dispenseBill()
 }
 
 
+/*
+ * Sends numbills bills packed up to BATCH_BILLS to a frame, each bill
+ * preceded by its 1B length
+ */
+void dispenseBatches(uint8 numbills)
+{
+    uint8 batch[BATCH_BILLS * (BILL_LEN + 1)], i, count;
+    uint16 len;
+    
+    while (numbills) {
+        count = numbills < BATCH_BILLS ? numbills : BATCH_BILLS;
+        len = 0;
+        for (i = 0; i < count; i++) {
+            batch[len++] = BILL_LEN;
+            dispenseBill(batch + len);
+            len += BILL_LEN;
+        }
+        pushFrame(batch, len);
+        numbills -= count;
+    }
+}
+
+
 int main(void)
 {
     CyGlobalIntEnable; /* Enable global interrupts. */
@@ -124,7 +196,8 @@ int main(void)
     
     /* Declare vairables here */
     
-    uint8 numbills, i, bills_left;
+    uint8 numbills, i, bills_left, len;
+    int batch;
     uint8 message[64];
     
     /*
@@ -174,22 +247,30 @@ int main(void)
         } else {
             pushMessage((uint8*)WITH_OK, strlen(WITH_OK));
             
-            // get number of bills
-            pullMessage(message);
+            // get number of bills, and whether to batch them
+            len = pullMessage(message);
             numbills = message[0];
+            batch = len > 1 && message[1] == BATCH_FLAG;
             
             ptr = BILLS_LEFT;
             if (*ptr < numbills) {
                 pushMessage((uint8*)WITH_BAD, strlen(WITH_BAD));
                 continue;
+            } else if (batch) {
+                pushMessage((uint8*)WITH_OK_BATCH, sizeof(WITH_OK_BATCH) - 1);
             } else {
                 pushMessage((uint8*)WITH_OK, strlen(WITH_OK));
-                bills_left = *ptr - numbills;
-                PIGGY_BANK_Write(&bills_left, BILLS_LEFT, 0x01);
             }
+            bills_left = *ptr - numbills;
+            PIGGY_BANK_Write(&bills_left, BILLS_LEFT, 0x01);
             
-            for (i = 0; i < numbills; i++) {
-                dispenseBill();
+            if (batch) {
+                dispenseBatches(numbills);
+            } else {
+                for (i = 0; i < numbills; i++) {
+                    dispenseBill(message);
+                    pushMessage(message, BILL_LEN);
+                }
             }
         }
     }
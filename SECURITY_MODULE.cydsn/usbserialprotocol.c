@@ -10,6 +10,7 @@
  * ========================================
 */
 
+#include <string.h>
 #include "usbserialprotocol.h"
 
 #define RECV_OK 0
@@ -19,6 +20,33 @@
 #define RDY_MSG_PROV "HSM_P"
 #define RDY_BAD "BAD"
 #define GO_MSG "GO"
+#define SESSION_FLAG 'S'
+#define FRAME_FLAG 'V'
+
+// version 2 frames, see pushMessage
+#define V2_MAGIC 0x00
+#define V2_DATA 'D'
+#define V2_NAK 'N'
+#define V2_HEADER_LEN 4
+#define V2_MAX_PAYLOAD 560
+// largest version 2 payload accepted from the ATM
+#define V2_MAX_PULL 64
+// frames kept to send again if the ATM asks
+#define V2_HISTORY 4
+
+// set when the ATM asked to keep a session in the last sync
+static uint8 session = 0;
+
+// frame version agreed at the last sync, and the one in use, which is
+// always 1 during a sync
+static uint8 frame_version = 1;
+static uint8 framing = 1;
+static uint8 tx_seq = 0;
+static uint8 rx_seq = 0;
+static int nacked = -1;
+static uint8 history[V2_HISTORY][V2_MAX_PAYLOAD];
+static uint16 history_len[V2_HISTORY];
+static uint8 history_seq[V2_HISTORY];
 
 
 uint8 getValidByte()
@@ -30,10 +58,85 @@ uint8 getValidByte()
 }
 
 
+uint16 crc16(uint16 crc, const uint8 data[], uint16 size)
+{
+    uint16 i;
+    uint8 bit;
+    
+    // CRC-16/CCITT-FALSE when started from 0xFFFF
+    for (i = 0; i < size; i++) {
+        crc ^= (uint16)data[i] << 8;
+        for (bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+        }
+    }
+    return crc;
+}
+
+
+/*
+ * Sends one version 2 frame:
+ *
+ *    1B     1B     1B     2B (LE)        size B         2B (LE)
+ * | 0x00 | kind | seq |   size   | data ...        | crc |
+ *
+ * with the CRC taken over everything after the 0x00
+ */
+void putV2(uint8 kind, uint8 seq, const uint8 data[], uint16 size)
+{
+    uint8 header[V2_HEADER_LEN];
+    uint16 i, crc;
+    
+    header[0] = kind;
+    header[1] = seq;
+    header[2] = size & 0xFF;
+    header[3] = size >> 8;
+    crc = crc16(crc16(0xFFFF, header, V2_HEADER_LEN), data, size);
+    
+    DB_UART_UartPutChar(V2_MAGIC);
+    for (i = 0; i < V2_HEADER_LEN; i++) {
+        DB_UART_UartPutChar(header[i]);
+    }
+    for (i = 0; i < size; i++) {
+        DB_UART_UartPutChar(data[i]);
+    }
+    DB_UART_UartPutChar(crc & 0xFF);
+    DB_UART_UartPutChar(crc >> 8);
+}
+
+
+// sends the next data frame and keeps it in case the ATM asks again
+void pushV2(const uint8 data[], uint16 size)
+{
+    uint8 slot = tx_seq % V2_HISTORY;
+    
+    memcpy(history[slot], data, size);
+    history_len[slot] = size;
+    history_seq[slot] = tx_seq;
+    putV2(V2_DATA, tx_seq, data, size);
+    tx_seq++;
+}
+
+
+// asks the ATM to send frame seq again, once per missing frame
+void requestFrame(uint8 seq)
+{
+    if (nacked != seq) {
+        nacked = seq;
+        putV2(V2_NAK, seq, NULL, 0);
+    }
+}
+
+
 int pushMessage(const uint8 data[], uint8 size)
 {
     int i;
 
+    if (framing == 2) {
+        pushV2(data, size);
+        return RECV_OK;
+    }
+
     DB_UART_UartPutChar(size);
     
     for (i = 0; i < size; i++) {
@@ -44,17 +147,90 @@ int pushMessage(const uint8 data[], uint8 size)
 }
 
 
-uint8 pullMessage(uint8 data[])
+void pushFrame(const uint8 data[], uint16 size)
 {
-    int i, len;
+    uint16 i;
     
-    len = getValidByte();
+    if (framing == 2) {
+        pushV2(data, size);
+        return;
+    }
     
-    for (i = 0; i < len; i++) {
-        data[i] = getValidByte();   
+    if (size < EXTENDED_HEADER) {
+        DB_UART_UartPutChar(size);
+    } else {
+        DB_UART_UartPutChar(EXTENDED_HEADER);
+        DB_UART_UartPutChar(size & 0xFF);
+        DB_UART_UartPutChar(size >> 8);
     }
     
-    return len;
+    for (i = 0; i < size; i++) {
+        DB_UART_UartPutChar(data[i]);   
+    }
+}
+
+
+/*
+ * Legacy frames start with their length, which is never 0, so a leading
+ * 0x00 marks a version 2 frame. Version 2 frames that are corrupt, or that
+ * arrive after a missing one, are dropped and asked for again. Frames the
+ * ATM asks for are sent again.
+ */
+uint8 pullMessage(uint8 data[])
+{
+    int i, len;
+    uint8 header[V2_HEADER_LEN], crc[2], slot, ahead;
+    
+    for (;;) {
+        len = getValidByte();
+        
+        if (len != V2_MAGIC) {
+            for (i = 0; i < len; i++) {
+                data[i] = getValidByte();   
+            }
+            return len;
+        }
+        
+        for (i = 0; i < V2_HEADER_LEN; i++) {
+            header[i] = getValidByte();
+        }
+        len = header[2] | header[3] << 8;
+        if ((header[0] != V2_DATA && header[0] != V2_NAK) || len > V2_MAX_PULL) {
+            requestFrame(rx_seq);                   // garbled header
+            continue;
+        }
+        for (i = 0; i < len; i++) {
+            data[i] = getValidByte();
+        }
+        crc[0] = getValidByte();
+        crc[1] = getValidByte();
+        if (crc16(crc16(0xFFFF, header, V2_HEADER_LEN), data, len)
+            != (crc[0] | crc[1] << 8)) {
+            requestFrame(rx_seq);                   // corrupt
+            continue;
+        }
+        
+        if (header[0] == V2_NAK) {
+            slot = header[1] % V2_HISTORY;
+            if (history_seq[slot] == header[1]) {
+                putV2(V2_DATA, header[1], history[slot], history_len[slot]);
+            }
+            continue;
+        }
+        
+        ahead = header[1] - rx_seq;
+        if (ahead == 0) {
+            rx_seq++;
+            nacked = -1;
+            return len;
+        }
+        if (ahead < 128) {
+            // dropped, so ask for the missing frame and then this one
+            requestFrame(rx_seq);
+            putV2(V2_NAK, header[1], NULL, 0);
+        }
+        // otherwise a repeat of a frame already taken
+    }
 }
 
 /* 
@@ -65,31 +241,79 @@ uint8 pullMessage(uint8 data[])
  *    if good: PSoC -> PSoC name (prov/norm) -> ATM
  * 3) ATM -> "GO" -> PSoC
  * 4) if bad: goto 1)
+ *
+ * An ATM that sends "READY\0S" asks to keep a session. A PSoC that
+ * supports sessions answers a normal sync with its name followed by "\0S",
+ * and from then on also accepts a lone "GO" at 1) to skip straight to its
+ * next operation. Any other sync ends the session.
+ *
+ * A "V" among those flags asks for version 2 frames, and the PSoC answers
+ * with "V" among its flags if it agrees. Both ends then switch to version 2
+ * frames after "GO" and back to legacy frames at the next full sync.
  */
 void syncConnection(int prov) 
 {
-    uint8 message[32];
+    uint8 message[V2_MAX_PULL];
+    uint8 len, flags;
     
     // marco-polo with bank until connection is in sync
     do {
-        pullMessage(message);                               // 1)
+        len = pullMessage(message);                         // 1)
+        
+        if (session && !prov && len == strlen(GO_MSG) + 1
+            && !strcmp((char*)message, GO_MSG)) {
+            framing = frame_version;
+            return;                                         // resume session
+        }
+        
+        // syncs always use legacy frames
+        framing = 1;
+        flags = strlen(RDY_MSG_RECV) + 1;
+        if (!strcmp((char*)message, RDY_MSG_RECV)) {
+            frame_version = len > flags
+                            && memchr(message + flags, FRAME_FLAG, len - flags) ? 2 : 1;
+            tx_seq = 0;
+            rx_seq = 0;
+            nacked = -1;
+            memset(history_len, 0, sizeof(history_len));
+        }
         
         if (strcmp((char*)message, RDY_MSG_RECV)) {
             pushMessage(message, strlen((char*)message));   // 2) bad
             strcpy((char*)message, RDY_BAD);
         } else if (prov) {
-            pushMessage((uint8*)RDY_MSG_PROV, 
-                        strlen(RDY_MSG_PROV));              // 2) good prov
+            session = 0;
+            strcpy((char*)message, RDY_MSG_PROV);
+            len = strlen(RDY_MSG_PROV);
+            if (frame_version == 2) {
+                message[len + 1] = FRAME_FLAG;
+                len += 2;
+            }
+            pushMessage(message, len);                      // 2) good prov
             
             pullMessage(message);                           // 3)
         } else {
-            pushMessage((uint8*)RDY_MSG_NORM, 
-                        strlen(RDY_MSG_NORM));              // 2) good norm
+            session = len > flags
+                      && memchr(message + flags, SESSION_FLAG, len - flags) != NULL;
+            strcpy((char*)message, RDY_MSG_NORM);
+            len = strlen(RDY_MSG_NORM) + 1;
+            if (session) {
+                message[len++] = SESSION_FLAG;
+            }
+            if (frame_version == 2) {
+                message[len++] = FRAME_FLAG;
+            }
+            if (len == strlen(RDY_MSG_NORM) + 1) {
+                len--;                                      // no flags
+            }
+            pushMessage(message, len);                      // 2) good norm
             
             pullMessage(message);                           // 3
         }
         
     } while (strcmp((char*)message, GO_MSG));               // 4)
+    
+    framing = frame_version;
 }
 
 /* [] END OF FILE */
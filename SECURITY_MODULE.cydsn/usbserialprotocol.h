@@ -16,6 +16,9 @@
 
 #define SYNC_NORM 0
 #define SYNC_PROV 1
+
+// header byte of an extended frame, followed by a 2B little endian length
+#define EXTENDED_HEADER 0xFF
     
 /*
  * Blocking function that returns the first character  placed on DB_UART
@@ -30,6 +33,14 @@ uint8 getValidByte();
 int pushMessage(const uint8 message[], uint8 size);
 
 
+/*
+ * Sends the first size bytes of data to the USB-SERIAL in one frame, which
+ * may be longer than 254B. Legacy frames that long get an extended header,
+ * so only for ATMs that asked for extended frames
+ */
+void pushFrame(const uint8 data[], uint16 size);
+
+
 /*
  * Receives a message form the USB-SERIAL and places the data in message
  * Returns length of pulled message
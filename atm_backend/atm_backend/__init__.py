@@ -3,4 +3,5 @@ from .atm import ATM
 from interface.bank import Bank, DummyBank
 from interface.hsm import HSM, DummyHSM
 from interface.card import Card, DummyCard
-from interface.psoc import DeviceRemoved
+from interface.psoc import DeviceRemoved, DeviceTimeout, Pacing, Deadlines
+from interface.latency import LatencyStats
@@ -91,17 +91,58 @@ Available XML-RPC functions:
         Returns:
             str: 'success' on success
                  'failure' if HSM failed during provisioning
+
+    wait_for_card:
+        Waits for an ATM card to be inserted
+
+        Args:
+            timeout (float): Most seconds to wait, up to 60
+
+        Returns:
+            bool: True if a card is inserted, False if none was in time
+
+    stats:
+        Reports how long each phase of recent transactions took, such as
+        'card.sync', 'card.auth', 'withdraw.hsm_uuid', 'withdraw.bank' and
+        'withdraw.dispense', with 'withdraw' for the whole call
+
+        Returns:
+            dict: for each phase, the number of samples as 'count' and the
+                p50, p95, p99 and max latency in milliseconds
+
+    queue_depth:
+        Reports how many calls are waiting for or using each device. Calls
+        are served concurrently, but one at a time per card and HSM
+
+        Returns:
+            dict: number of calls, including the running one, under 'card'
+                and 'hsm'
 """
 
 import os
 import logging
 from logging import handlers
 import sys
-import SimpleXMLRPCServer
 import yaml
 import threading
 from . import ATM, ProvisionTool
-from . import Bank, Card, HSM, DummyBank, DummyCard, DummyHSM
+from .scheduler import DeviceScheduler, ThreadedXMLRPCServer
+from .log_queue import start_queue_logging
+from . import Bank, Card, HSM, DummyBank, DummyCard, DummyHSM, Pacing, Deadlines, LatencyStats
+from .interface.serial_emulator import CardEmulator, HSMEmulator, PtyEmulator
+
+
+def serve_pty(emulator, config):
+    """Serves emulator on a pseudo terminal shaped per the serial config
+
+    Returns:
+        str: path of the terminal
+    """
+    serial_config = config.get('serial') or {}
+    pty = PtyEmulator(emulator, baudrate=serial_config.get('pty_baudrate'),
+                      latency=float(serial_config.get('pty_latency', 0)))
+    logging.info('Serving %s on %s', emulator.name, pty.path)
+    return pty.path
 
 
 def main():
@@ -117,13 +158,16 @@ def main():
 
     ch = logging.StreamHandler(sys.stdout)
     ch.setFormatter(log_format)
-    log.addHandler(ch)
+    log_handlers = [ch]
 
     if config['verbose']:
         log_path = os.path.dirname(__file__) + config['logging']['log_path']
         fh = handlers.RotatingFileHandler("%s/%s.log" % (log_path, config['logging']['log_name']), backupCount=7)
         fh.setFormatter(log_format)
-        log.addHandler(fh)
+        log_handlers.append(fh)
+
+    # Request threads only queue records, the listener thread writes them out
+    start_queue_logging(log, log_handlers, int(config['logging'].get('queue_size', 10000)))
 
     # Create Bank object which creates connection with bank server
     # a dummy counterpart is also available for use
@@ -131,34 +175,61 @@ def main():
     if config['devices']['bank']['dummy']:
         bank = DummyBank()
     else:
-        bank = Bank(config['devices']['bank']['host'],
-                    config['devices']['bank']['port'])
+        bank_config = config['devices']['bank']
+        bank = Bank(bank_config['host'], bank_config['port'],
+                    pool_size=int(bank_config.get('pool_size', 4)),
+                    connect_timeout=float(bank_config.get('connect_timeout', 5)),
+                    read_timeout=float(bank_config.get('read_timeout', 10)))
     logging.info('Bank initialized.')
 
+    # Shared by the ATM, HSM and card to time each phase of a transaction
+    latency = LatencyStats.from_config(config.get('latency'))
+
     # Create secmod object which creates connection with secmod psoc
     # a emulated counterpart is also available for use
+    # Card and HSM each get their own pacing since each tracks its own link
     if config['devices']['hsm']['dummy']:
         logging.info('Initializing DummyHSM ')
-        hsm = DummyHSM(verbose=config['verbose'], provision=True)
+        hsm = DummyHSM(verbose=config['verbose'], provision=True,
+                       pacing=Pacing.from_config(config.get('serial')),
+                       window=config['devices']['hsm'].get('provision_window', 8),
+                       deadlines=Deadlines.from_config(config.get('serial')),
+                       latency=latency)
         logging.info('DummyHSM initialized.')
     else:
         logging.info('Initializing HSM...')
-        hsm = HSM(verbose=config['verbose'])
+        port = None
+        if config['devices']['hsm'].get('pty'):
+            port = serve_pty(HSMEmulator(provision=True, verbose=config['verbose']), config)
+        hsm = HSM(port=port, verbose=config['verbose'],
+                  pacing=Pacing.from_config(config.get('serial')),
+                  window=config['devices']['hsm'].get('provision_window', 8),
+                  deadlines=Deadlines.from_config(config.get('serial')),
+                  latency=latency)
         logging.info('HSM initialized.')
 
     # Create card object which connects and reconnects to inserted cards
     if config['devices']['card']['dummy']:
         logging.info('Initializing DummyCard...')
-        card = DummyCard(verbose=config['verbose'], provision=True)
+        card = DummyCard(verbose=config['verbose'], provision=True,
+                         pacing=Pacing.from_config(config.get('serial')),
+                         deadlines=Deadlines.from_config(config.get('serial')),
+                         latency=latency)
         logging.info('DummyCard initialized.')
     else:
         logging.info('Initializing Card...')
-        card = Card(verbose=config['verbose'])
+        port = None
+        if config['devices']['card'].get('pty'):
+            port = serve_pty(CardEmulator(provision=True, verbose=config['verbose']), config)
+        card = Card(port=port, verbose=config['verbose'],
+                    pacing=Pacing.from_config(config.get('serial')),
+                    deadlines=Deadlines.from_config(config.get('serial')),
+                    latency=latency)
         logging.info('Card initialized.')
 
     # Create ATM object with bank, hsm, and card instances
     logging.info('Initializing ATM...')
-    atm = ATM(bank, hsm, card)
+    atm = ATM(bank, hsm, card, latency=latency)
     logging.info('ATM initialized.')
 
     logging.info('Initializing Provision Tool...')
@@ -167,21 +238,25 @@ def main():
 
     # Start xmlrpc server on host and port specified in config.yaml
     logging.info('Initializing ATM xmlrpc interface...')
-    server = SimpleXMLRPCServer.SimpleXMLRPCServer((config['devices']['atm']['host'], config['devices']['atm']['port']))
+    server = ThreadedXMLRPCServer((config['devices']['atm']['host'], config['devices']['atm']['port']))
+    scheduler = DeviceScheduler()
 
     # Register built-in rpc introspections
     server.register_introspection_functions()
 
-    # Register api exposed by atm and hsm
+    # Register api exposed by atm and hsm, serialized per device they use
     server.register_function(atm.hello)
-    server.register_function(atm.withdraw)
-    server.register_function(atm.check_balance)
-    server.register_function(atm.change_pin)
-    server.register_function(provision_tool.provision_card)
-    server.register_function(provision_tool.provision_atm)
+    server.register_function(atm.wait_for_card)
+    server.register_function(scheduler.wrap(atm.withdraw, 'card', 'hsm'))
+    server.register_function(scheduler.wrap(atm.check_balance, 'card'))
+    server.register_function(scheduler.wrap(atm.change_pin, 'card'))
+    server.register_function(scheduler.wrap(provision_tool.provision_card, 'card'))
+    server.register_function(scheduler.wrap(provision_tool.provision_atm, 'hsm'))
     server.register_function(provision_tool.ready_for_hsm)
     server.register_function(provision_tool.hsm_connected)
     server.register_function(provision_tool.card_connected)
+    server.register_function(scheduler.queue_depth)
+    server.register_function(atm.stats)
 
     logging.info('ATM xmlrpc interface initialized.')
     logging.info('ATM listening on %s:%s' % (config['devices']['atm']['host'], str(config['devices']['atm']['port'])))
@@ -1,5 +1,41 @@
 import logging
-from interface.psoc import DeviceRemoved, NotProvisioned
+import sys
+import threading
+from interface.psoc import DeviceRemoved, DeviceTimeout, NotProvisioned
+from interface.latency import LatencyStats, timed
+
+
+class Concurrent(object):
+    """Runs func(*args) on its own thread
+
+    Args:
+        func (function): function to run
+        *args: arguments to func
+    """
+
+    def __init__(self, func, *args):
+        self.value = None
+        self.error = None
+        self.thread = threading.Thread(target=self.run, args=(func, args))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self, func, args):
+        try:
+            self.value = func(*args)
+        except Exception:
+            self.error = sys.exc_info()
+
+    def result(self):
+        """wait for func to finish
+
+        Returns:
+            what func returned, or raises what func raised
+        """
+        self.thread.join()
+        if self.error:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.value
 
 
 class ATM(object):
@@ -9,17 +45,48 @@ class ATM(object):
         bank (Bank or BankEmulator): Interface to bank
         hsm (HSM or HSMEmulator): Interface to HSM
         card (Card or CardEmulator): Interface to ATM card
+        latency (LatencyStats, optional): Where to record how long each phase
+            of a transaction takes. Default records nothing
     """
 
-    def __init__(self, bank, hsm, card):
+    def __init__(self, bank, hsm, card, latency=None):
         self.bank = bank
         self.hsm = hsm
         self.card = card
+        self.latency = latency or LatencyStats(enabled=False)
+
+    # Longest wait_for_card holds a request open for
+    MAX_CARD_WAIT = 60
 
     def hello(self):
         logging.info("Got hello request")
         return "hello"
 
+    def wait_for_card(self, timeout):
+        """Waits for an ATM card to be inserted, so front ends can long
+        poll instead of calling card_connected over and over
+
+        Args:
+            timeout (float): Most seconds to wait, capped at MAX_CARD_WAIT
+
+        Returns:
+            bool: True if a card is inserted, False if none was in time
+        """
+        timeout = min(float(timeout), self.MAX_CARD_WAIT)
+        logging.info('wait_for_card: Waiting up to %ss for a card', timeout)
+        return self.card.wait_for_insert(timeout)
+
+    def stats(self):
+        """Reports how long each phase of recent transactions took
+
+        Returns:
+            dict: for each phase, such as 'withdraw.bank' or 'card.sync',
+                the number of samples as 'count' and the p50, p95, p99 and
+                max latency in milliseconds
+        """
+        return self.latency.summary()
+
+    @timed('check_balance')
     def check_balance(self, pin):
         """Tries to check the balance of the account associated with the
         connected ATM card
@@ -37,12 +104,14 @@ class ATM(object):
 
         try:
             logging.info('check_balance: Requesting card_id using inputted pin')
-            card_id = self.card.check_balance(pin)
+            with self.latency.span('check_balance.card'):
+                card_id = self.card.check_balance(pin)
 
             # get balance from bank if card accepted PIN
             if card_id:
                 logging.info('check_balance: Requesting balance from Bank')
-                res = self.bank.check_balance(card_id)
+                with self.latency.span('check_balance.bank'):
+                    res = self.bank.check_balance(card_id)
                 if res:
                     return res
             logging.info('check_balance failed')
@@ -50,10 +119,14 @@ class ATM(object):
         except DeviceRemoved:
             logging.info('ATM card was removed!')
             return False
+        except DeviceTimeout as e:
+            logging.info('Device stopped responding: %s', e)
+            return False
         except NotProvisioned:
             logging.info('ATM card has not been provisioned!')
             return False
 
+    @timed('change_pin')
     def change_pin(self, old_pin, new_pin):
         """Tries to change the PIN of the connected ATM card
 
@@ -71,17 +144,23 @@ class ATM(object):
             return False
         try:
             logging.info('change_pin: Sending PIN change request to card')
-            if self.card.change_pin(old_pin, new_pin):
+            with self.latency.span('change_pin.card'):
+                changed = self.card.change_pin(old_pin, new_pin)
+            if changed:
                 return True
             logging.info('change_pin failed')
             return False
         except DeviceRemoved:
             logging.info('ATM card was removed!')
             return False
+        except DeviceTimeout as e:
+            logging.info('Device stopped responding: %s', e)
+            return False
         except NotProvisioned:
             logging.info('ATM card has not been provisioned!')
             return False
 
+    @timed('withdraw')
     def withdraw(self, pin, amount):
         """Tries to withdraw money from the account associated with the
         connected ATM card
@@ -104,23 +183,36 @@ class ATM(object):
             return False
 
         try:
-            logging.info('withdraw: Requesting card_id from card')
-            card_id = self.card.withdraw(pin)
-
-            # request UUID from HSM if card accepts PIN
-            if card_id:
-                logging.info('withdraw: Requesting hsm_id from hsm')
-                hsm_id = self.hsm.get_uuid()
-
-                # request withdrawal from bank if HSM gives UUID
-                if hsm_id:
-                    logging.info('withdraw: Requesting withdrawal from bank')
+            # The card checks the PIN while the HSM sends its UUID
+            logging.info('withdraw: Requesting card_id from card and hsm_id from hsm')
+            hsm_leg = Concurrent(self._get_hsm_uuid)
+            answered = False
+            try:
+                with self.latency.span('withdraw.card'):
+                    card_id = self.card.withdraw(pin)
+                answered = True
+            finally:
+                # Whatever the card raised, don't leave the HSM midway
+                # through a withdrawal
+                if not answered:
+                    self._cancel_hsm(hsm_leg)
+            hsm_id = hsm_leg.result()
+
+            # request withdrawal from bank if card accepts PIN and HSM gives UUID
+            if card_id and hsm_id:
+                logging.info('withdraw: Requesting withdrawal from bank')
+                with self.latency.span('withdraw.bank'):
                     hsm_id = self.bank.withdraw(hsm_id, card_id, amount)
-                    if hsm_id:
+                if hsm_id:
+                    with self.latency.span('withdraw.dispense'):
                         res = self.hsm.withdraw(hsm_id, amount)
-                        if res:
-                            return res
+                    if res:
+                        return res
                     return False
+                self.hsm.cancel()
+            elif hsm_id:
+                logging.info('withdraw: Card rejected PIN, cancelling hsm withdrawal')
+                self.hsm.cancel()
             logging.info('withdraw failed')
             return False
         except ValueError:
@@ -129,6 +221,28 @@ class ATM(object):
         except DeviceRemoved:
             logging.info('ATM card was removed!')
             return False
+        except DeviceTimeout as e:
+            logging.info('Device stopped responding: %s', e)
+            return False
         except NotProvisioned:
             logging.info('ATM card has not been provisioned!')
             return False
+
+    def _get_hsm_uuid(self):
+        """HSM.get_uuid, timed as the HSM leg of a withdrawal"""
+        with self.latency.span('withdraw.hsm_uuid'):
+            return self.hsm.get_uuid()
+
+    def _cancel_hsm(self, hsm_leg):
+        """Cancels the HSM side of a withdrawal whose card side failed
+
+        Args:
+            hsm_leg (Concurrent): running HSM.get_uuid
+        """
+        try:
+            if hsm_leg.result():
+                self.hsm.cancel()
+        except (DeviceRemoved, DeviceTimeout, NotProvisioned):
+            pass
+        except Exception as e:
+            logging.info('withdraw: Could not cancel hsm withdrawal: %r', e)
@@ -1,6 +1,7 @@
 from .bank import Bank, DummyBank
 from .card import Card, DummyCard
 from .hsm import HSM, DummyHSM
-from .psoc import Psoc
-from .psoc import DeviceRemoved, NotProvisioned, AlreadyProvisioned
+from .psoc import Psoc, Pacing, Deadlines
+from .latency import LatencyStats
+from .psoc import DeviceRemoved, DeviceTimeout, NotProvisioned, AlreadyProvisioned
 import serial_emulator
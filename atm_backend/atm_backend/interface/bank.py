@@ -3,24 +3,162 @@
 import logging
 import sys
 import socket
+import select
+import threading
+import httplib
 import xmlrpclib
 
 
+class PooledTransport(xmlrpclib.Transport):
+    """xmlrpclib transport keeping a bounded pool of HTTP/1.1 connections
+
+    Connections are reused across calls and threads, so a call only pays for
+    TCP setup when no idle connection is left. Connections the server closed
+    while idle are dropped before use, and any connection that fails during a
+    call is closed rather than returned to the pool.
+
+    Args:
+        pool_size (int): most connections open at once; further calls wait
+            for one to be returned
+        connect_timeout (float): seconds allowed to open a connection
+        read_timeout (float): seconds allowed for each read of a response
+    """
+
+    def __init__(self, pool_size=4, connect_timeout=5.0, read_timeout=10.0):
+        xmlrpclib.Transport.__init__(self)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def checkout(self, host):
+        """take an idle connection to host or open a new one
+
+        Returns:
+            (tuple): connection and whether it was reused
+        """
+        self.slots.acquire()
+        try:
+            while True:
+                with self.lock:
+                    if not self.idle:
+                        break
+                    conn = self.idle.pop()
+                if conn.host_key == host and not self.stale(conn):
+                    return conn, True
+                conn.close()
+            return self.connect(host), False
+        except Exception:
+            self.slots.release()
+            raise
+
+    def checkin(self, conn):
+        """return a connection that is ready for another request"""
+        with self.lock:
+            self.idle.append(conn)
+        self.slots.release()
+
+    def discard(self, conn):
+        """close a connection that must not be reused"""
+        conn.close()
+        self.slots.release()
+
+    def connect(self, host):
+        """open a connection to host with the connect and read timeouts"""
+        chost, _, _ = self.get_host_info(host)
+        conn = httplib.HTTPConnection(chost, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.host_key = host
+        return conn
+
+    def stale(self, conn):
+        """whether an idle connection was closed by the server
+
+        An idle connection has nothing to read unless the server closed it.
+        """
+        if conn.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (select.error, socket.error):
+            return True
+        return bool(readable)
+
+    def request(self, host, handler, request_body, verbose=0):
+        conn, reused = self.checkout(host)
+        try:
+            try:
+                self.send(conn, host, handler, request_body, verbose)
+            except (socket.error, httplib.HTTPException):
+                if not reused:
+                    raise
+                # The server went away before the request reached it
+                conn.close()
+                conn = self.connect(host)
+                self.send(conn, host, handler, request_body, verbose)
+
+            response = conn.getresponse(buffering=True)
+            if response.status != 200:
+                response.read()
+                raise xmlrpclib.ProtocolError(host + handler, response.status,
+                                              response.reason, response.msg)
+            self.verbose = verbose
+            result = self.parse_response(response)
+        except Exception:
+            self.discard(conn)
+            raise
+
+        if response.will_close:
+            self.discard(conn)
+        else:
+            self.checkin(conn)
+        return result
+
+    def send(self, conn, host, handler, request_body, verbose):
+        """send one request on conn"""
+        _, extra_headers, _ = self.get_host_info(host)
+        conn.set_debuglevel(verbose)
+        self.send_request(conn, handler, request_body)
+        for key, value in extra_headers or ():
+            conn.putheader(key, value)
+        self.send_user_agent(conn)
+        self.send_content(conn, request_body)
+
+    def close(self):
+        """close every idle connection"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+
 class Bank:
     """Interface for communicating with the bank
 
+    Calls share a pool of persistent connections, so one Bank may be used
+    from several threads.
+
     Args:
         address (str): IP address of bank
         port (int): Port to connect to
+        pool_size (int): most connections kept open to the bank
+        connect_timeout (float): seconds allowed to connect to the bank
+        read_timeout (float): seconds allowed for the bank to respond
     """
 
-    def __init__(self, address='127.0.0.1', port=1337):
+    def __init__(self, address='127.0.0.1', port=1337, pool_size=4,
+                 connect_timeout=5.0, read_timeout=10.0):
         try:
-            self.bank_rpc = xmlrpclib.ServerProxy('http://' + address + ':' + str(port))
+            self.transport = PooledTransport(pool_size, connect_timeout, read_timeout)
+            self.bank_rpc = xmlrpclib.ServerProxy('http://' + address + ':' + str(port),
+                                                  transport=self.transport)
         except socket.error:
             logging.error('Error connecting to bank server')
             sys.exit(1)
-        logging.info('Connected to Bank at %s:%s' % (address, str(port)))
+        logging.info('Connected to Bank at %s:%s', address, port)
 
     def check_balance(self, card_id):
         """Requests the balance of the account associated with the card_id
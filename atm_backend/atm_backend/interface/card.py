@@ -1,4 +1,5 @@
 from psoc import Psoc
+from latency import timed
 from serial_emulator import CardEmulator
 import logging
 
@@ -10,17 +11,26 @@ class Card(Psoc):
         port (str, optional): Serial port connected to an ATM card
             Default is dynamic card acquisition
         verbose (bool, optional): Whether to print debug messages
+        pacing (Pacing, optional): Spacing of frames sent to the card
+        deadlines (Deadlines, optional): How long to wait for the card
+        latency (LatencyStats, optional): Where to record how long syncs and
+            PIN checks take
     """
-    def __init__(self, port=None, verbose=False):
+    def __init__(self, port=None, verbose=False, pacing=None, deadlines=None, latency=None):
         self.port = port
         self.verbose = verbose
+        self.pacing = pacing
+        self.deadlines = deadlines
+        self.latency = latency
 
     def initialize(self):
-        super(Card, self).__init__('CARD', self.port, self.verbose)
+        super(Card, self).__init__('CARD', self.port, self.verbose, self.pacing,
+                                   deadlines=self.deadlines, latency=self.latency)
         self.CHECK_BAL = 1
         self.WITHDRAW = 2
         self.CHANGE_PIN = 3
 
+    @timed('card.auth')
     def _authenticate(self, pin):
         """Requests authentication from the ATM card
 
@@ -30,11 +40,11 @@ class Card(Psoc):
         Returns:
             bool: True if ATM card verified authentication, False otherwise
         """
-        self._vp('Sending pin %s' % pin)
+        self._vp('Sending pin %s', pin)
         self._push_msg(pin)
 
         resp = self._pull_msg()
-        self._vp('Card response was %s' % resp)
+        self._vp('Card response was %s', resp)
         return resp == 'OK'
 
     def _get_uuid(self):
@@ -44,7 +54,7 @@ class Card(Psoc):
             str: UUID of ATM card
         """
         uuid = self._pull_msg()
-        self._vp('Card sent UUID %s' % uuid)
+        self._vp('Card sent UUID %s', uuid)
         return uuid
 
     def _send_op(self, op):
@@ -54,11 +64,10 @@ class Card(Psoc):
             op (int): Operation to send from [self.CHECK_BAL, self.WITHDRAW,
                 self.CHANGE_PIN]
         """
-        self._vp('Sending op %d' % op)
+        self._vp('Sending op %d', op)
         self._push_msg(str(op))
 
-        while self._pull_msg() != 'K':
-            self._vp('Card hasn\'t received op', logging.error)
+        self._expect('K', 'Card hasn\'t received op')
         self._vp('Card received op')
 
     def change_pin(self, old_pin, new_pin):
@@ -74,15 +83,17 @@ class Card(Psoc):
         self._sync(False)
 
         if not self._authenticate(old_pin):
+            self._op_done()
             return False
 
         self._send_op(self.CHANGE_PIN)
 
-        self._vp('Sending PIN %s' % new_pin)
+        self._vp('Sending PIN %s', new_pin)
         self._push_msg(new_pin)
 
         resp = self._pull_msg()
-        self._vp('Card sent response %s' % resp)
+        self._vp('Card sent response %s', resp)
+        self._op_done()
         return resp == 'SUCCESS'
 
     def check_balance(self, pin):
@@ -98,11 +109,14 @@ class Card(Psoc):
         self._sync(False)
 
         if not self._authenticate(pin):
+            self._op_done()
             return False
 
         self._send_op(self.CHECK_BAL)
 
-        return self._get_uuid()
+        uuid = self._get_uuid()
+        self._op_done()
+        return uuid
 
     def withdraw(self, pin):
         """Requests to withdraw from ATM
@@ -117,11 +131,14 @@ class Card(Psoc):
         self._sync(False)
 
         if not self._authenticate(pin):
+            self._op_done()
             return False
 
         self._send_op(self.WITHDRAW)
 
-        return self._get_uuid()
+        uuid = self._get_uuid()
+        self._op_done()
+        return uuid
 
     def provision(self, uuid, pin):
         """Attempts to provision a new ATM card
@@ -137,18 +154,16 @@ class Card(Psoc):
 
         msg = self._pull_msg()
         if msg != 'P':
-            self._vp('Card alredy provisioned!', logging.error)
+            self._vp('Card alredy provisioned!', stream=logging.error)
             return False
         self._vp('Card sent provisioning message')
 
         self._push_msg('%s\00' % pin)
-        while self._pull_msg() != 'K':
-            self._vp('Card hasn\'t accepted PIN', logging.error)
+        self._expect('K', 'Card hasn\'t accepted PIN', self.deadlines.provision_timeout)
         self._vp('Card accepted PIN')
 
         self._push_msg('%s\00' % uuid)
-        while self._pull_msg() != 'K':
-            self._vp('Card hasn\'t accepted uuid', logging.error)
+        self._expect('K', 'Card hasn\'t accepted uuid', self.deadlines.provision_timeout)
         self._vp('Card accepted uuid')
 
         self._vp('Provisioning complete')
@@ -163,7 +178,11 @@ class DummyCard(Card):
         verbose (bool, optional): Whether to print debug messages
         provision (bool, optional): Whether to start the ATM card ready
             for provisioning
+        pacing (Pacing, optional): Spacing of frames sent to the card
+        deadlines (Deadlines, optional): How long to wait for the card
+        latency (LatencyStats, optional): Where to record how long syncs and
+            PIN checks take
     """
-    def __init__(self, verbose=False, provision=False):
+    def __init__(self, verbose=False, provision=False, pacing=None, deadlines=None, latency=None):
         ser = CardEmulator(verbose=verbose, provision=provision)
-        super(DummyCard, self).__init__(ser, verbose)
+        super(DummyCard, self).__init__(ser, verbose, pacing, deadlines, latency)
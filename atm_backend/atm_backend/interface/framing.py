@@ -0,0 +1,214 @@
+import binascii
+import struct
+
+# Header byte of an extended frame, followed by a 2B little endian length
+EXTENDED = 0xFF
+
+# First byte of a version 2 frame. Legacy frames never start with it since
+# nothing sends an empty legacy frame
+V2_MAGIC = 0x00
+# Version 2 frame kinds: data, and a request to resend the frame with seq
+DATA = 'D'
+NAK = 'N'
+# Largest version 2 payload accepted, so a garbled length is caught early
+V2_MAX_PAYLOAD = 4096
+# kind, seq, payload length
+V2_HEADER = struct.Struct('<cBH')
+V2_CRC = struct.Struct('<H')
+
+
+def crc16(data):
+    """CRC-16/CCITT-FALSE of data"""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def pack_v2(kind, seq, payload=''):
+    """version 2 frame
+
+    Args:
+        kind (str): DATA or NAK
+        seq (int): sequence number of the frame, or of the frame a NAK asks
+            for
+        payload (str, optional): frame payload
+    """
+    body = V2_HEADER.pack(kind, seq, len(payload)) + payload
+    return chr(V2_MAGIC) + body + V2_CRC.pack(crc16(body))
+
+
+def frame_header(length, extended=False):
+    """header for a frame with a length B payload
+
+    Args:
+        length (int): payload length
+        extended (bool, optional): whether the reader accepts extended
+            frames; only then may length exceed 254
+    """
+    if extended and length >= EXTENDED:
+        return struct.pack('<BH', EXTENDED, length)
+    return struct.pack('B', length)
+
+
+class FrameReader(object):
+    """Splits bytes read from a PSoC serial link into frames
+
+    A frame is a 1B payload length followed by the payload:
+
+         1B            len(pkt) B
+    | len(pkt) | pkt ...                |
+
+    Peers that agreed on it may also send extended frames for payloads
+    longer than 254B:
+
+         1B      2B (little endian)     len(pkt) B
+    |   0xFF   |     len(pkt)     | pkt ...                |
+
+    Version 2 frames, used once both ends agreed on them at sync, add a
+    kind, a sequence number and a CRC-16/CCITT-FALSE over everything after
+    the leading 0x00:
+
+        1B     1B     1B     2B (LE)        len(pkt) B         2B (LE)
+    | 0x00 | kind | seq | len(pkt) | pkt ...                | crc |
+
+    Each read asks for every byte the link already holds, or the rest of the
+    current frame if that is more, into one reusable buffer. Every frame
+    those bytes complete is then handed out without further reads.
+
+    Args:
+        read (function): read(size) returning up to size bytes, fewer only
+            if the link timed out
+        available (function, optional): number of bytes the link holds that
+            can be read without blocking
+        size (int, optional): initial buffer capacity, grown to fit larger
+            frames
+    """
+
+    def __init__(self, read, available=None, size=4096):
+        self.read = read
+        self.available = available or (lambda: 0)
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+        self.truncated = False
+
+    def reset(self):
+        """drop buffered bytes, e.g. after the link was reopened"""
+        self.start = 0
+        self.end = 0
+
+    def buffered(self):
+        """number of bytes read but not yet handed out"""
+        return self.end - self.start
+
+    def fill(self, size):
+        """read until at least size bytes are buffered
+
+        Returns:
+            bool: False if the link timed out first
+        """
+        while self.buffered() < size:
+            needed = size - self.buffered()
+            if size > len(self.buf):
+                # Move the partial frame to a buffer that fits all of it,
+                # leaving frames already handed out intact
+                count = self.buffered()
+                buf = bytearray(size)
+                buf[:count] = self.buf[self.start:self.end]
+                self.buf = buf
+                self.view = memoryview(buf)
+                self.start = 0
+                self.end = count
+            elif self.end + needed > len(self.buf):
+                # Move the partial frame to the front to make room
+                count = self.buffered()
+                self.buf[:count] = self.buf[self.start:self.end]
+                self.start = 0
+                self.end = count
+            room = len(self.buf) - self.end
+            data = self.read(min(room, max(needed, self.available())))
+            if not data:
+                return False
+            self.buf[self.end:self.end + len(data)] = data
+            self.end += len(data)
+        return True
+
+    def read_frame(self, extended=False):
+        """read the next frame
+
+        Args:
+            extended (bool, optional): whether the peer may send extended
+                frames
+
+        Returns:
+            memoryview: payload of the frame, valid until the next call.
+                Shorter than its header says, and truncated set, if the
+                link timed out mid-frame. None if the link timed out before
+                the header.
+        """
+        self.truncated = False
+        if not self.fill(1):
+            return None
+        length = self.buf[self.start]
+        header = 1
+        if extended and length == EXTENDED:
+            header = 3
+            if not self.fill(header):
+                self.truncated = True
+                self.reset()
+                return self.view[0:0]
+            length = self.buf[self.start + 1] | self.buf[self.start + 2] << 8
+        if not self.fill(header + length):
+            frame = self.view[self.start + header:self.end]
+            self.truncated = True
+            self.reset()
+            return frame
+        frame = self.view[self.start + header:self.start + header + length]
+        self.start += header + length
+        if self.start == self.end:
+            self.reset()
+        return frame
+
+    def read_frame_v2(self):
+        """read the next version 2 frame
+
+        Bytes up to the next plausible frame header are skipped.
+
+        Returns:
+            tuple: (kind, seq, payload) where payload is a memoryview valid
+                until the next call. kind is None if the frame was corrupt.
+            None if the link timed out before a frame started.
+        """
+        self.truncated = False
+        header = 1 + V2_HEADER.size
+        while True:
+            if not self.fill(1):
+                return None
+            if self.buf[self.start] != V2_MAGIC:
+                self.start += 1
+                continue
+            if not self.fill(header):
+                self.truncated = True
+                self.reset()
+                return None, None, self.view[0:0]
+            kind, seq, length = V2_HEADER.unpack_from(self.buf, self.start + 1)
+            if kind in (DATA, NAK) and length <= V2_MAX_PAYLOAD:
+                break
+            # Not a frame start; look for the next one
+            self.start += 1
+        size = header + length + V2_CRC.size
+        if not self.fill(size):
+            self.truncated = True
+            self.reset()
+            return None, None, self.view[0:0]
+        end = self.start + size
+        crc, = V2_CRC.unpack_from(self.buf, end - V2_CRC.size)
+        if crc != crc16(self.view[self.start + 1:end - V2_CRC.size]):
+            self.start = end
+            if self.start == self.end:
+                self.reset()
+            return None, None, self.view[0:0]
+        frame = self.view[self.start + header:end - V2_CRC.size]
+        self.start = end
+        if self.start == self.end:
+            self.reset()
+        return kind, seq, frame
@@ -0,0 +1,260 @@
+"""Serial device hotplug events for Card and HSM
+
+One HotplugMonitor thread watches for serial ports coming and going and
+publishes a HotplugEvent to every subscriber queue. On Linux it sleeps on
+inotify watches of /dev and /dev/serial/by-id and only lists serial ports
+when one of those directories changes, so it costs nothing while idle and
+reports a new device as soon as its node appears. Elsewhere, or if inotify
+is unavailable, it lists serial ports every poll_interval seconds.
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import threading
+from Queue import Queue
+from serial.tools.list_ports import comports
+
+CONNECTED = 'connected'
+DISCONNECTED = 'disconnected'
+
+# kind is CONNECTED or DISCONNECTED, port is the serial device path
+HotplugEvent = collections.namedtuple('HotplugEvent', ['kind', 'port'])
+
+
+def list_serial_ports():
+    """device paths of every serial port present"""
+    return set(port_info.device for port_info in comports())
+
+
+class Inotify(object):
+    """Minimal inotify binding watching directories for entries coming and
+    going
+
+    Args:
+        paths (list of str): directories to watch; missing ones are added
+            by watch_missing once they appear
+
+    Raises:
+        OSError: if inotify is unavailable
+    """
+    IN_ATTRIB = 0x004
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    MASK = IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, paths):
+        libc_name = ctypes.util.find_library('c')
+        if libc_name is None:
+            raise OSError(errno.ENOSYS, 'libc not found')
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, 'inotify_init'):
+            raise OSError(errno.ENOSYS, 'inotify not supported')
+        self.fd = self.libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        self.paths = list(paths)
+        self.watched = set()
+        # Written to by interrupt to wake wait early
+        self.wake_r, self.wake_w = os.pipe()
+        self.watch_missing()
+
+    def watch_missing(self):
+        """add watches for directories that did not exist before"""
+        for path in self.paths:
+            if path in self.watched or not os.path.isdir(path):
+                continue
+            if self.libc.inotify_add_watch(self.fd, path, self.MASK) >= 0:
+                self.watched.add(path)
+
+    def wait(self, timeout=None):
+        """block until a watched directory changes
+
+        Args:
+            timeout (float, optional): most seconds to wait, forever if None
+
+        Returns:
+            bool: True if something changed, False on timeout or interrupt
+        """
+        readable, _, _ = select.select([self.fd, self.wake_r], [], [], timeout)
+        if self.wake_r in readable:
+            os.read(self.wake_r, 512)
+            return False
+        if not readable:
+            return False
+        os.read(self.fd, 65536)
+        self.watch_missing()
+        return True
+
+    def interrupt(self):
+        """wake a thread blocked in wait"""
+        os.write(self.wake_w, 'x')
+
+    def close(self):
+        for fd in (self.fd, self.wake_r, self.wake_w):
+            os.close(fd)
+
+
+class HotplugMonitor(object):
+    """Publishes serial port connect and disconnect events
+
+    Args:
+        paths (list of str, optional): directories whose changes mean serial
+            ports may have come or gone
+        list_ports (function, optional): returns the set of serial ports
+            present
+        poll_interval (float, optional): seconds between port listings when
+            inotify is unavailable
+        use_inotify (bool, optional): set False to always poll
+    """
+    # inotify errors in a row before falling back to polling
+    MAX_INOTIFY_FAILURES = 3
+
+    def __init__(self, paths=('/dev', '/dev/serial/by-id'), list_ports=list_serial_ports,
+                 poll_interval=.25, use_inotify=True):
+        self.list_ports = list_ports
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.claimed = set()
+        self.inotify = None
+        self.stopped = threading.Event()
+        if use_inotify:
+            try:
+                self.inotify = Inotify(paths)
+            except (OSError, AttributeError) as err:
+                logging.info('HOTPLUG: inotify unavailable (%s), polling serial ports', err)
+        self.ports = self.list_ports()
+        self.thread = threading.Thread(target=self.run, name='hotplug-monitor')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def subscribe(self):
+        """start receiving events
+
+        Returns:
+            Queue: receives a HotplugEvent for every port change from now on
+        """
+        events = Queue()
+        with self.lock:
+            self.subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        """stop delivering events to a queue returned by subscribe"""
+        with self.lock:
+            if events in self.subscribers:
+                self.subscribers.remove(events)
+
+    def claim(self, port):
+        """claim port so no other subscriber opens it
+
+        Returns:
+            bool: True if port was not claimed already
+        """
+        with self.lock:
+            if port in self.claimed:
+                return False
+            self.claimed.add(port)
+            return True
+
+    def release(self, port, offer=False):
+        """give up a claimed port
+
+        Args:
+            port (str): port passed to claim
+            offer (bool, optional): announce port as connected again, for a
+                subscriber that opened a device that was meant for another
+        """
+        with self.lock:
+            self.claimed.discard(port)
+            still_present = port in self.ports
+        if offer and still_present:
+            self.publish(HotplugEvent(CONNECTED, port))
+
+    def publish(self, event):
+        """deliver event to every subscriber"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for events in subscribers:
+            events.put(event)
+
+    def close(self):
+        """stop watching and wait for the monitor thread to exit"""
+        self.stopped.set()
+        inotify = self.inotify
+        if inotify is not None:
+            try:
+                inotify.interrupt()
+            except OSError:
+                # The thread closed it when falling back to polling
+                inotify = None
+        self.thread.join()
+        if inotify is not None:
+            inotify.close()
+            self.inotify = None
+
+    def run(self):
+        """wait for port changes and publish them until closed
+
+        Errors are logged and the loop carries on, since no PSoC would ever
+        be found again without it. If inotify keeps failing, ports are
+        polled instead.
+        """
+        inotify_failures = 0
+        while not self.stopped.is_set():
+            if self.inotify is not None:
+                try:
+                    if not self.inotify.wait():
+                        continue
+                    inotify_failures = 0
+                except Exception:
+                    logging.exception('HOTPLUG: inotify wait failed')
+                    inotify_failures += 1
+                    if inotify_failures >= self.MAX_INOTIFY_FAILURES:
+                        logging.info('HOTPLUG: inotify keeps failing, polling serial ports')
+                        failed, self.inotify = self.inotify, None
+                        failed.close()
+                    self.stopped.wait(self.poll_interval)
+            else:
+                self.stopped.wait(self.poll_interval)
+            if self.stopped.is_set():
+                break
+            try:
+                self.scan()
+            except Exception:
+                logging.exception('HOTPLUG: listing serial ports failed')
+
+    def scan(self):
+        """list ports and publish what changed since the last scan"""
+        ports = self.list_ports()
+        with self.lock:
+            added = ports - self.ports
+            removed = self.ports - ports
+            self.ports = ports
+            self.claimed -= removed
+        for port in sorted(removed):
+            logging.info('HOTPLUG: %s disconnected', port)
+            self.publish(HotplugEvent(DISCONNECTED, port))
+        for port in sorted(added):
+            logging.info('HOTPLUG: %s connected', port)
+            self.publish(HotplugEvent(CONNECTED, port))
+
+
+monitor_lock = threading.Lock()
+monitor = None
+
+
+def default_monitor():
+    """HotplugMonitor shared by every Psoc, started on first use"""
+    global monitor
+    with monitor_lock:
+        if monitor is None:
+            monitor = HotplugMonitor()
+        return monitor
@@ -2,7 +2,6 @@ from psoc import Psoc
 import struct
 from serial_emulator import HSMEmulator
 import logging
-import time
 
 
 class HSM(Psoc):
@@ -11,22 +10,38 @@ class HSM(Psoc):
     Args:
         port (str, optional): Serial port connected to HSM
         verbose (bool, optional): Whether to print debug messages
+        pacing (Pacing, optional): Spacing of frames sent to the HSM
+        window (int, optional): Most bills sent ahead of the HSM's acks
+            during provisioning
+        deadlines (Deadlines, optional): How long to wait for the HSM
+        latency (LatencyStats, optional): Where to record how long syncs take
 
     Note:
         Calls to get_uuid and withdraw must be alternated to remain in sync
         with the HSM
     """
-
-    def __init__(self, port=None, verbose=False, dummy=False):
+    # Flag after the bill count asking for batched bills
+    BATCH_FLAG = 'B'
+    # Flag after the bill count asking for windowed provisioning
+    WINDOW_FLAG = 'W'
+    # Rewinds in a row without progress before provisioning gives up
+    MAX_REWINDS = 8
+
+    def __init__(self, port=None, verbose=False, dummy=False, pacing=None, window=8,
+                 deadlines=None, latency=None):
         self.port = port
         self.verbose = verbose
         self.dummy = dummy
+        self.pacing = pacing
+        self.window = window
+        self.deadlines = deadlines
+        self.latency = latency
 
     def initialize(self):
-        super(HSM, self).__init__('HSM', self.port, self.verbose)
+        super(HSM, self).__init__('HSM', self.port, self.verbose, self.pacing,
+                                  deadlines=self.deadlines, latency=self.latency)
         self._vp('Please connect HSM to continue.')
-        while not self.connected and not self.dummy:
-            time.sleep(2)
+        self.wait_for_insert()
         self._vp('Initialized')
 
     def _authenticate(self, uuid):
@@ -38,11 +53,11 @@ class HSM(Psoc):
         Returns:
             bool: True if HSM verified authentication, False otherwise
         """
-        self._vp('Sending UUID %s' % uuid)
+        self._vp('Sending UUID %s', uuid)
         self._push_msg('%s\00' % uuid)
 
         resp = self._pull_msg()
-        self._vp('Received response %s from HSM' % resp)
+        self._vp('Received response %s from HSM', resp)
 
         return resp == 'K'
 
@@ -56,13 +71,22 @@ class HSM(Psoc):
         uuid = self._pull_msg()
 
         if uuid == 'P':
-            self._vp('Security module not yet provisioned!', logging.error)
+            self._vp('Security module not yet provisioned!', stream=logging.error)
             return None
 
-        self._vp('Got UUID %s' % uuid)
+        self._vp('Got UUID %s', uuid)
 
         return uuid
 
+    def cancel(self):
+        """Ends a withdrawal started by get_uuid without dispensing any
+        bills, leaving the HSM ready for the next operation"""
+        self._vp('Cancelling withdrawal')
+        self._push_msg('\00')
+        resp = self._pull_msg()
+        self._vp('Received response %s from HSM', resp)
+        self._op_done()
+
     def withdraw(self, uuid, amount):
         """Attempts to withdraw bills from the HSM
 
@@ -77,23 +101,59 @@ class HSM(Psoc):
                     to complete request
         """
         if not self._authenticate(uuid):
+            self._op_done()
             return 'Insufficient funds'
 
-        msg = struct.pack('B', amount)
+        # B asks for bills batched into as few frames as possible
+        msg = struct.pack('Bc', amount, self.BATCH_FLAG)
         self._push_msg(msg)
 
-        msg = self._pull_msg()
-        self._vp('Secmod replied %s' % msg)
+        msg, _, flags = self._pull_msg().partition('\00')
+        self._vp('Secmod replied %s', msg)
         if msg == 'BAD':
+            self._op_done()
             return 'Not enough bills in ATM'
 
-        bills = []
-        for i in range(amount):
-            bill = self._pull_msg()
-            self._vp('Received bill %d/%d: \'%s\'' % (i + 1, amount, bill))
+        if flags == self.BATCH_FLAG:
+            bills = self._pull_batches(amount)
+        else:
+            bills = []
+            for i in range(amount):
+                bill = self._pull_msg()
+                self._vp('Received bill %d/%d: \'%s\'', i + 1, amount, bill)
+
+                bills.append(bill)
+
+        self._op_done()
+        return bills
+
+    def _pull_batches(self, amount):
+        """Pulls bills packed into batch frames
 
-            bills.append(bill)
+        Each batch frame holds one or more bills, each preceded by its 1B
+        length, and may be an extended frame.
+
+        Args:
+            amount (int): Number of bills to pull
 
+        Returns:
+            list of str: Received bills
+        """
+        bills = []
+        while len(bills) < amount:
+            pkt = self._pull_view(extended=True)
+            if not len(pkt):
+                self.clean = False
+                break
+            i = 0
+            while i < len(pkt):
+                end = i + 1 + ord(pkt[i])
+                if end > len(pkt):
+                    self.clean = False
+                    break
+                bills.append(pkt[i + 1:end].tobytes())
+                i = end
+            self._vp('Received %d/%d bills', len(bills), amount)
         return bills
 
     def provision(self, uuid, bills):
@@ -110,33 +170,87 @@ class HSM(Psoc):
 
         msg = self._pull_msg()
         if msg != 'P':
-            self._vp('HSM already provisioned!', logging.error)
+            self._vp('HSM already provisioned!', stream=logging.error)
             return False
         self._vp('HSM sent provisioning message')
 
         self._push_msg('%s\00' % uuid)
-        while self._pull_msg() != 'K':
-            self._vp('HSM hasn\'t accepted UUID \'%s\'' % uuid, logging.error)
-        self._vp('HSM accepted UUID \'%s\'' % uuid)
-
-        self._push_msg(struct.pack('B', len(bills)))
-        while self._pull_msg() != 'K':
-            self._vp('HSM hasn\'t accepted number of bills', logging.error)
+        self._expect('K', 'HSM hasn\'t accepted UUID \'%s\'' % uuid,
+                     self.deadlines.provision_timeout)
+        self._vp('HSM accepted UUID \'%s\'', uuid)
+
+        # W asks to send bills ahead of the HSM's acks
+        self._push_msg(struct.pack('Bc', len(bills), self.WINDOW_FLAG))
+        msg = self._expect(('K', 'K\00' + self.WINDOW_FLAG), 'HSM hasn\'t accepted number of bills',
+                           self.deadlines.provision_timeout)
+        flags = msg.partition('\00')[2]
         self._vp('HSM accepted number of bills')
 
+        if flags == self.WINDOW_FLAG:
+            return self._provision_windowed(bills)
+
         for bill in bills:
             msg = bill.strip()
-            self._vp('Sending bill \'%s\'' % msg.encode('hex'))
+            self._vp('Sending bill \'%s\'', msg.encode('hex'))
             self._push_msg(msg)
 
-            while self._pull_msg() != 'K':
-                self._vp('HSM hasn\'t accepted bill', logging.error)
+            self._expect('K', 'HSM hasn\'t accepted bill', self.deadlines.provision_timeout)
             self._vp('HSM accepted bill')
 
         self._vp('All bills sent! Provisioning complete!')
 
         return True
 
+    def _provision_windowed(self, bills):
+        """Sends bills to an HSM in windowed provisioning mode
+
+        Each bill is sent as its 1B index followed by the bill, with up to
+        self.window bills awaiting acks. The HSM answers each bill it stores,
+        or already stored, with 'K' followed by the 1B number of bills it has
+        stored. The first bill after one went missing is answered with 'R'
+        and the same number instead, and later bills are dropped until the
+        missing one arrives. Bills are resent from that number on an 'R' or
+        when acks stop coming.
+
+        Args:
+            bills (list of str): List of bills to store in HSM
+
+        Returns:
+            bool: True if HSM stored every bill, False otherwise
+        """
+        acked = 0
+        sent = 0
+        stalled = 0
+        while acked < len(bills):
+            while sent < len(bills) and sent - acked < self.window:
+                self._push_msg(struct.pack('B', sent) + bills[sent].strip())
+                sent += 1
+
+            resp = self._pull_view()
+            if len(resp) == 2 and resp[0] in 'KR':
+                stored = ord(resp[1])
+                if stored > acked:
+                    acked = min(stored, sent)
+                    stalled = 0
+                    self._vp('HSM accepted %d/%d bills', acked, len(bills))
+                if resp[0] == 'K':
+                    continue
+                self._vp('HSM missed bill %d, resending', acked, stream=logging.error)
+            else:
+                # Acks for bills still in flight may turn up later
+                self._vp('HSM did not ack bill %d, resending', acked, stream=logging.error)
+                self.clean = False
+
+            stalled += 1
+            if stalled > self.MAX_REWINDS:
+                self._vp('HSM stopped accepting bills!', stream=logging.error)
+                return False
+            sent = acked
+
+        self._vp('All bills sent! Provisioning complete!')
+
+        return True
+
 
 class DummyHSM(HSM):
     """Emulated HSM for testing
@@ -145,7 +259,14 @@ class DummyHSM(HSM):
         verbose (bool, optional): Whether to print debug messages
         provision (bool, optional): Whether to start the HSM ready
             for provisioning
+        pacing (Pacing, optional): Spacing of frames sent to the HSM
+        window (int, optional): Most bills sent ahead of the HSM's acks
+            during provisioning
+        deadlines (Deadlines, optional): How long to wait for the HSM
+        latency (LatencyStats, optional): Where to record how long syncs take
     """
-    def __init__(self, verbose=False, provision=False):
+    def __init__(self, verbose=False, provision=False, pacing=None, window=8, deadlines=None,
+                 latency=None):
         ser = HSMEmulator(verbose=verbose, provision=provision)
-        super(DummyHSM, self).__init__(port=ser, verbose=verbose, dummy=True)
+        super(DummyHSM, self).__init__(port=ser, verbose=verbose, dummy=True, pacing=pacing,
+                                       window=window, deadlines=deadlines, latency=latency)
@@ -0,0 +1,187 @@
+"""Per-phase latency of ATM transactions
+
+LatencyStats keeps the most recent durations of each named phase, such as
+the card sync or the bank round trip of a withdrawal, and summarizes them as
+percentiles for the stats XML-RPC method. Durations come from the monotonic
+clock, so they stay right when the wall clock is adjusted. When disabled,
+span hands out one shared no-op span, so instrumented code only pays for a
+method call.
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import functools
+import math
+import sys
+import threading
+import time
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+# CLOCK_MONOTONIC differs between platforms' headers
+_CLOCK_MONOTONIC = {'linux': 1, 'darwin': 6, 'freebsd': 4}
+
+
+def _monotonic_clock(platform=sys.platform):
+    """monotonic clock from clock_gettime, or time.time if unavailable
+
+    The clock is read once here, so a platform whose clock_gettime doesn't
+    take the id we picked falls back to time.time instead of failing later.
+    """
+    clock_id = None
+    for prefix, number in _CLOCK_MONOTONIC.items():
+        if platform.startswith(prefix):
+            clock_id = number
+    if clock_id is None:
+        return time.time
+    for name in ('c', 'rt'):
+        lib_name = ctypes.util.find_library(name)
+        if lib_name is None:
+            continue
+        try:
+            lib = ctypes.CDLL(lib_name, use_errno=True)
+        except OSError:
+            continue
+        if not hasattr(lib, 'clock_gettime'):
+            continue
+        clock_gettime = lib.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+
+        def monotonic():
+            spec = _Timespec()
+            if clock_gettime(clock_id, ctypes.byref(spec)) != 0:
+                raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+            return spec.tv_sec + spec.tv_nsec * 1e-9
+        try:
+            monotonic()
+        except OSError:
+            continue
+        return monotonic
+    return time.time
+
+
+# seconds from an arbitrary start that never goes backwards
+monotonic = _monotonic_clock()
+
+
+class _Span(object):
+    """Records how long its with block took under phase
+
+    A failure to time the block is never raised into it; the sample is
+    just left out.
+    """
+    __slots__ = ('stats', 'phase', 'start')
+
+    def __init__(self, stats, phase):
+        self.stats = stats
+        self.phase = phase
+        self.start = None
+
+    def __enter__(self):
+        try:
+            self.start = monotonic()
+        except Exception:
+            self.start = None
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.start is None:
+            return
+        try:
+            self.stats.record(self.phase, monotonic() - self.start)
+        except Exception:
+            pass
+
+
+class _NullSpan(object):
+    """Span that records nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class LatencyStats(object):
+    """Rolling latency samples of named phases
+
+    Args:
+        enabled (bool, optional): Whether to record anything
+        window (int, optional): Most recent samples kept for each phase
+    """
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self, enabled=True, window=1000):
+        self.enabled = enabled
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """create LatencyStats from the latency section of config.yaml
+
+        Args:
+            config (dict or None): latency configuration, defaults if None
+        """
+        config = config or {}
+        return cls(enabled=bool(config.get('enabled', True)),
+                   window=int(config.get('window', 1000)))
+
+    def span(self, phase):
+        """time a with block as one sample of phase
+
+        Example:
+            with stats.span('withdraw.bank'):
+                bank.withdraw(hsm_id, card_id, amount)
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, phase)
+
+    def record(self, phase, seconds):
+        """add a sample of seconds to phase"""
+        with self.lock:
+            samples = self.samples.get(phase)
+            if samples is None:
+                samples = self.samples[phase] = collections.deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def summary(self):
+        """Percentiles of every phase sampled so far
+
+        Returns:
+            dict: for each phase, a dict of the number of samples kept as
+                'count' and the p50, p95, p99 and max latency in
+                milliseconds
+        """
+        with self.lock:
+            phases = dict((phase, sorted(samples)) for phase, samples in self.samples.items())
+        summary = {}
+        for phase, samples in phases.items():
+            stats = {'count': len(samples), 'max': samples[-1] * 1000}
+            for percentile in self.PERCENTILES:
+                rank = int(math.ceil(percentile / 100.0 * len(samples))) - 1
+                stats['p%d' % percentile] = samples[max(rank, 0)] * 1000
+            summary[phase] = stats
+        return summary
+
+
+def timed(phase):
+    """Decorates a method to record each call in self.latency under phase"""
+    def decorate(method):
+        @functools.wraps(method)
+        def timed_method(self, *args, **kwargs):
+            with self.latency.span(phase):
+                return method(self, *args, **kwargs)
+        return timed_method
+    return decorate
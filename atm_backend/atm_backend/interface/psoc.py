@@ -5,7 +5,11 @@ import threading
 import serial
 import sys
 import os
-from serial.tools.list_ports import comports as list_ports
+import collections
+import framing
+from framing import FrameReader
+from latency import LatencyStats
+import hotplug
 
 
 class DeviceRemoved(Exception):
@@ -20,45 +24,231 @@ class AlreadyProvisioned(Exception):
     pass
 
 
+class DeviceTimeout(Exception):
+    """The PSoC did not give the expected reply before its deadline or
+    within its retry budget"""
+    pass
+
+
+class Pacing(object):
+    """Decides when the next frame may be sent to a PSoC
+
+    In 'ack' mode a frame goes out as soon as the PSoC has answered the
+    previous one, since a PSoC that answered is waiting for its next input.
+    Only a frame following one the PSoC did not answer (e.g. GO followed by
+    the PIN) waits, for gap seconds after the previous frame. The gap starts
+    at min_gap, doubles up to max_gap every time the PSoC sends a garbled
+    header, and shrinks back towards min_gap with every clean frame.
+
+    In 'fixed' mode every frame is followed by a sleep of delay seconds, for
+    PSoC firmware that cannot keep up otherwise.
+
+    Args:
+        mode (str, optional): 'ack' or 'fixed'
+        min_gap (float, optional): smallest gap between unanswered frames
+        max_gap (float, optional): largest gap between unanswered frames
+        delay (float, optional): sleep after every frame in 'fixed' mode
+    """
+
+    def __init__(self, mode='ack', min_gap=0.002, max_gap=0.1, delay=0.1):
+        if mode not in ('ack', 'fixed'):
+            raise ValueError('unknown pacing mode %r' % mode)
+        self.mode = mode
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.delay = delay
+        self.gap = min_gap
+        self.last_push = 0
+        self.unanswered = False
+
+    @classmethod
+    def from_config(cls, config):
+        """create Pacing from the serial section of config.yaml
+
+        Args:
+            config (dict or None): serial configuration, defaults if None
+        """
+        config = config or {}
+        return cls(mode=config.get('pacing', 'ack'),
+                   min_gap=float(config.get('min_frame_gap', 0.002)),
+                   max_gap=float(config.get('max_frame_gap', 0.1)),
+                   delay=float(config.get('frame_delay', 0.1)))
+
+    def before_push(self):
+        """wait until the next frame may be sent"""
+        if self.mode == 'ack' and self.unanswered:
+            wait = self.last_push + self.gap - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+    def after_push(self):
+        """note that a frame was sent"""
+        if self.mode == 'fixed':
+            time.sleep(self.delay)
+            return
+        self.last_push = time.time()
+        self.unanswered = True
+
+    def after_pull(self, clean):
+        """note that a frame was received
+
+        Args:
+            clean (bool): whether the frame header was valid
+        """
+        self.unanswered = False
+        if clean:
+            self.gap = max(self.min_gap, self.gap * 0.75)
+        else:
+            self.gap = min(self.max_gap, max(self.gap * 2, self.min_gap, 0.001))
+
+
+class Deadlines(object):
+    """Deadlines and retry budgets for replies from a PSoC
+
+    A reply that is not the expected one, or that does not arrive within
+    the serial timeout, is retried after a pause that starts at
+    min_backoff and doubles up to max_backoff, until either retries replies
+    went wrong or the deadline passed.
+
+    Args:
+        reply_timeout (float, optional): seconds to wait for an expected
+            reply during normal operation
+        sync_timeout (float, optional): seconds a sync may take
+        provision_timeout (float, optional): seconds to wait for each
+            expected reply while provisioning, which writes to EEPROM
+        retries (int, optional): wrong or missing replies tolerated while
+            waiting for one
+        min_backoff (float, optional): first pause between retries
+        max_backoff (float, optional): largest pause between retries
+    """
+
+    def __init__(self, reply_timeout=5.0, sync_timeout=10.0, provision_timeout=30.0,
+                 retries=8, min_backoff=0.01, max_backoff=0.5):
+        self.reply_timeout = reply_timeout
+        self.sync_timeout = sync_timeout
+        self.provision_timeout = provision_timeout
+        self.retries = retries
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+    @classmethod
+    def from_config(cls, config):
+        """create Deadlines from the serial section of config.yaml
+
+        Args:
+            config (dict or None): serial configuration, defaults if None
+        """
+        config = config or {}
+        return cls(reply_timeout=float(config.get('reply_timeout', 5.0)),
+                   sync_timeout=float(config.get('sync_timeout', 10.0)),
+                   provision_timeout=float(config.get('provision_timeout', 30.0)),
+                   retries=int(config.get('reply_retries', 8)),
+                   min_backoff=float(config.get('min_backoff', 0.01)),
+                   max_backoff=float(config.get('max_backoff', 0.5)))
+
+    def backoff(self, attempt):
+        """seconds to pause before retry number attempt, counting from 0"""
+        return min(self.min_backoff * 2 ** attempt, self.max_backoff)
+
+
 class Psoc(object):
     """Generic PSoC communication interface
 
     Args:
         name (str): Name of the PSoC for debugging
-        ser (serial.Serial or serial emulator): Serial interface for
-            communication
+        ser (serial.Serial or serial emulator or str): Serial interface for
+            communication, or the path of a serial port to open, such as a
+            PtyEmulator's. None acquires PSoCs as they are plugged in
         verbose (bool): Controls printing of debug messages
+        pacing (Pacing, optional): Spacing of frames sent to the PSoC.
+            Defaults to Pacing()
+        monitor (HotplugMonitor, optional): Source of serial hotplug events.
+            Defaults to the monitor shared by every Psoc
+        deadlines (Deadlines, optional): How long to wait for replies.
+            Defaults to Deadlines()
+        latency (LatencyStats, optional): Where to record how long syncs
+            take. Default records nothing
     """
+    # Version 2 frames kept to send again, and times a missing frame is
+    # asked for before giving up
+    V2_HISTORY = 16
+    V2_RETRIES = 4
 
-    def __init__(self, name, ser, verbose):
+    def __init__(self, name, ser, verbose, pacing=None, monitor=None, deadlines=None,
+                 latency=None):
         log = sys.stdout if verbose else open(os.devnull, 'w')
         logging.basicConfig(stream=log, level=logging.DEBUG)
         self.ser = ser
         self.verbose = verbose
+        self.pacing = pacing or Pacing()
+        self.deadlines = deadlines or Deadlines()
+        self.latency = latency or LatencyStats(enabled=False)
+        self.reader = FrameReader(self.read, self.available)
         self.fmt = '%s: %%s' % name
         self.name = name
         self.lock = threading.Lock()
+        # Set while a PSoC is connected, so waiters wake as it connects
+        self.plugged = threading.Event()
         self.connected = False
         self.port = ''
         self.baudrate = 115200
-        self.old_ports = [port_info.device for port_info in list_ports()]
+        self.monitor = monitor
+        self.events = None
+
+        # Sync name the PSoC is waiting for GO under, None if unknown
+        self.synced = None
+        # Whether the PSoC keeps a session between operations
+        self.resumable = False
+        # Whether every frame of the current operation arrived intact
+        self.clean = False
+        # Frame version agreed at the last sync, and the one in use, which
+        # is always 1 during a sync
+        self.frame_version = 1
+        self.framing = 1
+        self.tx_seq = 0
+        self.rx_seq = 0
+        # Version 2 frames sent recently, by seq, in case the PSoC asks for
+        # one again
+        self.sent = {}
+        self.sent_order = collections.deque()
+        # Version 2 frames that arrived ahead of a missing one, by seq
+        self.early = {}
         self.sync_name_n = '%s_N' % name
         self.sync_name_p = '%s_P' % name
 
-        if ser:
+        if isinstance(ser, basestring):
+            # A fixed serial port, such as a PtyEmulator's
+            self.ser = None
+            self.port = ser
+            self.open()
+        elif ser:
             self.connected = True
         else:
             self.start_connect_watcher()
 
-    def _vp(self, msg, stream=logging.info):
+    @property
+    def connected(self):
+        """Whether a PSoC is connected and synced"""
+        return self.plugged.is_set()
+
+    @connected.setter
+    def connected(self, value):
+        if value:
+            self.plugged.set()
+        else:
+            self.plugged.clear()
+
+    def _vp(self, msg, *args, **kwargs):
         """Prints message if verbose was set
 
         Args:
-            msg (str): message to print
+            msg (str): message to print, %-formatted with args only once it
+                is written out
+            *args: arguments for msg
             stream (logging function, optional): logging function to call
         """
         if self.verbose:
-            stream(self.fmt % msg)
+            kwargs.get('stream', logging.info)(self.fmt % msg, *args)
 
     def _push_msg(self, msg):
         """Sends formatted message to PSoC
@@ -66,9 +256,21 @@ class Psoc(object):
         Args:
             msg (str): message to be sent to the PSoC
         """
-        pkt = struct.pack("B%ds" % (len(msg)), len(msg), msg)
+        if self.framing == 2:
+            pkt = framing.pack_v2(framing.DATA, self.tx_seq, msg)
+            self.sent[self.tx_seq] = pkt
+            self.sent_order.append(self.tx_seq)
+            if len(self.sent_order) > self.V2_HISTORY:
+                del self.sent[self.sent_order.popleft()]
+            self.tx_seq = (self.tx_seq + 1) % 256
+        else:
+            pkt = struct.pack("B%ds" % (len(msg)), len(msg), msg)
+        self._push_frame(pkt)
+
+    def _push_frame(self, pkt):
+        self.pacing.before_push()
         self.write(pkt)
-        time.sleep(0.1)
+        self.pacing.after_push()
 
     def _pull_msg(self):
         """Pulls message form the PSoC
@@ -76,25 +278,175 @@ class Psoc(object):
         Returns:
             string with message from PSoC
         """
-        hdr = self.read(1)
-        if len(hdr) != 1:
-            self._vp("RECEIVED BAD HEADER: \'%s\'" % hdr, logging.error)
-            return ''
-        pkt_len = struct.unpack('B', hdr)[0]
-        return self.read(pkt_len)
+        return self._pull_view().tobytes()
+
+    def _pull_view(self, extended=False):
+        """Pulls message from the PSoC without copying it
+
+        Args:
+            extended (bool, optional): whether the PSoC may send an extended
+                length frame
+
+        Returns:
+            memoryview of the message from the PSoC, valid until the next
+            message is pulled
+        """
+        if self.framing == 2:
+            return self._pull_view_v2()
+        pkt = self.reader.read_frame(extended)
+        if pkt is None:
+            self._vp("RECEIVED BAD HEADER: \'\'", stream=logging.error)
+            self.pacing.after_pull(False)
+            self.clean = False
+            return memoryview('')
+        self.pacing.after_pull(not self.reader.truncated)
+        if self.reader.truncated:
+            self.clean = False
+        return pkt
+
+    def _pull_view_v2(self):
+        """Pulls the next version 2 data frame from the PSoC
+
+        A corrupt frame, or none arriving in time, is asked for again with a
+        NAK, and the last frame sent is repeated in case it never arrived.
+        Frames that overtake a missing one are held until it arrives. Frames
+        the PSoC asks for are sent again.
+
+        Returns:
+            memoryview of the message from the PSoC, valid until the next
+            message is pulled
+        """
+        attempts = 0
+        nacked = None
+        while attempts < self.V2_RETRIES:
+            if self.rx_seq in self.early:
+                pkt = memoryview(self.early.pop(self.rx_seq))
+                self.rx_seq = (self.rx_seq + 1) % 256
+                return pkt
+
+            res = self.reader.read_frame_v2()
+            kind, seq, pkt = res if res else (None, None, None)
+            if kind == framing.DATA:
+                self.pacing.after_pull(True)
+                ahead = (seq - self.rx_seq) % 256
+                if ahead == 0:
+                    self.rx_seq = (self.rx_seq + 1) % 256
+                    return pkt
+                if ahead < 128:
+                    self._vp('Frame %d arrived before %d', seq, self.rx_seq)
+                    self.early[seq] = pkt.tobytes()
+                    if nacked != self.rx_seq:
+                        nacked = self.rx_seq
+                        self._push_frame(framing.pack_v2(framing.NAK, self.rx_seq))
+                continue
+            if kind == framing.NAK:
+                if seq in self.sent:
+                    self._vp('Resending frame %d', seq)
+                    self._push_frame(self.sent[seq])
+                continue
+
+            attempts += 1
+            self.pacing.after_pull(False)
+            if res is None:
+                self._vp('Frame %d timed out', self.rx_seq, stream=logging.error)
+                if self.sent_order:
+                    self._push_frame(self.sent[self.sent_order[-1]])
+            else:
+                self._vp('Frame %d corrupt', self.rx_seq, stream=logging.error)
+            nacked = self.rx_seq
+            self._push_frame(framing.pack_v2(framing.NAK, self.rx_seq))
+
+        self._vp('Gave up on frame %d', self.rx_seq, stream=logging.error)
+        self.clean = False
+        return memoryview('')
+
+    def _expect(self, want, what, timeout=None):
+        """Pulls messages from the PSoC until the expected one arrives
+
+        Args:
+            want (str or tuple of str): expected message, or any of several
+            what (str): what the message acknowledges, for errors
+            timeout (float, optional): seconds to wait, defaults to
+                self.deadlines.reply_timeout
+
+        Returns:
+            str: the expected message that arrived
+
+        Raises:
+            DeviceTimeout: if it did not arrive in time or within the retry
+                budget
+        """
+        wants = want if isinstance(want, tuple) else (want,)
+        deadline = time.time() + (timeout or self.deadlines.reply_timeout)
+        attempt = 0
+        while True:
+            msg = self._pull_msg()
+            if msg in wants:
+                return msg
+            self._vp('%s, got \'%s\'', what, msg, stream=logging.error)
+            self._retry_wait(attempt, deadline, what, self.deadlines.retries)
+            attempt += 1
+
+    def _retry_wait(self, attempt, deadline, what, retries=None):
+        """Pauses before retry number attempt, counting from 0
+
+        Args:
+            retries (int, optional): retry budget, unlimited if None
+
+        Raises:
+            DeviceTimeout: if the retry budget is spent or the pause would
+                run past deadline
+        """
+        pause = self.deadlines.backoff(attempt)
+        spent = retries is not None and attempt + 1 >= retries
+        if spent or time.time() + pause > deadline:
+            self.clean = False
+            self.synced = None
+            self._vp('Gave up waiting: %s', what, stream=logging.error)
+            raise DeviceTimeout('%s: %s' % (self.name, what))
+        time.sleep(pause)
 
     def _sync_once(self, names):
+        """Sends READY until the PSoC answers with one of names
+
+        Returns:
+            str: name the PSoC answered with, or False if it answered in the
+                other of provisioning and normal mode when only one name was
+                wanted
+
+        Raises:
+            DeviceTimeout: if no wanted name arrived within
+                self.deadlines.sync_timeout. A PSoC still booting may miss
+                many READYs, so only the deadline bounds the retries
+        """
+        self.synced = None
+        # Syncs always use legacy frames
+        self.framing = 1
+        deadline = time.time() + self.deadlines.sync_timeout
+        attempt = 0
         resp = ''
         while resp not in names:
+            if attempt:
+                self._retry_wait(attempt - 1, deadline, 'sync')
+            attempt += 1
             self._vp('Sending ready message')
-            self._push_msg("READY\00")
-            resp = self._pull_msg()
-            self._vp('Got response \'%s\', want something from \'%s\'' % (resp, str(names)))
+            # After the NUL, S asks the PSoC to keep a session and V to use
+            # version 2 frames
+            self._push_msg("READY\00SV")
+            resp, _, flags = self._pull_msg().partition('\00')
+            self._vp('Got response \'%s\', want something from \'%s\'', resp, names)
 
             # if in wrong state (provisioning/normal)
             if len(names) == 1 and resp != names[0] and resp[:-1] == names[0][:-1]:
                 return False
 
+        self.resumable = 'S' in flags
+        self.frame_version = 2 if 'V' in flags else 1
+        self.tx_seq = 0
+        self.rx_seq = 0
+        self.sent.clear()
+        self.sent_order.clear()
+        self.early.clear()
         return resp
 
     def _sync(self, provision):
@@ -103,71 +455,125 @@ class Psoc(object):
         Args:
             provision (bool): Whether expecting unprovisioned state
 
+        Skips straight to GO if the PSoC is already waiting for it, either
+        because the last operation ended a session cleanly or because open
+        left it there.
+
         Raises:
             NotProvisioned if PSoC is unexpectedly unprovisioned
             AlreadyProvisioned if PSoC is unexpectedly already provisioned
         """
-        if provision:
-            if not self._sync_once([self.sync_name_p]):
-                self._vp("Already provisioned!", logging.error)
-                raise AlreadyProvisioned
+        with self.latency.span('%s.sync' % self.name.lower()):
+            self.clean = True
+            if self.synced == (self.sync_name_p if provision else self.sync_name_n):
+                self.synced = None
+                self._push_msg("GO\00")
+                self.framing = self.frame_version
+                self._vp("Connection resumed")
+                return
+
+            if provision:
+                if not self._sync_once([self.sync_name_p]):
+                    self._vp("Already provisioned!", stream=logging.error)
+                    raise AlreadyProvisioned
+            else:
+                if not self._sync_once([self.sync_name_n]):
+                    self._vp("Not yet provisioned!", stream=logging.error)
+                    raise NotProvisioned
+            self._push_msg("GO\00")
+            self.framing = self.frame_version
+            self._vp("Connection synced")
+
+    def _op_done(self):
+        """Note that the PSoC finished an operation and is back at its sync
+        point, so the next operation can resume the session"""
+        if self.resumable and self.clean:
+            self.synced = self.sync_name_n
         else:
-            if not self._sync_once([self.sync_name_n]):
-                self._vp("Not yet provisioned!", logging.error)
-                raise NotProvisioned
-        self._push_msg("GO\00")
-        self._vp("Connection synced")
+            self.synced = None
 
     def open(self):
         time.sleep(.1)
         self.ser = serial.Serial(self.port, baudrate=self.baudrate, timeout=1)
-        resp = self._sync_once(['CARD_N', 'CARD_P', 'HSM_N', 'HSM_P'])
+        self.reader.reset()
+        try:
+            resp = self._sync_once(['CARD_N', 'CARD_P', 'HSM_N', 'HSM_P'])
+        except DeviceTimeout:
+            resp = None
         if resp == self.sync_name_p or resp == self.sync_name_n:
             logging.info('DYNAMIC SERIAL: Connected to %s', resp)
+            # The PSoC now waits for GO
+            self.synced = resp
             self.connected = True
-        else:
-            logging.info('DYNAMIC SERIAL: Expected %s or %s', self.sync_name_p,
-                                                              self.sync_name_n)
-            logging.info('DYNAMIC SERIAL: Disconnecting from %s', resp)
-            self.start_connect_watcher()
+            return True
+        logging.info('DYNAMIC SERIAL: Expected %s or %s', self.sync_name_p,
+                                                          self.sync_name_n)
+        logging.info('DYNAMIC SERIAL: Disconnecting from %s', resp)
+        self.ser.close()
+        return False
+
+    def hotplug_monitor(self):
+        """HotplugMonitor this PSoC takes its events from"""
+        if self.monitor is None:
+            self.monitor = hotplug.default_monitor()
+        return self.monitor
+
+    def stop_watching(self):
+        """Stop taking hotplug events"""
+        self.monitor.unsubscribe(self.events)
+        self.events = None
 
     def device_connect_watch(self):
         """Threaded function that connects to new serial devices"""
+        rejected = set()
+        while True:
+            event = self.events.get()
+            if event.kind == hotplug.DISCONNECTED:
+                rejected.discard(event.port)
+                continue
+            if event.port in rejected or not self.monitor.claim(event.port):
+                continue
+            self.port = event.port
+            logging.info("DYNAMIC SERIAL: Found new serial device")
+            try:
+                opened = self.open()
+            except (DeviceRemoved, DeviceTimeout, serial.SerialException):
+                # Pulled while syncing; wait for it or another to show up
+                logging.info("DYNAMIC SERIAL: %s removed while connecting", self.name)
+                self.monitor.release(event.port)
+                self.port = ''
+                continue
+            if opened:
+                break
+            # Someone else's device; let the other subscribers have it
+            rejected.add(event.port)
+            self.monitor.release(event.port, offer=True)
 
-        # Read current ports
-        connecting = []
-
-        # Has a new device connected?
-        while len(connecting) == 0:
-            new_ports = [port_info.device for port_info in list_ports()]
-            connecting = list(set(new_ports) - set(self.old_ports))
-            self.old_ports = new_ports
-            time.sleep(.25)
-        self.port = connecting[0]
-        logging.info("DYNAMIC SERIAL: Found new serial device")
-        self.open()
         if self.name == 'CARD':
-            self.start_disconnect_watcher()
+            # Keep the subscription, which may already hold the card's
+            # removal
+            self.start_disconnect_watcher(self.events)
+        else:
+            self.stop_watching()
 
     def device_disconnect_watch(self):
-        """Threaded function that connects to new serial devices"""
-
-        # Read current ports
-        disconnecting = []
-
-        # Has a new device connected?
-        while not disconnecting and self.port not in disconnecting:
-            new_ports = [port_info.device for port_info in list_ports()]
-            disconnecting = list(set(self.old_ports) - set(new_ports))
-            self.old_ports = new_ports
+        """Threaded function that disconnects from removed serial devices"""
+        while True:
+            event = self.events.get()
+            if event.kind == hotplug.DISCONNECTED and event.port == self.port:
+                break
 
         logging.info("DYNAMIC SERIAL: %s disconnected", self.name)
+        self.monitor.release(self.port)
         self.port = ''
         self.connected = False
+        self.synced = None
         self.lock.acquire()
         self.ser.close()
+        self.reader.reset()
         self.lock.release()
-        self.start_connect_watcher()
+        # Keep the subscription, which may already hold the next insertion
+        self.start_connect_watcher(self.events)
 
     def read(self, size=1):
         """Reads bytes from the connected serial device
@@ -188,12 +594,21 @@ class Psoc(object):
             self.lock.release()
             return res
         except serial.SerialException:
-            self.connected = False
-            self.ser.close()
-            self.lock.release()
-            self.start_connect_watcher()
+            self.device_removed()
             raise DeviceRemoved
 
+    def available(self):
+        """Number of bytes the serial device holds that can be read without
+        blocking
+
+        Returns:
+            int: Bytes waiting, 0 if the device can't tell
+        """
+        try:
+            return self.ser.in_waiting
+        except (AttributeError, IOError, serial.SerialException):
+            return 0
+
     def write(self, data):
         """Writes bytes to the connected serial device
 
@@ -209,21 +624,55 @@ class Psoc(object):
             self.lock.release()
             return res
         except serial.SerialException:
-            self.connected = False
-            self.ser.close()
-            self.lock.release()
-            self.start_connect_watcher()
+            self.device_removed()
             raise DeviceRemoved
 
-    def start_connect_watcher(self):
+    def device_removed(self):
+        """Close the serial device after a failed read or write and wait for
+        it to come back
+
+        Called with self.lock held; releases it.
+        """
+        self.connected = False
+        self.synced = None
+        self.ser.close()
+        self.reader.reset()
+        self.lock.release()
+        if self.events is not None:
+            # A watcher owns the device: the disconnect watcher will see it
+            # go and restart the connect watcher, and the connect watcher
+            # gives up on a device removed while it opens it
+            return
+        if self.port:
+            self.hotplug_monitor().release(self.port)
+        self.start_connect_watcher()
+
+    def start_connect_watcher(self, events=None):
+        """Spin off a thread connecting to the next PSoC plugged in
+
+        Args:
+            events (Queue, optional): Hotplug subscription to keep using.
+                Default subscribes anew
+        """
         logging.info("DYNAMIC SERIAL: Closed serial and spun off %s-connect-watcher thread", self.name)
-        self.old_ports = [port_info.device for port_info in list_ports()]
-        threading.Thread(target=self.device_connect_watch, name="%s-watcher" % self.name).start()
+        self.events = events if events is not None else self.hotplug_monitor().subscribe()
+        watcher = threading.Thread(target=self.device_connect_watch, name="%s-watcher" % self.name)
+        watcher.daemon = True
+        watcher.start()
+
+    def start_disconnect_watcher(self, events=None):
+        """Spin off a thread noticing when the connected PSoC is removed
 
-    def start_disconnect_watcher(self):
+        Args:
+            events (Queue, optional): Hotplug subscription to keep using.
+                Default subscribes anew
+        """
         logging.info("DYNAMIC SERIAL: Opened serial and spun off %s-disconnect-watcher thread", self.name)
-        self.old_ports = [port_info.device for port_info in list_ports()]
-        threading.Thread(target=self.device_disconnect_watch, name="%s-disconnect-watcher" % self.name).start()
+        self.events = events if events is not None else self.hotplug_monitor().subscribe()
+        watcher = threading.Thread(target=self.device_disconnect_watch,
+                                   name="%s-disconnect-watcher" % self.name)
+        watcher.daemon = True
+        watcher.start()
 
     def inserted(self):
         """Queries if serial port to ATM card is open
@@ -233,10 +682,15 @@ class Psoc(object):
         """
         return self.ser.isOpen()
 
-    def wait_for_insert(self):
-        """Blocks until a card is dynamically acquired"""
-        self._vp('Waiting for card insertion')
-        while not self.ser:
-            time.sleep(.25)
-        while not self.ser.isOpen():
-            time.sleep(.25)
+    def wait_for_insert(self, timeout=None):
+        """Blocks until a PSoC is dynamically acquired
+
+        Args:
+            timeout (float, optional): Most seconds to wait. Default waits
+                until one is
+
+        Returns:
+            bool: True if a PSoC is connected
+        """
+        self._vp('Waiting for insertion')
+        return self.plugged.wait(timeout)
@@ -1,3 +1,4 @@
 from .serial_emulator import SerialEmulator
 from .card_emulator import CardEmulator
 from .hsm_emulator import HSMEmulator
+from .pty_emulator import PtyEmulator
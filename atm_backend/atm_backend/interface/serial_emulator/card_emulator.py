@@ -36,7 +36,7 @@ class CardEmulator(SerialEmulator):
             str: Packet header of the okay message
         """
         self.pin = self._next_msg()
-        self._vp('Received pin \'%s\'' % self.pin)
+        self._vp('Received pin \'%s\'', self.pin)
         return self._return_message("K", self._get_uuid)
 
     def _get_uuid(self):
@@ -46,7 +46,7 @@ class CardEmulator(SerialEmulator):
             str: Packet header of the okay message
         """
         self.uuid = self._next_msg()
-        self._vp('Received UUID \'%s\'' % self.uuid)
+        self._vp('Received UUID \'%s\'', self.uuid)
         self.provision = False
         return self._return_message("K", self._sync)
 
@@ -62,8 +62,8 @@ class CardEmulator(SerialEmulator):
 
         msg = self._next_msg()
         if msg != self.pin:
-            self._vp('ERROR: Got bad PIN (wanted \'%s\' got \'%s\''
-                     % (self.pin, msg), logging.error)
+            self._vp('ERROR: Got bad PIN (wanted \'%s\' got \'%s\'',
+                     self.pin, msg, stream=logging.error)
             return self._return_message('BAD', self._sync)
 
         self._vp('Got correct PIN')
@@ -87,7 +87,7 @@ class CardEmulator(SerialEmulator):
         Returns:
             str: Packet header of the UUID message
         """
-        self._vp('Sending UUID \'%s\'' % self.uuid)
+        self._vp('Sending UUID \'%s\'', self.uuid)
         return self._return_message(self.uuid, self._sync)
 
     def _change_pin(self):
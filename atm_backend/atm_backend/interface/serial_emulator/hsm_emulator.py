@@ -23,6 +23,15 @@ class HSMEmulator(SerialEmulator):
         self.prov_dest = self._get_uuid
         self.sync_dest = self._send_uuid
         self.to_dispense = -1
+        # Set False to emulate firmware that sends one bill per frame
+        self.batch_support = True
+        # Largest batch frame payload
+        self.batch_limit = 1024
+        self.batch = False
+        # Set False to emulate firmware that acks each bill before the next
+        self.window_support = True
+        self.bills_loaded = 0
+        self.resend_requested = False
 
         if provision:
             self.uuid = ""
@@ -42,7 +51,7 @@ class HSMEmulator(SerialEmulator):
             str: Packet header of the okay message
         """
         self.uuid = self._next_msg()
-        self._vp('Received UUID \'%s\'' % self.uuid)
+        self._vp('Received UUID \'%s\'', self.uuid)
         return self._return_message('K', self._get_numbills)
 
     def _get_numbills(self):
@@ -51,9 +60,14 @@ class HSMEmulator(SerialEmulator):
         Returns:
             str: Packet header of the okay message
         """
-        self.bill_count = struct.unpack('B', self._next_msg())[0]
+        msg = self._next_msg(strip=False)
+        self.bill_count = struct.unpack('B', msg[0])[0]
         self.bills_left = self.bill_count
-        self._vp('Received numbills \'%s\'' % self.bill_count)
+        self._vp('Received numbills \'%s\'', self.bill_count)
+        if self.window_support and msg[1:] == 'W':
+            self.bills_loaded = 0
+            self.resend_requested = False
+            return self._return_message('K\00W', self._load_window_bill)
         return self._return_message('K', self._load_bill)
 
     def _load_bill(self):
@@ -64,7 +78,7 @@ class HSMEmulator(SerialEmulator):
         """
         bill = self._next_msg()
         self.bills.put(bill)
-        self._vp('Loaded bill \'%s\'' % bill)
+        self._vp('Loaded bill \'%s\'', bill)
 
         self.bill_count -= 1
         if self.bill_count == 0:
@@ -74,6 +88,42 @@ class HSMEmulator(SerialEmulator):
 
         return self._return_message('K', self._load_bill)
 
+    def _load_window_bill(self):
+        """Receives a bill sent in windowed provisioning and adds it to the
+        HSM if it is the next one
+
+        Bills after a missing one are dropped, and only the first is
+        answered with a request to resend from the missing one.
+
+        Returns:
+            str: Packet header of the cumulative ack, or of a request to
+                resend from the first missing bill
+        """
+        msg = self._next_msg(strip=False)
+        index = struct.unpack('B', msg[0])[0]
+        if index > self.bills_loaded:
+            if self.resend_requested:
+                self._vp('Dropped bill %d', index)
+                return self._load_window_bill()
+            self._vp('Missed bill %d, got bill %d', self.bills_loaded, index, stream=logging.error)
+            self.resend_requested = True
+            return self._return_message('R' + struct.pack('B', self.bills_loaded),
+                                        self._load_window_bill)
+
+        self.resend_requested = False
+        if index == self.bills_loaded:
+            bill = msg[1:].strip('\00')
+            self.bills.put(bill)
+            self.bills_loaded += 1
+            self._vp('Loaded bill %d \'%s\'', index, bill)
+
+        ack = 'K' + struct.pack('B', self.bills_loaded)
+        if self.bills_loaded == self.bill_count:
+            self.provision = False
+            self._vp('Provisioning done!')
+            return self._return_message(ack, self._sync)
+        return self._return_message(ack, self._load_window_bill)
+
     def _send_uuid(self):
         """Send HSM UUID
 
@@ -83,7 +133,7 @@ class HSMEmulator(SerialEmulator):
         if not self._sync_complete():
             return ''
 
-        self._vp('Sending UUID %s' % self.uuid)
+        self._vp('Sending UUID %s', self.uuid)
         return self._return_message(self.uuid, self._check_uuid)
 
     def _check_uuid(self):
@@ -95,33 +145,59 @@ class HSMEmulator(SerialEmulator):
         hsmid = self._next_msg()
 
         if hsmid != self.uuid:
-            self._vp("ERROR: got bad UUID (wanted \'%s\' got \'%s\'"
-                     % (self.uuid, hsmid), logging.error)
+            self._vp("ERROR: got bad UUID (wanted \'%s\' got \'%s\'",
+                     self.uuid, hsmid, stream=logging.error)
             return self._return_message('BAD', self._sync)
         return self._return_message('K', self._dispense_bills)
 
     def _dispense_bills(self):
-        """Dispenses one bill from the HSM storage
+        """Dispenses one bill, or one batch of bills, from the HSM storage
 
         Returns:
-            str: Packet header of a dispensed bill
+            str: Packet header of a dispensed bill or batch
         """
         if self.to_dispense == 0:
             self.to_dispense = -1
             self._vp('Done dispensing bills')
+            self.next_state = self._sync
             return self._sync()
 
         if self.to_dispense == -1:
-            self.to_dispense = struct.unpack("B", self._next_msg())[0]
+            msg = self._next_msg(strip=False)
+            self.to_dispense = struct.unpack("B", msg[0])[0]
             if self.to_dispense > self.bills_left:
                 self.to_dispense = -1
                 return self._return_message("BAD", self._sync)
 
-            self._vp('Ready to dispense %d bills' % self.to_dispense)
+            self._vp('Ready to dispense %d bills', self.to_dispense)
+            self.batch = self.batch_support and msg[1:] == 'B'
+            if self.batch:
+                return self._return_message('K\00B', self._dispense_bills)
             return self._return_message('K', self._dispense_bills)
 
+        if self.batch:
+            return self._dispense_batch()
+
         self.bills_left -= 1
         self.to_dispense -= 1
         bill = self.bills.get()
-        self._vp('Dispensing bill \'%s\'' % bill)
+        self._vp('Dispensing bill \'%s\'', bill)
         return self._return_message(bill, self._dispense_bills)
+
+    def _dispense_batch(self):
+        """Dispenses as many bills as fit in one batch frame
+
+        Returns:
+            str: Packet header of the batch
+        """
+        batch = []
+        size = 0
+        while self.to_dispense and (not batch or
+                                    size + 1 + len(self.bills.queue[0]) <= self.batch_limit):
+            bill = self.bills.get()
+            batch.append(struct.pack('B', len(bill)) + bill)
+            size += 1 + len(bill)
+            self.bills_left -= 1
+            self.to_dispense -= 1
+        self._vp('Dispensing batch of %d bills', len(batch))
+        return self._return_message(''.join(batch), self._dispense_bills, extended=True)
@@ -0,0 +1,127 @@
+import errno
+import os
+import threading
+import time
+import tty
+from .. import framing
+
+
+class PtyEmulator(object):
+    """Serves a SerialEmulator on a pseudo terminal, so the real Card and
+    HSM classes can open it by path like a PSoC's serial port
+
+    Frames the ATM writes to the terminal are split out of the byte stream
+    and handed to the emulator, and everything the emulator answers is
+    written back, so reads and writes go through pyserial and kernel
+    buffering as they would with a PSoC attached.
+
+    Args:
+        emulator (SerialEmulator): emulated PSoC to serve
+        baudrate (int, optional): paces bytes in both directions as a UART
+            at this rate would, 8N1. Default doesn't pace
+        latency (float, optional): seconds added before each chunk of
+            bytes is passed on in either direction
+
+    Attributes:
+        path (str): path of the terminal to open, as in Card(port=path)
+    """
+
+    def __init__(self, emulator, baudrate=None, latency=0):
+        self.emulator = emulator
+        self.baudrate = baudrate
+        self.latency = latency
+        self.master, self.slave = os.openpty()
+        # No echo or line editing, whoever opens the terminal
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+        self.running = True
+        self.buf = ''
+
+        self.writer = threading.Thread(target=self.serve_writes,
+                                       name='%s-pty-in' % emulator.name)
+        self.writer.daemon = True
+        self.writer.start()
+        self.reader = threading.Thread(target=self.serve_reads,
+                                       name='%s-pty-out' % emulator.name)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def close(self):
+        """Stop serving and close the terminal"""
+        if not self.running:
+            return
+        self.running = False
+        # The reader waits in the emulator for the ATM's next frame. A
+        # legacy frame holding one NUL wakes it, and it stops without
+        # answering
+        self.emulator.write('\x01\x00')
+        # Closing the slave first makes the writer's read fail with EIO,
+        # unless the ATM still has the terminal open
+        os.close(self.slave)
+        self.reader.join(1)
+        self.writer.join(.1)
+        os.close(self.master)
+
+    def _shape(self, size):
+        """Sleeps as long as size bytes would take to cross the link"""
+        delay = self.latency
+        if self.baudrate:
+            delay += size * 10.0 / self.baudrate
+        if delay:
+            time.sleep(delay)
+
+    def _frame_length(self):
+        """Length of the frame at the front of self.buf
+
+        Returns:
+            int: Length of the whole frame, or 0 if its header hasn't
+                arrived yet
+        """
+        if not self.buf:
+            return 0
+        if ord(self.buf[0]) != framing.V2_MAGIC:
+            return 1 + ord(self.buf[0])
+        head = 1 + framing.V2_HEADER.size
+        if len(self.buf) < head:
+            return 0
+        _, _, length = framing.V2_HEADER.unpack_from(self.buf, 1)
+        return head + length + framing.V2_CRC.size
+
+    def serve_writes(self):
+        """Threaded function passing frames written by the ATM to the
+        emulator"""
+        while self.running:
+            try:
+                data = os.read(self.master, 4096)
+            except OSError as err:
+                if err.errno in (errno.EIO, errno.EBADF):
+                    break
+                raise
+            self._shape(len(data))
+            self.buf += data
+            length = self._frame_length()
+            while length and len(self.buf) >= length:
+                self.emulator.write(self.buf[:length])
+                self.buf = self.buf[length:]
+                length = self._frame_length()
+
+    def serve_reads(self):
+        """Threaded function writing the emulator's answers to the ATM"""
+        while self.running:
+            data = self.emulator.read()
+            if not self.running:
+                break
+            if not data:
+                if self.emulator.close_on_sync:
+                    # A closed emulator never answers again
+                    break
+                # Don't spin on a state that had nothing to send
+                time.sleep(.001)
+                continue
+            self._shape(len(data))
+            try:
+                os.write(self.master, data)
+            except OSError as err:
+                if err.errno in (errno.EIO, errno.EBADF):
+                    break
+                raise
@@ -1,6 +1,13 @@
 from Queue import Queue
 import logging
 import struct
+from .. import framing
+from ..framing import frame_header
+
+
+class FrameRequested(Exception):
+    """Raised inside a state when a frame has to go out before the state
+    can continue, so the state runs again on the next read"""
 
 
 class SerialEmulator(object):
@@ -73,6 +80,22 @@ class SerialEmulator(object):
         self.sync_resp_n = None
         self.prov_dest = None
         self.sync_dest = None
+        # Set False to emulate firmware that predates session reuse
+        self.session_support = True
+        self.session = False
+        # Set once GO arrives, until the state it led to sends something
+        self.go_received = False
+        # Set False to emulate firmware that only knows legacy frames
+        self.frame_support = True
+        # Frame version agreed at the last sync, and the one in use
+        self.frame_version = 1
+        self.framing = 1
+        self.tx_seq = 0
+        self.rx_seq = 0
+        self.sent = {}
+        # Frames to send before running the next state
+        self.resend = []
+        self.nacked = None
 
     def write(self, msg):
         """Write a message to the emulator
@@ -83,7 +106,7 @@ class SerialEmulator(object):
                            | len(pkt) | pkt ...                |
                """
         self.msg_q.put(msg)
-        self._vp('Added \'%s\' to the queue' % msg)
+        self._vp('Added \'%s\' to the queue', msg)
 
     def read(self, b=1, size=0):
         """Reads a message from the emulator
@@ -95,8 +118,13 @@ class SerialEmulator(object):
             str: Alternates every call between sending the 1B header and the
                  packet
         """
+        if self.resend:
+            return self.resend.pop(0)
         self._vp('Going to next state')
-        return self.next_state()
+        try:
+            return self.next_state()
+        except FrameRequested:
+            return self.resend.pop(0)
 
     def close(self):
         """Close the serial port and flush the stored commands"""
@@ -108,44 +136,117 @@ class SerialEmulator(object):
     def isOpen(self):
         return True
 
-    def _vp(self, msg, stream=logging.info):
+    def _vp(self, msg, *args, **kwargs):
         """Prints message if verbose was set
 
         Args:
-            msg (str): message to print
+            msg (str): message to print, %-formatted with args only once it
+                is written out
+            *args: arguments for msg
             stream (logging function, optional): logging function to call
         """
         if self.verbose:
-            stream("%s: %s" % (self.name, msg))
+            kwargs.get('stream', logging.info)('%s: ' + msg, self.name, *args)
 
-    def _next_msg(self):
+    def _next_msg(self, strip=True):
         """Gets and unformats the next message on the queue
 
+        Args:
+            strip (bool, optional): Whether to strip NUL bytes from both
+                ends of the message
+
         Returns:
             str: Next message unformatted
         """
         msg = self.msg_q.get()
-        msg = struct.unpack("B%ds" % (len(msg) - 1), msg)[1].strip('\00')
-        self._vp('Got message \'%s\' from the queue' % msg)
+        if ord(msg[0]) == framing.V2_MAGIC:
+            msg = self._unpack_v2(msg)
+        else:
+            msg = struct.unpack("B%ds" % (len(msg) - 1), msg)[1]
+        if strip:
+            msg = msg.strip('\00')
+        self._vp('Got message \'%s\' from the queue', msg)
         return msg
 
-    def _return_message(self, msg, next_call):
+    def _unpack_v2(self, frame):
+        """Checks a version 2 frame from the ATM
+
+        Args:
+            frame (str): the whole frame
+
+        Returns:
+            str: Payload of the frame, if it is the next data frame
+
+        Raises:
+            FrameRequested: if the ATM has to be sent a frame first, either
+                one it asked for or a request to send one again
+        """
+        kind, seq, length = framing.V2_HEADER.unpack_from(frame, 1)
+        body = frame[1:-framing.V2_CRC.size]
+        crc, = framing.V2_CRC.unpack(frame[-framing.V2_CRC.size:])
+        if crc != framing.crc16(body) or length != len(body) - framing.V2_HEADER.size:
+            self._vp('Frame %d corrupt', self.rx_seq, stream=logging.error)
+            self._request_frame(self.rx_seq)
+            raise FrameRequested
+
+        if kind == framing.NAK:
+            if seq in self.sent:
+                self._vp('Resending frame %d', seq)
+                self.resend.append(self.sent[seq])
+                raise FrameRequested
+            return self._next_msg(strip=False)
+
+        ahead = (seq - self.rx_seq) % 256
+        if ahead == 0:
+            self.rx_seq = (self.rx_seq + 1) % 256
+            self.nacked = None
+            return body[framing.V2_HEADER.size:]
+        if ahead < 128:
+            # Like the firmware, drop frames past a missing one and ask
+            # for the missing one, then each dropped one, again
+            self._vp('Dropped frame %d, missing %d', seq, self.rx_seq, stream=logging.error)
+            self._request_frame(self.rx_seq)
+            self.resend.append(framing.pack_v2(framing.NAK, seq))
+            raise FrameRequested
+        self._vp('Dropped repeated frame %d', seq)
+        return self._next_msg(strip=False)
+
+    def _request_frame(self, seq):
+        """Asks the ATM to send frame seq again, once per missing frame"""
+        if self.nacked != seq:
+            self.nacked = seq
+            self.resend.append(framing.pack_v2(framing.NAK, seq))
+
+    def _return_message(self, msg, next_call, extended=False):
         """Sends the header and prepares to send the packet on the next
         call to read
 
         Args:
             msg (str): Raw message to be sent
             next_call (func): State to return to after sending message body
+            extended (bool, optional): Whether the ATM accepts an extended
+                length header
 
         Returns:
-            str: 1B packet header with packet length
+            str: 1B packet header with packet length, or 3B extended header,
+                or the whole frame when using version 2 frames
         """
 
+        self.go_received = False
+        if self.framing == 2:
+            frame = framing.pack_v2(framing.DATA, self.tx_seq, msg)
+            self.sent[self.tx_seq] = frame
+            self.sent.pop((self.tx_seq - 16) % 256, None)
+            self.tx_seq = (self.tx_seq + 1) % 256
+            self.next_state = next_call
+            self._vp('Returning frame of %d', len(msg))
+            return frame
+
         self.next_state = self._send_msg_body
         self.msg_body_next = next_call
         self.msg_body = msg
-        self._vp('Returning message header of %d' % len(msg))
-        return struct.pack('B', len(msg))
+        self._vp('Returning message header of %d', len(msg))
+        return frame_header(len(msg), extended)
 
     def _send_msg_body(self):
         """Sends the body of the message and goes to the next state
@@ -155,7 +256,7 @@ class SerialEmulator(object):
         """
 
         self.next_state = self.msg_body_next
-        self._vp('Returning message body \'%s\'' % self.msg_body)
+        self._vp('Returning message body \'%s\'', self.msg_body)
         return self.msg_body
 
     def _sync(self):
@@ -169,18 +270,40 @@ class SerialEmulator(object):
         if self.close_on_sync:
             return
 
-        msg = self._next_msg()
+        msg, _, flags = self._next_msg(strip=False).partition('\00')
+        if self.session and not self.provision and msg == "GO":
+            self._vp('Resuming session')
+            self.go_received = True
+            self.framing = self.frame_version
+            self.next_state = self.sync_dest
+            return self.sync_dest()
+
+        # Syncs always use legacy frames
+        self.framing = 1
         if msg != "READY":
             self._vp('ERROR: Sync did not receive correct message! '
-                     'Wantedd \'READY\' got \'%s\''
-                     % msg)
+                     'Wantedd \'READY\' got \'%s\'',
+                     msg)
             return self._return_message(msg, self._sync)
 
         self._vp('Sync received correct message')
+        self.frame_version = 2 if self.frame_support and 'V' in flags else 1
+        self.tx_seq = 0
+        self.rx_seq = 0
+        self.sent = {}
+        self.nacked = None
+        agreed = 'V' if self.frame_version == 2 else ''
         if self.provision:
+            self.session = False
             self._vp("Going from sync into provisioning")
-            return self._return_message(self.sync_resp_p, self._provision_msg)
+            return self._return_message(self.sync_resp_p + ('\00' + agreed if agreed else ''),
+                                        self._provision_msg)
+        self.session = self.session_support and 'S' in flags
+        if self.session:
+            agreed = 'S' + agreed
         self._vp("Going from sync into normal operation")
+        if agreed:
+            return self._return_message(self.sync_resp_n + '\00' + agreed, self.sync_dest)
         return self._return_message(self.sync_resp_n, self.sync_dest)
 
     def _sync_complete(self):
@@ -189,15 +312,21 @@ class SerialEmulator(object):
         Returns:
             bool: Whether synchronization was successful
         """
+        if self.go_received:
+            # GO was already taken, by _sync on a resumed session or by an
+            # earlier run of the calling state
+            return True
 
         msg = self._next_msg()
         if msg != "GO":
-            self._vp('ERROR: Sync did not receive correct go message! \'%s\''
-                     % msg)
+            self._vp('ERROR: Sync did not receive correct go message! \'%s\'',
+                     msg)
             self.next_state = self._sync
             return False
 
         self._vp('Sync received correct go message')
+        self.go_received = True
+        self.framing = self.frame_version
         return True
 
     def _provision_msg(self):
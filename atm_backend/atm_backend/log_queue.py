@@ -0,0 +1,148 @@
+"""Logging through a bounded queue
+
+The handlers that write log records out, the console and the rotating log
+file, do blocking I/O. Attached to the root logger they would run on every
+request thread that logs, several times per withdrawal. Instead the root
+logger gets a QueueLogHandler, which only puts records on a bounded queue,
+and a QueueLogListener thread takes them off and hands them to the real
+handlers. Formatting happens on the listener thread too, so a request
+thread never formats or writes a message itself.
+
+When the queue is full, records are dropped instead of making the request
+thread wait. The handler counts them, and the listener logs how many were
+lost once it catches up. Callers that keep metrics of their own pass an
+on_drop function to hear of every dropped record.
+"""
+
+import atexit
+import logging
+import Queue
+import threading
+
+# Types whose values can't change between logging and formatting a record
+_IMMUTABLE = (str, unicode, int, long, float, bool, type(None))
+
+_STOP = object()
+
+
+class QueueLogHandler(logging.Handler):
+    """Puts records on a bounded queue for a QueueLogListener
+
+    Args:
+        capacity (int, optional): Most records waiting on the queue
+        on_drop (function, optional): Called without arguments for every
+            record dropped
+
+    Attributes:
+        dropped (int): Records dropped because the queue was full
+    """
+
+    def __init__(self, capacity=10000, on_drop=None):
+        logging.Handler.__init__(self)
+        self.queue = Queue.Queue(capacity)
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+        self.on_drop = on_drop
+
+    def prepare(self, record):
+        """make record safe to format later on another thread
+
+        Messages with arguments that may still change, such as buffers
+        read from a device, are formatted now. Tracebacks are rendered to
+        text so the record doesn't keep their frames alive.
+        """
+        if record.args and not all(isinstance(arg, _IMMUTABLE) for arg in record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            with self.dropped_lock:
+                self.dropped += 1
+            if self.on_drop is not None:
+                self.on_drop()
+        except Exception:
+            self.handleError(record)
+
+
+class QueueLogListener(object):
+    """Hands records queued by a QueueLogHandler to handlers on a thread
+
+    Args:
+        queue_handler (QueueLogHandler): Handler queuing the records
+        handlers (list of logging.Handler): Handlers writing them out
+    """
+
+    def __init__(self, queue_handler, handlers):
+        self.queue_handler = queue_handler
+        self.handlers = list(handlers)
+        self.reported = 0
+        self.thread = None
+
+    def start(self):
+        """start handing out records on a daemon thread"""
+        self.thread = threading.Thread(target=self._monitor, name='log-listener')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """hand out the records already queued, then stop the thread"""
+        if self.thread is None:
+            return
+        self.queue_handler.queue.put(_STOP)
+        self.thread.join()
+        self.thread = None
+
+    def handle(self, record):
+        """pass record to every handler whose level it meets"""
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def _report_dropped(self):
+        """log how many records were dropped since the last report"""
+        dropped = self.queue_handler.dropped
+        if dropped > self.reported:
+            self.handle(logging.makeLogRecord({
+                'name': 'log_queue', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': 'Log queue full, dropped %d records (%d in total)',
+                'args': (dropped - self.reported, dropped)}))
+            self.reported = dropped
+
+    def _monitor(self):
+        queue = self.queue_handler.queue
+        while True:
+            record = queue.get()
+            if record is _STOP:
+                break
+            self.handle(record)
+            self._report_dropped()
+        self._report_dropped()
+
+
+def start_queue_logging(log, handlers, capacity=10000, on_drop=None):
+    """Routes the records of log to handlers through a listener thread
+
+    Args:
+        log (logging.Logger): Logger to attach the QueueLogHandler to
+        handlers (list of logging.Handler): Handlers writing records out
+        capacity (int, optional): Most records waiting to be written
+        on_drop (function, optional): Called without arguments for every
+            record dropped because the queue was full
+
+    Returns:
+        QueueLogListener: the started listener, stopped at exit
+    """
+    queue_handler = QueueLogHandler(capacity, on_drop)
+    log.addHandler(queue_handler)
+    listener = QueueLogListener(queue_handler, handlers)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,5 +1,5 @@
 import logging
-from interface.psoc import DeviceRemoved, AlreadyProvisioned
+from interface.psoc import DeviceRemoved, DeviceTimeout, AlreadyProvisioned
 
 
 class ProvisionTool(object):
@@ -55,6 +55,9 @@ class ProvisionTool(object):
         except DeviceRemoved:
             logging.error('provision_card: card was removed!')
             return False
+        except DeviceTimeout as e:
+            logging.error('provision_card: card stopped responding: %s', e)
+            return False
         except AlreadyProvisioned:
             logging.error('provision_card: card was already provisioned!')
             return False
@@ -88,6 +91,9 @@ class ProvisionTool(object):
         except DeviceRemoved:
             logging.error('provision_atm: HSM was removed!')
             return False
+        except DeviceTimeout as e:
+            logging.error('provision_atm: HSM stopped responding: %s', e)
+            return False
         except AlreadyProvisioned:
             logging.error('provision_atm: HSM was already provisioned!')
             return False
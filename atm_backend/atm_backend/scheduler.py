@@ -0,0 +1,98 @@
+""" Scheduler
+This module implements the threaded XML-RPC server used by the ATM.
+
+SimpleXMLRPCServer handles one request at a time, so a withdrawal or an HSM
+provisioning run holds up even status calls like hello and card_connected.
+ThreadedXMLRPCServer serves each request on its own thread instead, and
+DeviceScheduler serializes the calls that talk to the same PSoC, in the order
+they arrived, while calls using other devices or none run alongside them."""
+
+import functools
+import threading
+import SocketServer
+from SimpleXMLRPCServer import SimpleXMLRPCServer
+
+
+class ThreadedXMLRPCServer(SocketServer.ThreadingMixIn, SimpleXMLRPCServer):
+    """SimpleXMLRPCServer serving each request on its own thread
+
+    Args:
+        addr (tuple): host and port to listen on
+    """
+    daemon_threads = True
+
+
+class DeviceQueue(object):
+    """First come, first served lock on one device"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+
+    def acquire(self):
+        """wait for every earlier call on the device to finish"""
+        with self.cond:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            while ticket != self.serving:
+                self.cond.wait()
+
+    def release(self):
+        """let the next call on the device run"""
+        with self.cond:
+            self.serving += 1
+            self.cond.notify_all()
+
+    def depth(self):
+        """calls waiting for or using the device"""
+        with self.cond:
+            return self.next_ticket - self.serving
+
+
+class DeviceScheduler(object):
+    """Runs calls on the same device one at a time
+
+    Args:
+        devices (list of str): names of the devices calls may use
+    """
+
+    def __init__(self, devices=('card', 'hsm')):
+        self.queues = dict((device, DeviceQueue()) for device in devices)
+
+    def wrap(self, func, *devices):
+        """wrap func to run only once it has devices to itself
+
+        Devices are taken in name order, so calls using several devices
+        can't deadlock each other.
+
+        Args:
+            func (function): function to wrap
+            *devices (str): names of the devices func uses, none if it can
+                run at any time
+
+        Returns:
+            function: func with the same name, taking the same arguments
+        """
+        queues = [self.queues[device] for device in sorted(devices)]
+        if not queues:
+            return func
+
+        @functools.wraps(func)
+        def scheduled(*args):
+            for queue in queues:
+                queue.acquire()
+            try:
+                return func(*args)
+            finally:
+                for queue in reversed(queues):
+                    queue.release()
+        return scheduled
+
+    def queue_depth(self):
+        """Reports how many calls are waiting for or using each device
+
+        Returns:
+            dict: number of calls, including the running one, by device name
+        """
+        return dict((device, queue.depth()) for device, queue in self.queues.items())
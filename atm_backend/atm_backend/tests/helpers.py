@@ -0,0 +1,128 @@
+from unittest import TestCase
+from .. import DummyCard, DummyHSM
+from ..interface import framing
+
+
+def flip_crc(msg):
+    """msg with a bit of its checksum flipped"""
+    return msg[:-3] + chr(ord(msg[-3]) ^ 0xFF) + msg[-2:]
+
+
+class Link(object):
+    """Sits between the ATM and an emulated PSoC, counting the frames that
+    pass and losing, corrupting or holding back chosen ones
+
+    Each hook is a function deciding from a frame whether it applies. The
+    drop and corrupt hooks apply to one frame and are then cleared.
+    stick_on makes the PSoC stop answering for good, after which reads
+    return silence, or garbage repeated over and over if it is set.
+
+    Args:
+        ser (SerialEmulator): emulated PSoC
+
+    Attributes:
+        syncs (int): READY frames written, one for every sync started
+        naks (int): version 2 NAKs written
+        in_flight (int): frames written that the PSoC has not answered yet
+        widest (int): most frames in flight at once
+        stuck_reads (int): reads answered since the PSoC got stuck
+    """
+    def __init__(self, ser):
+        self.ser = ser
+        self.syncs = 0
+        self.naks = 0
+        self.in_flight = 0
+        self.widest = 0
+        self.drop_write = None
+        self.corrupt_write = None
+        self.drop_read = None
+        self.corrupt_read = None
+        self.stick_on = None
+        self.stuck = False
+        self.garbage = None
+        self.pending = ''
+        self.stuck_reads = 0
+
+    def write(self, msg):
+        if msg[1:].startswith('READY'):
+            self.syncs += 1
+        if msg[0] == '\x00' and msg[1] == framing.NAK:
+            self.naks += 1
+        if self.stick_on and self.stick_on(msg):
+            self.stuck = True
+        if self.drop_write and self.drop_write(msg):
+            self.drop_write = None
+            return
+        if self.corrupt_write and self.corrupt_write(msg):
+            self.corrupt_write = None
+            msg = flip_crc(msg)
+        # GO is the only frame the PSoC does not answer
+        if not msg[1:].startswith('GO'):
+            self.in_flight += 1
+            self.widest = max(self.widest, self.in_flight)
+        self.ser.write(msg)
+
+    def read(self, size=1):
+        if self.stuck:
+            return self.read_stuck(size)
+        if self.ser.next_state != self.ser._send_msg_body and self.in_flight:
+            self.in_flight -= 1
+        data = self.ser.read(size=size)
+        if self.drop_read and self.drop_read(data):
+            self.drop_read = None
+            return ''
+        if self.corrupt_read and self.corrupt_read(data):
+            self.corrupt_read = None
+            data = flip_crc(data)
+        return data
+
+    def read_stuck(self, size):
+        """silence, or the next size bytes of garbage"""
+        self.stuck_reads += 1
+        if not self.garbage:
+            return ''
+        if not self.pending:
+            self.pending = self.garbage
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+
+class LinkTestCase(TestCase):
+    """Builds emulated PSoCs whose serial ports are Links"""
+
+    def make_card(self, deadlines=None, frame_support=True):
+        """DummyCard on a Link, after a first check_balance has synced it
+
+        Args:
+            deadlines (Deadlines, optional): How long to wait for the card
+            frame_support (bool, optional): Whether the card firmware
+                speaks version 2 frames
+        """
+        card = DummyCard(deadlines=deadlines)
+        card.port.frame_support = frame_support
+        card.initialize()
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        card.ser = Link(card.ser)
+        return card
+
+    def make_hsm(self, bills=None, window=8, **port):
+        """DummyHSM on a Link
+
+        Args:
+            bills (list of str, optional): Bills to provision it with
+                before the Link is put in place
+            window (int, optional): Most bills sent ahead of the HSM's acks
+            **port: Attributes of the emulated HSM to set before it
+                starts, e.g. batch_support=False
+        """
+        hsm = DummyHSM(provision=True, window=window)
+        for name, value in port.items():
+            setattr(hsm.port, name, value)
+        hsm.initialize()
+        if bills is not None:
+            self.assertTrue(hsm.provision('beefcafebeefcafe', bills))
+        hsm.ser = Link(hsm.ser)
+        return hsm
@@ -0,0 +1,89 @@
+from unittest import TestCase
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from SocketServer import ThreadingMixIn
+from ..interface.bank import Bank
+import socket, threading, time
+
+
+class KeepAliveHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+
+class RecordingServer(ThreadingMixIn, SimpleXMLRPCServer):
+    """Threaded server remembering every connection it accepted"""
+    daemon_threads = True
+
+    def __init__(self, addr):
+        SimpleXMLRPCServer.__init__(self, addr, requestHandler=KeepAliveHandler, logRequests=False)
+        self.connections = []
+
+    def process_request(self, request, client_address):
+        self.connections.append(request)
+        ThreadingMixIn.process_request(self, request, client_address)
+
+
+class TestBankClient(TestCase):
+    # Start a keep-alive XML-RPC server standing in for the bank
+    @classmethod
+    def setUpClass(cls):
+        cls.server = RecordingServer(('localhost', 0))
+        cls.connections = cls.server.connections
+        cls.server.register_function(lambda card_id: 'OKAY 10', 'check_balance')
+        cls.server.register_function(lambda hsm_id, card_id, amount: 'OKAY ' + hsm_id, 'withdraw')
+        cls.server.register_function(cls.stall, 'stall')
+        cls.port = cls.server.server_address[1]
+        thread_obj = threading.Thread(target=cls.server.serve_forever)
+        thread_obj.daemon = True
+        thread_obj.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    @staticmethod
+    def stall(delay):
+        time.sleep(delay)
+        return True
+
+    def setUp(self):
+        del self.connections[:]
+
+    def test_connection_reused(self):
+        bank = Bank('localhost', self.port)
+        for _ in range(20):
+            self.assertEqual(bank.check_balance('card'), 10)
+            self.assertEqual(bank.withdraw('hsm', 'card', 1), 'hsm')
+        self.assertEqual(len(self.connections), 1)
+
+    def test_pool_bounded(self):
+        bank = Bank('localhost', self.port, pool_size=3)
+        results = []
+
+        def client():
+            for _ in range(10):
+                results.append(bank.check_balance('card'))
+        threads = [threading.Thread(target=client) for _ in range(8)]
+        for thread_obj in threads:
+            thread_obj.start()
+        for thread_obj in threads:
+            thread_obj.join()
+
+        self.assertEqual(results, [10] * 80)
+        self.assertTrue(len(self.connections) <= 3)
+
+    def test_closed_connection_replaced(self):
+        bank = Bank('localhost', self.port)
+        self.assertEqual(bank.check_balance('card'), 10)
+        # Server drops the idle connection
+        self.connections[0].shutdown(socket.SHUT_RDWR)
+        time.sleep(.1)
+        self.assertEqual(bank.check_balance('card'), 10)
+        self.assertEqual(len(self.connections), 2)
+
+    def test_read_timeout(self):
+        bank = Bank('localhost', self.port, read_timeout=.2)
+        self.assertRaises(socket.timeout, bank.bank_rpc.stall, 1)
+        # The timed out connection is not reused
+        self.assertEqual(bank.check_balance('card'), 10)
+        self.assertEqual(len(self.connections), 2)
@@ -0,0 +1,38 @@
+import time
+from .. import ATM, DeviceTimeout, Deadlines
+from .helpers import LinkTestCase
+
+
+class TestDeadlines(LinkTestCase):
+    def make_card(self, deadlines, frame_support=True):
+        card = LinkTestCase.make_card(self, deadlines, frame_support)
+        # the card gets stuck after being asked to check a balance
+        card.ser.stick_on = lambda msg: msg.endswith('1') if card.framing == 1 else msg[5:-2] == '1'
+        return card
+
+    def test_silent_card_times_out(self):
+        card = self.make_card(Deadlines(reply_timeout=0.5, min_backoff=0.001, max_backoff=0.01))
+        start = time.time()
+        self.assertRaises(DeviceTimeout, card.check_balance, '12345678')
+        self.assertLess(time.time() - start, 1)
+        # the next operation starts over with a full sync
+        self.assertIsNone(card.synced)
+
+    def test_garbage_spends_retry_budget(self):
+        deadlines = Deadlines(reply_timeout=10, retries=4, min_backoff=0.001, max_backoff=0.01)
+        card = self.make_card(deadlines, frame_support=False)
+        card.ser.garbage = '\x01Z'
+        self.assertRaises(DeviceTimeout, card.check_balance, '12345678')
+        self.assertEqual(card.ser.stuck_reads, 2 * deadlines.retries)
+
+    def test_backoff_capped(self):
+        deadlines = Deadlines(min_backoff=0.01, max_backoff=0.05)
+        self.assertEqual([deadlines.backoff(i) for i in range(5)],
+                         [0.01, 0.02, 0.04, 0.05, 0.05])
+
+    def test_atm_fails_fast(self):
+        card = self.make_card(Deadlines(reply_timeout=0.5, min_backoff=0.001, max_backoff=0.01))
+        atm = ATM(None, None, card)
+        start = time.time()
+        self.assertFalse(atm.check_balance('12345678'))
+        self.assertLess(time.time() - start, 1)
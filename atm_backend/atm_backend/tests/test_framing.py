@@ -0,0 +1,82 @@
+from unittest import TestCase
+from ..interface import framing
+from ..interface.framing import FrameReader, frame_header
+import struct
+
+
+class FakeLink(object):
+    """Byte stream that counts reads and times out once drained"""
+    def __init__(self, data):
+        self.data = data
+        self.reads = 0
+
+    def read(self, size):
+        self.reads += 1
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+    def available(self):
+        return len(self.data)
+
+
+def frame(payload):
+    return struct.pack('B', len(payload)) + payload
+
+
+class TestFrameReader(TestCase):
+    def test_one_read_for_many_frames(self):
+        bills = ['Example Bill %d' % n for n in range(20)]
+        link = FakeLink(''.join(frame(bill) for bill in bills))
+        reader = FrameReader(link.read, link.available)
+        self.assertEqual([reader.read_frame().tobytes() for _ in bills], bills)
+        self.assertEqual(link.reads, 1)
+        self.assertEqual(reader.read_frame(), None)
+
+    def test_frames_span_compaction(self):
+        payloads = ['x' * 200, 'y' * 255, '', 'z' * 100] * 5
+        link = FakeLink(''.join(frame(payload) for payload in payloads))
+        reader = FrameReader(link.read, link.available, size=300)
+        for payload in payloads:
+            pkt = reader.read_frame()
+            self.assertFalse(reader.truncated)
+            self.assertEqual(pkt, payload)
+
+    def test_without_available(self):
+        link = FakeLink(frame('OK') + frame('K'))
+        reader = FrameReader(link.read)
+        self.assertEqual(reader.read_frame(), 'OK')
+        self.assertEqual(reader.read_frame(), 'K')
+        self.assertEqual(link.reads, 4)
+
+    def test_truncated(self):
+        link = FakeLink(frame('beefcafe')[:5])
+        reader = FrameReader(link.read, link.available)
+        self.assertEqual(reader.read_frame(), 'beef')
+        self.assertTrue(reader.truncated)
+        self.assertEqual(reader.buffered(), 0)
+
+    def test_extended(self):
+        payloads = ['a' * 254, 'b' * 300, 'c' * 5000, 'd']
+        data = ''.join(frame_header(len(payload), True) + payload for payload in payloads)
+        link = FakeLink(data)
+        reader = FrameReader(link.read, link.available, size=1024)
+        for payload in payloads:
+            pkt = reader.read_frame(extended=True)
+            self.assertFalse(reader.truncated)
+            self.assertEqual(pkt, payload)
+
+        # Without extended frames 0xFF is an ordinary length
+        link = FakeLink(frame('e' * 255))
+        reader = FrameReader(link.read, link.available)
+        self.assertEqual(reader.read_frame(), 'e' * 255)
+
+    def test_v2(self):
+        good = framing.pack_v2(framing.DATA, 7, 'x' * 300)
+        bad = framing.pack_v2(framing.DATA, 8, 'beefcafe')
+        bad = bad[:-3] + 'X' + bad[-2:]
+        link = FakeLink('\x01\x02' + good + bad + framing.pack_v2(framing.NAK, 9))
+        reader = FrameReader(link.read, link.available, size=64)
+        self.assertEqual(reader.read_frame_v2(), (framing.DATA, 7, 'x' * 300))
+        self.assertEqual(reader.read_frame_v2(), (None, None, ''))
+        self.assertEqual(reader.read_frame_v2(), (framing.NAK, 9, ''))
+        self.assertEqual(reader.read_frame_v2(), None)
@@ -0,0 +1,126 @@
+from unittest import TestCase
+from ..interface import hotplug
+import os, shutil, tempfile, time
+from Queue import Empty
+
+
+class TestHotplug(TestCase):
+    def setUp(self):
+        self.dev = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dev)
+
+    def make_monitor(self, **kwargs):
+        monitor = hotplug.HotplugMonitor(paths=[self.dev], **kwargs)
+        self.addCleanup(monitor.close)
+        return monitor
+
+    def list_ports(self):
+        return set(os.path.join(self.dev, name) for name in os.listdir(self.dev))
+
+    def plug(self, name):
+        open(os.path.join(self.dev, name), 'w').close()
+        return os.path.join(self.dev, name)
+
+    def unplug(self, name):
+        os.remove(os.path.join(self.dev, name))
+
+    def check_events(self, monitor):
+        events = monitor.subscribe()
+        port = self.plug('ttyACM0')
+        self.assertEqual(events.get(timeout=2), hotplug.HotplugEvent(hotplug.CONNECTED, port))
+
+        self.unplug('ttyACM0')
+        self.assertEqual(events.get(timeout=2), hotplug.HotplugEvent(hotplug.DISCONNECTED, port))
+
+        monitor.unsubscribe(events)
+        self.plug('ttyACM1')
+        self.assertRaises(Empty, events.get, timeout=.5)
+
+    def test_inotify(self):
+        scans = []
+
+        def list_ports():
+            scans.append(None)
+            return self.list_ports()
+        # Far too slow a poll to see the changes in time, so inotify must
+        monitor = self.make_monitor(list_ports=list_ports, poll_interval=60)
+        self.assertTrue(monitor.inotify is not None)
+        self.check_events(monitor)
+
+        # Without changes nothing is listed again
+        scanned = len(scans)
+        time.sleep(.3)
+        self.assertEqual(len(scans), scanned)
+
+    def test_polling(self):
+        monitor = self.make_monitor(list_ports=self.list_ports, poll_interval=.05,
+                                    use_inotify=False)
+        self.assertTrue(monitor.inotify is None)
+        self.check_events(monitor)
+
+    def test_claim(self):
+        monitor = self.make_monitor(list_ports=self.list_ports)
+        card_events = monitor.subscribe()
+        hsm_events = monitor.subscribe()
+        port = self.plug('ttyACM0')
+        self.assertEqual(card_events.get(timeout=2).port, port)
+        self.assertEqual(hsm_events.get(timeout=2).port, port)
+
+        # Only one subscriber may open the port
+        self.assertTrue(monitor.claim(port))
+        self.assertFalse(monitor.claim(port))
+
+        # Handing it back announces it again
+        monitor.release(port, offer=True)
+        self.assertEqual(hsm_events.get(timeout=2), hotplug.HotplugEvent(hotplug.CONNECTED, port))
+        self.assertTrue(monitor.claim(port))
+
+        # Claims end with the device
+        self.unplug('ttyACM0')
+        self.assertEqual(hsm_events.get(timeout=2).kind, hotplug.DISCONNECTED)
+        self.plug('ttyACM0')
+        self.assertEqual(hsm_events.get(timeout=2).kind, hotplug.CONNECTED)
+        self.assertTrue(monitor.claim(port))
+
+    def test_survives_listing_errors(self):
+        failures = [OSError('listing failed')] * 3
+
+        def list_ports():
+            if failures:
+                raise failures.pop()
+            return self.list_ports()
+        monitor = self.make_monitor(list_ports=self.list_ports, poll_interval=.01,
+                                    use_inotify=False)
+        monitor.list_ports = list_ports
+        events = monitor.subscribe()
+        port = self.plug('ttyACM0')
+        self.assertEqual(events.get(timeout=2), hotplug.HotplugEvent(hotplug.CONNECTED, port))
+        self.assertEqual(failures, [])
+
+    def test_falls_back_to_polling(self):
+        monitor = self.make_monitor(list_ports=self.list_ports, poll_interval=.01)
+        events = monitor.subscribe()
+
+        def broken_wait(timeout=None):
+            raise OSError('inotify read failed')
+        monitor.inotify.wait = broken_wait
+        # Wakes the thread, which then only finds the broken wait
+        self.plug('ttyACM0')
+        self.assertEqual(events.get(timeout=2).kind, hotplug.CONNECTED)
+        deadline = time.time() + 2
+        while monitor.inotify is not None and time.time() < deadline:
+            time.sleep(.01)
+        self.assertTrue(monitor.inotify is None)
+
+        # Changes are still seen by polling
+        port = self.plug('ttyACM1')
+        self.assertEqual(events.get(timeout=2), hotplug.HotplugEvent(hotplug.CONNECTED, port))
+
+    def test_close(self):
+        for use_inotify in (True, False):
+            monitor = hotplug.HotplugMonitor(paths=[self.dev], list_ports=self.list_ports,
+                                             poll_interval=10, use_inotify=use_inotify)
+            start = time.time()
+            monitor.close()
+            self.assertFalse(monitor.thread.is_alive())
+            self.assertLess(time.time() - start, 1)
@@ -0,0 +1,86 @@
+import threading
+import time
+from unittest import TestCase
+from .. import ATM
+from ..interface import hotplug
+from ..interface.psoc import Psoc
+from ..interface.serial_emulator import CardEmulator, PtyEmulator
+
+
+class TestInsertion(TestCase):
+    def setUp(self):
+        self.ports = set()
+        self.monitor = hotplug.HotplugMonitor(list_ports=lambda: set(self.ports),
+                                              poll_interval=.01, use_inotify=False)
+        self.addCleanup(self.monitor.close)
+        self.card = Psoc('CARD', None, False, monitor=self.monitor)
+        self.atm = ATM(None, None, self.card)
+
+    def insert(self):
+        pty = PtyEmulator(CardEmulator())
+        self.addCleanup(pty.close)
+        self.ports.add(pty.path)
+
+    def test_wait_times_out(self):
+        start = time.time()
+        self.assertFalse(self.atm.wait_for_card(.2))
+        self.assertLess(time.time() - start, 1)
+        self.assertFalse(self.card.connected)
+
+    def test_wakes_on_insert(self):
+        inserted = []
+        waiter = threading.Thread(target=lambda: inserted.append(self.atm.wait_for_card(5)))
+        waiter.start()
+        time.sleep(.1)
+        start = time.time()
+        self.insert()
+        waiter.join(5)
+        self.assertEqual(inserted, [True])
+        # Well under the old 2 s HSM poll, most of it the connect sync
+        self.assertLess(time.time() - start, 1)
+        self.assertTrue(self.card.wait_for_insert(0))
+
+    def test_cleared_on_removal(self):
+        self.insert()
+        self.assertTrue(self.card.wait_for_insert(5))
+        self.ports.clear()
+        deadline = time.time() + 2
+        while self.card.connected and time.time() < deadline:
+            time.sleep(.01)
+        self.assertFalse(self.card.connected)
+        self.assertFalse(self.atm.wait_for_card(.05))
+
+    def test_removed_while_connecting(self):
+        test = self
+
+        class PulledPsoc(Psoc):
+            pulled = []
+
+            def _sync_once(self, names):
+                if not self.pulled:
+                    # Pull the first card out mid-sync
+                    self.pulled.append(self.port)
+                    ports.discard(self.port)
+                    test.first.close()
+                return Psoc._sync_once(self, names)
+
+        # Ports and a monitor of its own, so the card from setUp never
+        # opens the same emulator
+        ports = set()
+        monitor = hotplug.HotplugMonitor(list_ports=lambda: set(ports),
+                                         poll_interval=.01, use_inotify=False)
+        self.addCleanup(monitor.close)
+        card = PulledPsoc('CARD', None, False, monitor=monitor)
+        self.first = PtyEmulator(CardEmulator())
+        ports.add(self.first.path)
+        deadline = time.time() + 2
+        while not PulledPsoc.pulled and time.time() < deadline:
+            time.sleep(.01)
+        self.assertEqual(PulledPsoc.pulled, [self.first.path])
+        self.assertFalse(card.wait_for_insert(.3))
+
+        # The watcher is still running and takes the next card
+        pty = PtyEmulator(CardEmulator())
+        self.addCleanup(pty.close)
+        ports.add(pty.path)
+        self.assertTrue(card.wait_for_insert(5))
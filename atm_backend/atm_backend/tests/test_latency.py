@@ -0,0 +1,67 @@
+import time
+from unittest import TestCase
+from .. import ATM, DummyBank, DummyCard, DummyHSM, LatencyStats
+from ..interface import latency
+
+
+class SlowBank(DummyBank):
+    def withdraw(self, hsm_id, card_id, amount):
+        time.sleep(.05)
+        return hsm_id
+
+
+class TestLatency(TestCase):
+    def make_atm(self, stats):
+        card = DummyCard(latency=stats)
+        card.initialize()
+        hsm = DummyHSM(provision=True, latency=stats)
+        hsm.initialize()
+        self.assertTrue(hsm.provision('beefcafebeefcafe', ['Example Bill %d' % n for n in range(8)]))
+        return ATM(SlowBank(), hsm, card, latency=stats)
+
+    def test_withdraw_phases(self):
+        atm = self.make_atm(LatencyStats())
+        self.assertEqual(atm.withdraw('12345678', 1), ['Example Bill 0'])
+        self.assertEqual(atm.check_balance('12345678'), 2018)
+        stats = atm.stats()
+        for phase in ('withdraw', 'withdraw.card', 'withdraw.hsm_uuid', 'withdraw.bank',
+                      'withdraw.dispense', 'card.sync', 'card.auth', 'hsm.sync',
+                      'check_balance', 'check_balance.card', 'check_balance.bank'):
+            self.assertIn(phase, stats)
+        self.assertEqual(stats['card.auth']['count'], 2)
+        self.assertGreaterEqual(stats['withdraw.bank']['p50'], 50)
+        self.assertGreaterEqual(stats['withdraw']['max'], stats['withdraw.bank']['max'])
+
+    def test_percentiles(self):
+        stats = LatencyStats(window=100)
+        for ms in range(1, 201):
+            stats.record('phase', ms / 1000.0)
+        summary = stats.summary()['phase']
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['p50'], 150)
+        self.assertAlmostEqual(summary['p95'], 195)
+        self.assertAlmostEqual(summary['p99'], 199)
+        self.assertAlmostEqual(summary['max'], 200)
+
+    def test_disabled(self):
+        atm = self.make_atm(None)
+        self.assertEqual(atm.withdraw('12345678', 1), ['Example Bill 0'])
+        self.assertEqual(atm.stats(), {})
+
+    def test_monotonic(self):
+        start = latency.monotonic()
+        time.sleep(.01)
+        self.assertGreaterEqual(latency.monotonic() - start, .01)
+
+    def test_unknown_platform(self):
+        self.assertIs(latency._monotonic_clock('plan9'), time.time)
+
+    def test_clock_failure_not_raised(self):
+        def broken():
+            raise OSError(22, 'clock_gettime failed')
+        self.addCleanup(setattr, latency, 'monotonic', latency.monotonic)
+        latency.monotonic = broken
+        stats = LatencyStats()
+        with stats.span('phase'):
+            pass
+        self.assertEqual(stats.summary(), {})
@@ -0,0 +1,61 @@
+import logging
+import threading
+from unittest import TestCase
+from .. import log_queue
+from ..interface.psoc import Psoc
+
+
+class ListHandler(logging.Handler):
+    def __init__(self, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.messages = []
+        self.threads = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+        self.threads.append(threading.current_thread().name)
+
+
+class Unformattable(object):
+    def __str__(self):
+        raise AssertionError('formatted a message nobody logs')
+
+
+class TestLogQueue(TestCase):
+    def setUp(self):
+        self.log = logging.getLogger('test_log_queue')
+        self.log.propagate = False
+        self.log.setLevel(logging.DEBUG)
+        self.addCleanup(setattr, self.log, 'handlers', [])
+
+    def test_written_on_listener(self):
+        target = ListHandler(logging.INFO)
+        listener = log_queue.start_queue_logging(self.log, [target])
+        buf = bytearray('first')
+        self.log.debug('below the handler level')
+        self.log.info('read %s', buf)
+        buf[:] = 'later'
+        self.log.info('sent %d bills', 2)
+        listener.stop()
+        self.assertEqual(target.messages, ['read first', 'sent 2 bills'])
+        self.assertEqual(set(target.threads), set(['log-listener']))
+
+    def test_drops_when_full(self):
+        drops = []
+        queue_handler = log_queue.QueueLogHandler(capacity=2, on_drop=lambda: drops.append(None))
+        self.log.addHandler(queue_handler)
+        for n in range(5):
+            self.log.info('record %d', n)
+        self.assertEqual(queue_handler.dropped, 3)
+        self.assertEqual(len(drops), 3)
+
+        target = ListHandler()
+        listener = log_queue.QueueLogListener(queue_handler, [target])
+        listener.start()
+        listener.stop()
+        self.assertEqual(sorted(target.messages), ['Log queue full, dropped 3 records (3 in total)',
+                                                   'record 0', 'record 1'])
+
+    def test_vp_is_lazy(self):
+        psoc = Psoc('CARD', None, False)
+        psoc._vp('got %s', Unformattable())
@@ -0,0 +1,73 @@
+from unittest import TestCase
+from .. import ATM, DummyBank, DummyCard, DummyHSM, Pacing
+import time
+
+
+class CountingPacing(Pacing):
+    """Pacing that counts the frames sent and those held back by a gap"""
+    def __init__(self, mode):
+        Pacing.__init__(self, mode, delay=0)
+        self.pushed = 0
+        self.held = 0
+
+    def before_push(self):
+        if self.mode == 'ack' and self.unanswered:
+            self.held += 1
+        Pacing.before_push(self)
+
+    def after_push(self):
+        self.pushed += 1
+        Pacing.after_push(self)
+
+
+class TestPacing(TestCase):
+    def make_atm(self, mode):
+        """ATM on emulated devices whose frames are paced in mode"""
+        card = DummyCard(pacing=CountingPacing(mode))
+        card.initialize()
+        hsm = DummyHSM(provision=True, pacing=CountingPacing(mode))
+        hsm.initialize()
+        self.assertTrue(hsm.provision('beefcafebeefcafe', ['Example Bill %d' % n for n in range(8)]))
+        return ATM(DummyBank(), hsm, card)
+
+    def frames(self, atm, transactions=3):
+        """frames sent and held back by card and HSM over check_balance and
+        withdraw of 2 bills"""
+        card, hsm = atm.card.pacing, atm.hsm.pacing
+        card.pushed = card.held = hsm.pushed = hsm.held = 0
+        for _ in range(transactions):
+            self.assertEqual(atm.check_balance('12345678'), 2018)
+        for _ in range(transactions):
+            self.assertEqual(len(atm.withdraw('12345678', 2)), 2)
+        return (card.pushed, card.held), (hsm.pushed, hsm.held)
+
+    def test_frames_held(self):
+        fixed = self.frames(self.make_atm('fixed'))
+        ack = self.frames(self.make_atm('ack'))
+        # The same frames go out, but in ack mode only the PIN, which
+        # follows the unanswered GO, waits for the gap
+        self.assertEqual([pushed for pushed, _ in ack], [pushed for pushed, _ in fixed])
+        self.assertEqual([held for _, held in ack], [6, 0])
+
+    def test_adaptive_gap(self):
+        pacing = Pacing(min_gap=0.002, max_gap=0.05)
+        for _ in range(10):
+            pacing.after_pull(False)
+        self.assertEqual(pacing.gap, 0.05)
+
+        # An unanswered frame holds back the next one by the gap
+        pacing.after_push()
+        start = time.time()
+        pacing.before_push()
+        self.assertTrue(time.time() - start >= 0.04)
+
+        # An answered frame does not
+        pacing.after_push()
+        pacing.after_pull(True)
+        start = time.time()
+        pacing.before_push()
+        self.assertTrue(time.time() - start < 0.01)
+
+        for _ in range(50):
+            pacing.after_pull(True)
+        self.assertEqual(pacing.gap, 0.002)
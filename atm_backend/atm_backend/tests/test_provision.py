@@ -0,0 +1,39 @@
+from .helpers import LinkTestCase
+
+BILLS = ['Example Bill %d' % n for n in range(128)]
+
+
+class TestProvision(LinkTestCase):
+    def check_bills(self, hsm):
+        self.assertEqual(hsm.withdraw(hsm.get_uuid(), len(BILLS)), BILLS)
+
+    def provision(self, hsm):
+        self.assertTrue(hsm.provision('beefcafebeefcafe', BILLS))
+
+    def test_in_flight(self):
+        for window, window_support, widest in ((8, False, 1), (8, True, 8), (4, True, 4)):
+            hsm = self.make_hsm(window=window, window_support=window_support)
+            self.provision(hsm)
+            # Bills go out without waiting for acks up to the window
+            self.assertEqual((hsm.ser.widest, hsm.ser.in_flight), (widest, 0))
+
+    def test_windowed(self):
+        hsm = self.make_hsm()
+        self.provision(hsm)
+        self.assertTrue(hsm.clean)
+        self.check_bills(hsm)
+
+    def test_legacy_firmware(self):
+        hsm = self.make_hsm(window_support=False)
+        self.provision(hsm)
+        self.check_bills(hsm)
+
+    def test_resend_missed_bill(self):
+        # Version 2 frames would recover the bill before provisioning sees
+        # it missing
+        hsm = self.make_hsm(frame_support=False)
+        # Lose bill 5 the first time it is sent
+        hsm.ser.drop_write = lambda msg: msg[2:] == BILLS[5]
+        self.provision(hsm)
+        self.assertIsNone(hsm.ser.drop_write)
+        self.check_bills(hsm)
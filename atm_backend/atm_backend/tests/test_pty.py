@@ -0,0 +1,64 @@
+import time
+from unittest import TestCase
+from .. import Card, HSM
+from ..interface.serial_emulator import CardEmulator, HSMEmulator, PtyEmulator
+
+
+class TestPty(TestCase):
+    def make_card(self, **shaping):
+        pty = PtyEmulator(CardEmulator(), **shaping)
+        self.addCleanup(pty.close)
+        card = Card(port=pty.path)
+        card.initialize()
+        self.addCleanup(card.ser.close)
+        return card
+
+    def test_card(self):
+        card = self.make_card()
+        self.assertTrue(card.connected)
+        self.assertEqual(card.framing, 1)
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertEqual(card.framing, 2)
+        self.assertFalse(card.check_balance('00000000'))
+        self.assertTrue(card.change_pin('12345678', '87654321'))
+        self.assertEqual(card.withdraw('87654321'), '0123456789abcdef')
+
+    def test_hsm(self):
+        pty = PtyEmulator(HSMEmulator(provision=True))
+        self.addCleanup(pty.close)
+        hsm = HSM(port=pty.path)
+        hsm.initialize()
+        self.addCleanup(hsm.ser.close)
+        bills = ['Example Bill %d' % n for n in range(40)]
+        self.assertTrue(hsm.provision('beefcafebeefcafe', bills))
+        self.assertEqual(hsm.withdraw(hsm.get_uuid(), 30), bills[:30])
+
+    def test_latency(self):
+        fast = self.make_card()
+        start = time.time()
+        fast.check_balance('12345678')
+        fast_time = time.time() - start
+
+        slow = self.make_card(baudrate=9600, latency=.01)
+        start = time.time()
+        slow.check_balance('12345678')
+        # At least a round trip per frame exchanged
+        self.assertGreater(time.time() - start, fast_time + .06)
+
+    def test_close_stops_reader(self):
+        pty = PtyEmulator(CardEmulator())
+        pty.close()
+        pty.reader.join(2)
+        self.assertFalse(pty.reader.is_alive())
+        # Closing again does nothing
+        pty.close()
+
+    def test_closed_emulator(self):
+        emulator = CardEmulator()
+        pty = PtyEmulator(emulator)
+        self.addCleanup(pty.close)
+        emulator.close_on_sync = True
+        # Wake the reader from its wait for a sync
+        emulator.write('\x01\x00')
+        pty.reader.join(2)
+        self.assertFalse(pty.reader.is_alive())
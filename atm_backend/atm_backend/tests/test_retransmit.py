@@ -0,0 +1,50 @@
+from .helpers import LinkTestCase
+
+
+class TestRetransmit(LinkTestCase):
+    def test_negotiated(self):
+        card = self.make_card()
+        self.assertEqual(card.framing, 2)
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+
+    def test_legacy_firmware(self):
+        card = self.make_card(frame_support=False)
+        self.assertEqual(card.framing, 1)
+        for _ in range(3):
+            self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertEqual(card.ser.syncs, 0)
+
+    def test_corrupt_to_psoc(self):
+        card = self.make_card()
+        card.ser.corrupt_write = lambda msg: '12345678' in msg
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertTrue(card.clean)
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertEqual(card.ser.syncs, 0)
+
+    def test_corrupt_from_psoc(self):
+        card = self.make_card()
+        card.ser.corrupt_read = lambda data: '0123456789abcdef' in data
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertTrue(card.clean)
+        self.assertEqual(card.ser.naks, 1)
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertEqual(card.ser.syncs, 0)
+
+    def test_lost_from_psoc(self):
+        card = self.make_card()
+        card.ser.drop_read = lambda data: data.endswith('OK' + data[-2:])
+        self.assertEqual(card.change_pin('12345678', '87654321'), True)
+        self.assertEqual(card.check_balance('87654321'), '0123456789abcdef')
+        self.assertEqual(card.ser.syncs, 0)
+
+    def test_bill_overtaken(self):
+        bills = ['Example Bill %d' % n for n in range(8)]
+        hsm = self.make_hsm(bills, batch_support=False)
+        hsm.ser.drop_read = lambda data: 'Example Bill 1' in data
+        self.assertEqual(hsm.withdraw(hsm.get_uuid(), 4), bills[:4])
+        self.assertTrue(hsm.clean)
+        self.assertEqual(hsm.withdraw(hsm.get_uuid(), 4), bills[4:])
+        # Provisioning does not start a session, so only the first
+        # withdrawal syncs
+        self.assertEqual(hsm.ser.syncs, 1)
@@ -0,0 +1,81 @@
+import threading
+import time
+import xmlrpclib
+from unittest import TestCase
+from ..scheduler import DeviceScheduler, ThreadedXMLRPCServer
+
+
+class TestScheduler(TestCase):
+    def setUp(self):
+        self.scheduler = DeviceScheduler()
+        self.release = threading.Event()
+        self.order = []
+
+    def blocking(self, name):
+        def call():
+            self.order.append(name)
+            self.release.wait()
+            return name
+        call.__name__ = name
+        return call
+
+    def run_call(self, func):
+        thread = threading.Thread(target=func)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def wait_depth(self, device, depth):
+        deadline = time.time() + 2
+        while self.scheduler.queue_depth()[device] != depth and time.time() < deadline:
+            time.sleep(.005)
+        self.assertEqual(self.scheduler.queue_depth()[device], depth)
+
+    def test_serialized_per_device(self):
+        withdraw = self.scheduler.wrap(self.blocking('withdraw'), 'card', 'hsm')
+        balance = self.scheduler.wrap(self.blocking('balance'), 'card')
+        provision = self.scheduler.wrap(self.blocking('provision'), 'hsm')
+        threads = [self.run_call(withdraw)]
+        self.wait_depth('card', 1)
+        threads.append(self.run_call(balance))
+        self.wait_depth('card', 2)
+        threads.append(self.run_call(provision))
+        self.wait_depth('hsm', 2)
+        self.assertEqual(self.order, ['withdraw'])
+
+        self.release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(self.order[0], 'withdraw')
+        self.assertEqual(sorted(self.order[1:]), ['balance', 'provision'])
+        self.assertEqual(self.scheduler.queue_depth(), {'card': 0, 'hsm': 0})
+
+    def test_first_come_first_served(self):
+        calls = [self.scheduler.wrap(self.blocking('call%d' % n), 'card') for n in range(4)]
+        threads = []
+        for depth, call in enumerate(calls):
+            threads.append(self.run_call(call))
+            self.wait_depth('card', depth + 1)
+        self.release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(self.order, ['call0', 'call1', 'call2', 'call3'])
+
+    def test_status_calls_not_blocked(self):
+        server = ThreadedXMLRPCServer(('127.0.0.1', 0), logRequests=False)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        server.register_function(self.scheduler.wrap(self.blocking('withdraw'), 'card', 'hsm'))
+        server.register_function(lambda: 'hello', 'hello')
+        server.register_function(self.scheduler.queue_depth)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:%d' % server.server_address[1]
+
+        self.run_call(lambda: xmlrpclib.ServerProxy(url).withdraw())
+        self.wait_depth('hsm', 1)
+        proxy = xmlrpclib.ServerProxy(url)
+        self.assertEqual(proxy.hello(), 'hello')
+        self.assertEqual(proxy.queue_depth(), {'card': 1, 'hsm': 1})
+        self.release.set()
@@ -0,0 +1,62 @@
+from unittest import TestCase
+from .. import DummyCard, DummyHSM
+
+
+def count_syncs(psoc):
+    """wrap psoc's emulator so READY messages sent to it are counted"""
+    write = psoc.ser.write
+    psoc.syncs = 0
+
+    def counting_write(msg):
+        if msg[1:].startswith('READY'):
+            psoc.syncs += 1
+        write(msg)
+    psoc.ser.write = counting_write
+
+
+class TestSession(TestCase):
+    def test_card_session(self):
+        card = DummyCard()
+        card.initialize()
+        count_syncs(card)
+        for _ in range(3):
+            self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertTrue(card.resumable)
+        self.assertFalse(card.check_balance('00000000'))
+        self.assertEqual(card.withdraw('12345678'), '0123456789abcdef')
+        self.assertEqual(card.syncs, 1)
+
+    def test_hsm_session(self):
+        hsm = DummyHSM(provision=True)
+        hsm.initialize()
+        self.assertTrue(hsm.provision('beefcafebeefcafe', ['Example Bill %d' % n for n in range(8)]))
+        count_syncs(hsm)
+        for _ in range(3):
+            self.assertEqual(len(hsm.withdraw(hsm.get_uuid(), 2)), 2)
+        self.assertEqual(hsm.withdraw(hsm.get_uuid(), 5), 'Not enough bills in ATM')
+        self.assertEqual(hsm.withdraw(hsm.get_uuid(), 1), ['Example Bill 6'])
+        self.assertEqual(hsm.syncs, 1)
+
+    def test_resync_after_error(self):
+        card = DummyCard()
+        card.initialize()
+        count_syncs(card)
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+
+        # A frame that timed out means the card may not be at its sync point
+        card.clean = False
+        card._op_done()
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertEqual(card.syncs, 2)
+        self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertEqual(card.syncs, 2)
+
+    def test_legacy_device(self):
+        card = DummyCard()
+        card.port.session_support = False
+        card.initialize()
+        count_syncs(card)
+        self.assertFalse(card.resumable)
+        for _ in range(3):
+            self.assertEqual(card.check_balance('12345678'), '0123456789abcdef')
+        self.assertEqual(card.syncs, 3)
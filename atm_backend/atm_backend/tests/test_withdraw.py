@@ -0,0 +1,91 @@
+from unittest import TestCase
+from .. import ATM, DummyBank, DummyCard, DummyHSM, Pacing
+import struct
+import threading
+
+
+class TestWithdraw(TestCase):
+    def setUp(self):
+        self.card = DummyCard()
+        self.card.initialize()
+        self.hsm = DummyHSM(provision=True)
+        self.hsm.initialize()
+        self.assertTrue(self.hsm.provision('beefcafebeefcafe', ['Example Bill %d' % n for n in range(8)]))
+        self.atm = ATM(DummyBank(), self.hsm, self.card)
+
+    def test_legs_overlap(self):
+        # Each leg waits to see the other one running, which only
+        # happens if neither waits for the other to finish first
+        card_running = threading.Event()
+        hsm_running = threading.Event()
+        overlapped = []
+        card_withdraw = self.card.withdraw
+        hsm_get_uuid = self.hsm.get_uuid
+
+        def card_leg(pin):
+            card_running.set()
+            overlapped.append(('card', hsm_running.wait(2)))
+            return card_withdraw(pin)
+
+        def hsm_leg():
+            hsm_running.set()
+            overlapped.append(('hsm', card_running.wait(2)))
+            return hsm_get_uuid()
+        self.card.withdraw = card_leg
+        self.hsm.get_uuid = hsm_leg
+        self.assertFalse(self.atm.withdraw('00000000', 2))
+        self.assertEqual(sorted(overlapped), [('card', True), ('hsm', True)])
+
+    def test_rejected_pin_cancels_hsm(self):
+        self.assertFalse(self.atm.withdraw('00000000', 2))
+        self.assertFalse(self.atm.withdraw('00000000', 2))
+        self.assertEqual(self.atm.withdraw('12345678', 2), ['Example Bill 0', 'Example Bill 1'])
+        self.assertEqual(self.atm.withdraw('12345678', 1), ['Example Bill 2'])
+
+    def test_card_error_cancels_hsm(self):
+        def broken_withdraw(pin):
+            raise struct.error('unpack requires a string argument of length 36')
+        self.card.withdraw = broken_withdraw
+        self.assertRaises(struct.error, self.atm.withdraw, '12345678', 2)
+        del self.card.withdraw
+        # The HSM was cancelled, so the next withdrawal starts in sync
+        self.assertEqual(self.atm.withdraw('12345678', 2), ['Example Bill 0', 'Example Bill 1'])
+
+
+class TestBatchDispense(TestCase):
+    def make_hsm(self, bills, batch_support=True):
+        hsm = DummyHSM(provision=True)
+        hsm.port.batch_support = batch_support
+        # Extended length headers only exist in legacy frames
+        hsm.port.frame_support = False
+        hsm.port.batch_limit = 300
+        hsm.initialize()
+        self.assertTrue(hsm.provision('beefcafebeefcafe', bills))
+        return hsm
+
+    def count_frames(self, hsm):
+        read = hsm.ser.read
+        hsm.frames = 0
+
+        def counting_read(*args, **kwargs):
+            hsm.frames += 1
+            return read(*args, **kwargs)
+        hsm.ser.read = counting_read
+
+    def test_batches(self):
+        bills = ['Example Bill %d' % n for n in range(40)]
+        hsm = self.make_hsm(bills)
+        hsm.get_uuid()
+        self.count_frames(hsm)
+        self.assertEqual(hsm.withdraw('beefcafebeefcafe', 40), bills)
+        # 2 reads for each of the UUID reply, the count reply and 3 batches
+        self.assertEqual(hsm.frames, 10)
+        self.assertTrue(hsm.clean)
+
+    def test_legacy_firmware(self):
+        bills = ['Example Bill %d' % n for n in range(10)]
+        hsm = self.make_hsm(bills, batch_support=False)
+        hsm.get_uuid()
+        self.assertEqual(hsm.withdraw('beefcafebeefcafe', 4), bills[:4])
+        hsm.get_uuid()
+        self.assertEqual(hsm.withdraw('beefcafebeefcafe', 6), bills[4:])
@@ -0,0 +1,8 @@
+"""Benchmarks of the ATM backend
+
+Each module times one part of the ATM on the emulated card and HSM and
+prints what it measured. They are not tests and assert nothing; run one
+from the atm_backend directory, for example:
+
+    python -m bench.pacing
+"""
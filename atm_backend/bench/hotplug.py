@@ -0,0 +1,51 @@
+"""Connect latency of hotplug detection
+
+Prints how long it takes from a port appearing in a scratch directory to
+its CONNECTED event, watched with inotify and by polling.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from atm_backend.interface import hotplug
+
+
+def connect_latency(dev, monitor, plugs):
+    """average seconds from creating a port to its CONNECTED event"""
+    events = monitor.subscribe()
+    total = 0
+    for num in range(plugs):
+        port = os.path.join(dev, 'ttyACM%d' % num)
+        start = time.time()
+        open(port, 'w').close()
+        while events.get(timeout=2) != hotplug.HotplugEvent(hotplug.CONNECTED, port):
+            pass
+        total += time.time() - start
+        os.remove(port)
+    monitor.unsubscribe(events)
+    return total / plugs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--plugs', type=int, default=10)
+    parser.add_argument('--poll-interval', type=float, default=.25)
+    args = parser.parse_args()
+
+    for use_inotify in (True, False):
+        dev = tempfile.mkdtemp()
+        monitor = hotplug.HotplugMonitor(
+            paths=[dev], poll_interval=args.poll_interval, use_inotify=use_inotify,
+            list_ports=lambda: set(os.path.join(dev, name) for name in os.listdir(dev)))
+        try:
+            latency = connect_latency(dev, monitor, args.plugs)
+        finally:
+            monitor.close()
+            shutil.rmtree(dev)
+        print '%s connect latency %.1fms' % ('inotify' if use_inotify else 'polling', latency * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Transaction latency with fixed and ack pacing
+
+Prints how long check_balance and a withdrawal of 2 bills take on emulated
+devices whose frames are paced with a fixed sleep and on replies.
+"""
+
+import argparse
+import time
+from atm_backend import ATM, DummyBank, DummyCard, DummyHSM, Pacing
+
+
+def make_atm(mode):
+    """ATM on emulated devices whose frames are paced in mode"""
+    card = DummyCard(pacing=Pacing(mode))
+    card.initialize()
+    hsm = DummyHSM(provision=True, pacing=Pacing(mode))
+    hsm.initialize()
+    hsm.provision('beefcafebeefcafe', ['Example Bill %d' % n for n in range(128)])
+    return ATM(DummyBank(), hsm, card)
+
+
+def latency(atm, transactions):
+    """seconds per check_balance and per withdraw of 2 bills"""
+    start = time.time()
+    for _ in range(transactions):
+        atm.check_balance('12345678')
+    check_balance = (time.time() - start) / transactions
+
+    start = time.time()
+    for _ in range(transactions):
+        atm.withdraw('12345678', 2)
+    withdraw = (time.time() - start) / transactions
+    return check_balance, withdraw
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=3)
+    args = parser.parse_args()
+
+    fixed = latency(make_atm('fixed'), args.transactions)
+    ack = latency(make_atm('ack'), args.transactions)
+    print 'check_balance: fixed %.1fms, ack %.1fms' % (fixed[0] * 1000, ack[0] * 1000)
+    print 'withdraw: fixed %.1fms, ack %.1fms' % (fixed[1] * 1000, ack[1] * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""HSM provisioning time with and without a window of unacked bills
+
+Prints how long provisioning 128 bills takes when every bill waits for its
+ack and when up to a window of bills is in flight, over an emulated link
+with a given round trip time.
+"""
+
+import argparse
+import collections
+import time
+from atm_backend import DummyHSM
+
+BILLS = ['Example Bill %d' % n for n in range(128)]
+
+
+class LatencyLink(object):
+    """Delays each reply of an emulated PSoC until rtt seconds after the
+    frame it answers was written, like a link with that round trip time"""
+    def __init__(self, ser, rtt):
+        self.ser = ser
+        self.rtt = rtt
+        self.due = collections.deque()
+
+    def write(self, msg):
+        # GO is the only frame the PSoC does not answer
+        if not msg[1:].startswith('GO'):
+            self.due.append(time.time() + self.rtt)
+        self.ser.write(msg)
+
+    def read(self, *args, **kwargs):
+        if self.ser.next_state != self.ser._send_msg_body and self.due:
+            time.sleep(max(0, self.due.popleft() - time.time()))
+        return self.ser.read(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+
+def provision_time(window, window_support, rtt):
+    """seconds taken to provision BILLS"""
+    hsm = DummyHSM(provision=True, window=window)
+    hsm.port.window_support = window_support
+    hsm.initialize()
+    hsm.ser = LatencyLink(hsm.ser, rtt)
+    start = time.time()
+    hsm.provision('beefcafebeefcafe', BILLS)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--window', type=int, default=8)
+    parser.add_argument('--rtt', type=float, default=.005)
+    args = parser.parse_args()
+
+    legacy = provision_time(args.window, False, args.rtt)
+    windowed = provision_time(args.window, True, args.rtt)
+    print '%d bills: ack each %.0fms, window of %d %.0fms' % (len(BILLS), legacy * 1000,
+                                                             args.window, windowed * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Time of each leg of a withdrawal
+
+Prints how long the card PIN check and the HSM handshake take on their own
+and how long a withdrawal running both takes, on emulated devices slowed
+down by fixed pacing.
+"""
+
+import argparse
+import time
+from atm_backend import ATM, DummyBank, DummyCard, DummyHSM, Pacing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frame-delay', type=float, default=.02)
+    args = parser.parse_args()
+
+    card = DummyCard(pacing=Pacing('fixed', delay=args.frame_delay))
+    card.initialize()
+    hsm = DummyHSM(provision=True, pacing=Pacing('fixed', delay=args.frame_delay))
+    hsm.initialize()
+    hsm.provision('beefcafebeefcafe', ['Example Bill %d' % n for n in range(8)])
+    atm = ATM(DummyBank(), hsm, card)
+
+    start = time.time()
+    card.withdraw('00000000')
+    card_leg = time.time() - start
+
+    start = time.time()
+    hsm.get_uuid()
+    hsm.cancel()
+    hsm_leg = time.time() - start
+
+    # A rejected PIN runs both legs without dispensing
+    start = time.time()
+    atm.withdraw('00000000', 2)
+    both = time.time() - start
+    print 'card %.1fms, hsm %.1fms, withdraw %.1fms' % (card_leg * 1000, hsm_leg * 1000, both * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 'create package bank_server'
 
-from .db import DB
+from .db import DB, open_db
 from .admin_backend import AdminBackend
 from .bank import Bank
@@ -9,7 +9,9 @@ import threading
 import logging
 from logging import handlers
 import yaml
-from . import Bank, AdminBackend
+from . import Bank, AdminBackend, open_db
+from .metrics import serve_metrics, LOG_RECORDS_DROPPED
+from .log_queue import start_queue_logging
 
 
 def main():
@@ -17,9 +19,7 @@ def main():
         main:
             - load configuration yaml
             - initialize logging
-            - create database mutex
-            - start admin interface daemon thread
-            - start bank interface
+            - serve admin and bank interfaces
     """
     # Load configuartion from yaml
     config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
@@ -33,24 +33,50 @@ def main():
 
     ch = logging.StreamHandler(sys.stdout)
     ch.setFormatter(log_format)
-    log.addHandler(ch)
+    log_handlers = [ch]
 
     if config['verbose']:
         log_path = os.path.dirname(__file__) + config['logging']['log_path']
         fh = handlers.RotatingFileHandler("%s/%s.log" % (log_path, config['logging']['log_name']), backupCount=7)
         fh.setFormatter(log_format)
-        log.addHandler(fh)
+        log_handlers.append(fh)
+
+    # Request threads only queue records, the listener thread writes them out
+    start_queue_logging(log, log_handlers, int(config['logging'].get('queue_size', 10000)),
+                        on_drop=LOG_RECORDS_DROPPED.inc)
 
     logging.info('Config loaded and logging initialized')
 
-    # Create db mutex for use by admin and bank backends
-    db_mutex = threading.Lock()
+    serve(config)
+
+
+def serve(config):
+    """
+        serve:
+            - open database shared by admin and bank backends
+            - start metrics endpoint if configured
+            - start admin interface daemon thread
+            - start bank interface
+    """
+    # Create db for use by admin and bank backends. Sharing one DB funnels
+    # the writes of both through its single writer thread and keeps its
+    # cache coherent across both.
+    db_obj = open_db(config)
     ready_event = threading.Event()
-    thread_obj = threading.Thread(target=AdminBackend, args=(config, db_mutex, ready_event))
+
+    # Metrics are served on their own port and read without touching the
+    # database, so a scrape never waits on the bank or admin interface
+    metrics_config = config.get('metrics') or {}
+    if metrics_config.get('port'):
+        serve_metrics((metrics_config.get('host', '0.0.0.0'), int(metrics_config['port'])))
+        logging.info('metrics listening on port %s', metrics_config['port'])
+
+    thread_obj = threading.Thread(target=AdminBackend, args=(config, ready_event),
+                                  kwargs={'db_obj': db_obj})
     thread_obj.daemon = True
     thread_obj.start()
 
-    Bank(config, db_mutex, ready_event)
+    Bank(config, ready_event, db_obj=db_obj)
 
 
 if __name__ == "__main__":
@@ -63,52 +63,122 @@ running in your Bank Server.
             xmlrpclib base64:: ATM provisioning material on Success.
             bool: False otherwise.
         ------------------------------------------------------------------------
+
+The following batch functions are also exposed. Each runs as one database
+transaction per shard and returns a list with one result per item, the same
+result the single item function above would give. A batch of more than
+admin.max_batch items (1000 unless configured) is refused with False.
+system.multicall is supported as well.
+
+        ------------------------------------------------------------------------
+        function:
+            create_accounts
+
+        args:
+            param1 (list): [AccountName, Starting account balance] pairs
+
+        returns:
+            list: create_account result for each pair
+        ------------------------------------------------------------------------
+        function:
+            update_balances
+
+        args:
+            param1 (list): [AccountName, new account balance] pairs
+
+        returns:
+            list: update_balance result for each pair
+        ------------------------------------------------------------------------
+        function:
+            check_balances
+
+        args:
+            param1 (list): AccountNames
+
+        returns:
+            list: check_balance result for each AccountName
+        ------------------------------------------------------------------------
+        function:
+            create_atms
+
+        args:
+            param1 (int): number of ATMs to create
+
+        returns:
+            list: create_atm result for each ATM
+        ------------------------------------------------------------------------
 """
 
 import uuid
 import logging
 import xmlrpclib
 from SimpleXMLRPCServer import SimpleXMLRPCServer
-from . import DB
+from . import open_db
+from .metrics import instrument
+
+# Counts and times admin calls, which fail by returning False. Batch calls
+# report each item's failure in their result list instead.
+admin_rpc = instrument('admin', lambda result: result is False)
 
 
 class AdminBackend(object):
     """ Implemenation of Admin Interface fulfilling competition requirements
 
     The methods create_account, update_balance, check_balance, and create_atm
-    are exposed via an xmlrpc server in __init__. Introspection functions are
-    also expose to ease service discovery on the client-side.
+    are exposed via an xmlrpc server in __init__, along with their batch
+    versions. Introspection and multicall functions are also expose to ease
+    service discovery and bulk provisioning on the client-side.
 
     """
-    def __init__(self, config, db_mutex, ready_event):
+    def __init__(self, config, ready_event, db_obj=None):
         """ __init__ reads config object and registers interface to xmlrpc
 
         Args:
             config (dict): dictionary with xmlrpc host and port information
                             as well as database filepath
-            db_mutex (object): mutex for accessing database
+            db_obj (DB, optional): database shared with the bank interface.
+                            Opens its own from config if not given.
         """
         super(AdminBackend, self).__init__()
         self.admin_host = config['admin']['host']
         self.admin_port = config['admin']['port']
         self.db_path = config['database']['db_path']
-        self.db_mutex = db_mutex
+        self.max_batch = int(config['admin'].get('max_batch', 1000))
         self.ready_event = ready_event
 
-        self.db_obj = DB(db_path=self.db_path)
+        self.db_obj = db_obj or open_db(config)
         server = SimpleXMLRPCServer((self.admin_host, self.admin_port))
         server.register_introspection_functions()
+        server.register_multicall_functions()
         server.register_function(self.create_account)
         server.register_function(self.update_balance)
         server.register_function(self.check_balance)
         server.register_function(self.create_atm)
         server.register_function(self.ready_for_atm)
+        server.register_function(self.create_accounts)
+        server.register_function(self.update_balances)
+        server.register_function(self.check_balances)
+        server.register_function(self.create_atms)
         logging.info('admin interface listening on ' + self.admin_host + ':' + str(self.admin_port))
         server.serve_forever()
 
+    def batch_fits(self, name, size):
+        """check size against the most items a batch call may handle
+
+        Returns:
+            Returns True if size is from 0 to max_batch.
+                    False otherwise.
+        """
+        if 0 <= size <= self.max_batch:
+            return True
+        logging.info('admin %s: batch of %d refused, at most %d allowed', name, size, self.max_batch)
+        return False
+
+    @instrument('admin', lambda result: False)
     def ready_for_atm(self):
         return self.ready_event.isSet()
 
+    @admin_rpc
     def create_account(self, account_name, amount):
         """Create account with account_name starting amount
 
@@ -134,6 +204,7 @@ class AdminBackend(object):
         logging.info('admin create account failed')
         return False
 
+    @admin_rpc
     def update_balance(self, account_name, amount):
         """Update balance of account: account_name with amount
 
@@ -151,6 +222,7 @@ class AdminBackend(object):
         logging.info('admin update balance failure')
         return False
 
+    @admin_rpc
     def check_balance(self, account_name):
         """Check balance of account: account_name
 
@@ -168,6 +240,7 @@ class AdminBackend(object):
         logging.info('admin check_balance failure')
         return False
 
+    @admin_rpc
     def create_atm(self):
         """Create atm
 
@@ -181,3 +254,109 @@ class AdminBackend(object):
             return xmlrpclib.Binary(atm_id)
         logging.info('admin create_atm failure')
         return False
+
+    @admin_rpc
+    def create_accounts(self, accounts):
+        """Create every account in accounts in one transaction
+
+        Args:
+            accounts(list): [account_name, amount] pairs
+
+        Returns:
+            Returns a list holding a random uuid (string) for each account
+            created and False for each that was not. False if there are
+            more than max_batch accounts.
+
+        """
+        if not self.batch_fits('create_accounts', len(accounts)):
+            return False
+        results = [False] * len(accounts)
+        nums = []
+        rows = []
+        for num, account in enumerate(accounts):
+            try:
+                account_name, amount = account
+                amount = int(amount)
+            except (TypeError, ValueError):
+                continue
+            nums.append(num)
+            rows.append((account_name, str(uuid.uuid4()), amount))
+
+        created = self.db_obj.admin_create_accounts(rows)
+        for num, row, result in zip(nums, rows, created):
+            if result:
+                results[num] = xmlrpclib.Binary(row[1])
+        logging.info('admin create_accounts created %d of %d', created.count(True), len(accounts))
+        return results
+
+    @admin_rpc
+    def update_balances(self, balances):
+        """Update balance of every account in balances
+
+        Args:
+            balances(list): [account_name, amount] pairs
+
+        Returns:
+            Returns a list holding True for each account updated and False
+            for each that was not. False if there are more than max_batch
+            balances.
+
+        """
+        if not self.batch_fits('update_balances', len(balances)):
+            return False
+        results = [False] * len(balances)
+        nums = []
+        rows = []
+        for num, balance in enumerate(balances):
+            try:
+                account_name, amount = balance
+            except (TypeError, ValueError):
+                continue
+            nums.append(num)
+            rows.append((account_name, amount))
+
+        for num, result in zip(nums, self.db_obj.admin_set_balances(rows)):
+            results[num] = result
+        logging.info('admin update_balances updated %d of %d', results.count(True), len(balances))
+        return results
+
+    @admin_rpc
+    def check_balances(self, account_names):
+        """Check balance of every account in account_names
+
+        Returns:
+            Returns a list holding the balance of each account found and
+            False for each that was not. False if there are more than
+            max_batch account_names.
+
+        """
+        if not self.batch_fits('check_balances', len(account_names)):
+            return False
+        results = [balance or False for balance in self.db_obj.admin_get_balances(account_names)]
+        logging.info('admin check_balances checked %d accounts', len(account_names))
+        return results
+
+    @admin_rpc
+    def create_atms(self, count):
+        """Create count atms in one transaction
+
+        Returns:
+            Returns a list holding a random uuid (string) for each atm
+            created and False for each that was not. False if count is not
+            from 1 to max_batch.
+
+        """
+        try:
+            count = int(count)
+        except (TypeError, ValueError):
+            logging.info('count must be a integer')
+            return False
+        if count < 1:
+            logging.info('admin create_atms: count must be positive')
+            return False
+        if not self.batch_fits('create_atms', count):
+            return False
+        atm_ids = [str(uuid.uuid4()) for _ in range(count)]
+        created = self.db_obj.admin_create_atms(atm_ids)
+        logging.info('admin create_atms created %d of %d', created.count(True), len(atm_ids))
+        return [xmlrpclib.Binary(atm_id) if result else False for atm_id, result in zip(atm_ids, created)]
@@ -24,11 +24,24 @@ args:
 returns:
     String: Account balance on Success, empty string otherwise.
 ------------------------------------------------------------------------
+
+system.multicall is supported, so a client can send several calls in one
+request.
+
+If bank line_port is set in config.yaml, the same functions are also served
+over the line protocol described on Bank on that port.
 """
 
 import uuid
-from SimpleXMLRPCServer import SimpleXMLRPCServer
-from bank_server import DB
+import threading
+from bank_server import open_db
+from bank_server import db
+from .server import PooledXMLRPCServer
+from .event_server import EventServer
+from .metrics import instrument
+
+# Counts and times bank calls, which fail with an ERROR response
+bank_rpc = instrument('bank', lambda result: result.startswith('ERROR'))
 
 
 class Bank(object):
@@ -40,29 +53,51 @@ class Bank(object):
     more fields separated by spaces. ERROR may have any amount of text between
     the space and the newline.
 
-    "withdraw <acct> <amount>\n"
-    "OKAY\n"
-    "balance <acct>\n"
+    "withdraw <atm_id> <card_id> <amount>\n"
+    "OKAY <atm_id>\n"
+    "balance <card_id>\n"
     "OKAY <amount>\n"
-    "ERROR\n"
+    "ERROR <reason>\n"
+
+    Requests may be pipelined: responses come back in request order.
     """
-    def __init__(self, config, db_mutex, ready_event):
+    def __init__(self, config, ready_event, db_obj=None):
         super(Bank, self).__init__()
         self.bank_host = config['bank']['host']
         self.bank_port = int(config['bank']['port'])
         self.db_init = config['database']['db_init']
         self.db_path = config['database']['db_path']
-        self.db_mutex = db_mutex
-        self.db_obj = DB(db_mutex=self.db_mutex, db_init=self.db_init, db_path=self.db_path)
-        self.server = SimpleXMLRPCServer((self.bank_host, self.bank_port))
+        self.bank_workers = int(config['bank'].get('workers', 1))
+        self.bank_frontend = config['bank'].get('frontend', 'pooled')
+        self.db_obj = db_obj or open_db(config)
+        if self.bank_frontend == 'event':
+            self.server = EventServer((self.bank_host, self.bank_port), workers=self.bank_workers,
+                                      max_pending=int(config['bank'].get('max_pending', 1024)))
+        else:
+            self.server = PooledXMLRPCServer((self.bank_host, self.bank_port), workers=self.bank_workers)
+        self.server.register_multicall_functions()
         self.server.register_function(self.withdraw)
         self.server.register_function(self.check_balance)
 
+        if config['bank'].get('line_port'):
+            if self.bank_frontend == 'event':
+                line_server = self.server
+            else:
+                line_server = EventServer(None, workers=self.bank_workers)
+            line_server.register_line_command('withdraw', self.withdraw, 3)
+            line_server.register_line_command('balance', self.check_balance, 1)
+            line_server.listen_lines((self.bank_host, int(config['bank']['line_port'])))
+            if line_server is not self.server:
+                line_thread = threading.Thread(target=line_server.serve_forever, name='bank-lines')
+                line_thread.daemon = True
+                line_thread.start()
+
         # Bank is initialized. Tell AdminBackend to report that ready_for_atm
         # is True.
         ready_event.set()
         self.server.serve_forever()
 
+    @bank_rpc
     def withdraw(self, atm_id, card_id, amount):
         try:
             amount = int(amount)
@@ -71,29 +106,19 @@ class Bank(object):
         except ValueError:
             return 'ERROR withdraw command usage: withdraw <atm_id> <card_id> <amount>'
 
-        atm = self.db_obj.get_atm(atm_id)
-        if atm is None:
-            return 'ERROR could not lookup atm \'' + str(atm_id) + '\''
-
-        num_bills = self.db_obj.get_atm_num_bills(atm_id)
-        if num_bills is None:
+        result = self.db_obj.withdraw(atm_id, card_id, amount)
+        if result.status == db.WITHDRAW_OKAY:
+            return 'OKAY ' + str(atm_id)
+        elif result.status == db.WITHDRAW_NO_ATM:
             return 'ERROR could not lookup atm \'' + str(atm_id) + '\''
-
-        if num_bills < amount:
+        elif result.status == db.WITHDRAW_ATM_FUNDS:
             return 'ERROR insufficient funds in atm \'' + str(atm_id) + '\''
-
-        balance = self.db_obj.get_balance(card_id)
-        if balance is None:
+        elif result.status == db.WITHDRAW_NO_CARD:
             return 'ERROR could not lookup card \'' + str(card_id) + '\''
-
-        final_amount = balance - amount
-        if final_amount >= 0:
-            self.db_obj.set_balance(card_id, final_amount)
-            self.db_obj.set_atm_num_bills(atm_id, num_bills - amount)
-            return 'OKAY ' + str(atm_id)
         else:
             return 'ERROR insufficient funds'
 
+    @bank_rpc
     def check_balance(self, card_id):
         try:
             uuid.UUID('{'+str(card_id)+'}')
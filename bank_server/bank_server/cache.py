@@ -0,0 +1,114 @@
+""" Cache
+This module implements the in-process cache that DB keeps in front of
+sqlite for account balances and atm bill counts.
+
+Entries are written through by DB once the write that changed them has
+committed. Reads that miss fill the cache with what they found in sqlite,
+but only if no write-through happened in between; otherwise the value they
+read may already be stale and is dropped."""
+
+import threading
+import weakref
+from collections import OrderedDict
+from .metrics import REGISTRY
+
+# Every cache, for the hit and miss counters
+CACHES = weakref.WeakSet()
+
+
+def cache_counts(attr):
+    """function summing counter attr of every cache, by cache name"""
+    def counts():
+        totals = {}
+        for cache in list(CACHES):
+            totals[(cache.name,)] = totals.get((cache.name,), 0) + getattr(cache, attr)
+        return totals
+    return counts
+
+
+def cache_hit_ratios():
+    """share of lookups that hit, by cache name"""
+    hits = cache_counts('hits')()
+    misses = cache_counts('misses')()
+    return dict((name, float(hits[name]) / (hits[name] + misses[name]))
+                for name in hits if hits[name] + misses[name])
+
+
+REGISTRY.callback('bank_cache_hits_total', 'Cache lookups that hit', ('cache',), 'counter',
+                  cache_counts('hits'))
+REGISTRY.callback('bank_cache_misses_total', 'Cache lookups that missed', ('cache',), 'counter',
+                  cache_counts('misses'))
+REGISTRY.callback('bank_cache_evictions_total', 'Entries evicted from caches', ('cache',), 'counter',
+                  cache_counts('evictions'))
+REGISTRY.callback('bank_cache_hit_ratio', 'Share of cache lookups that hit', ('cache',), 'gauge',
+                  cache_hit_ratios)
+
+
+class LRUCache(object):
+    """Bounded least recently used cache with hit and miss counters
+
+    Args:
+        size (int): number of entries kept before the least recently used
+            entry is evicted. 0 disables the cache.
+        name (str, optional): label of the cache in metrics
+    """
+    def __init__(self, size, name='cache'):
+        super(LRUCache, self).__init__()
+        self.size = size
+        self.name = name
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        CACHES.add(self)
+
+    def get(self, key):
+        """get value cached for key
+
+        Returns:
+            (object or None): Returns cached value on hit. None otherwise.
+        """
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def fill(self, key, value, generation):
+        """cache value read from the database after a miss
+
+        Args:
+            generation (int): self.generation as it was before the value
+                was read. The value is dropped if anything was written
+                through since.
+        """
+        with self.lock:
+            if generation == self.generation:
+                self._insert(key, value)
+
+    def put(self, key, value):
+        """write value through to the cache"""
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+            self._insert(key, value)
+
+    def clear(self):
+        """drop every entry"""
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def _insert(self, key, value):
+        """insert key as most recently used, evicting if over size"""
+        if self.size <= 0:
+            return
+        self.entries[key] = value
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
@@ -1,82 +1,429 @@
 """ DB
 This module implements an interface to the bank_server database.
-It uses a mutex because both the bank_interface and admin_interface
-need access to database. (sqlite3 does not gurantee concurrent operations)"""
+Both the bank_interface and admin_interface need access to the database,
+and sqlite3 does not gurantee concurrent operations, so every write to a
+database file goes through a single DBWriter thread that owns the only
+write connection to it. It applies queued writes in batched transactions,
+so a burst of withdrawals pays for one fsync rather than one each.
+
+Each thread reading from a database file gets its own sqlite connection,
+opened in WAL mode, so balance checks run in parallel with the writer.
+
+Accounts may be spread over several database files (shards) picked by a hash
+of card_id. The main database file holds the atms table and shard 0 of the
+cards table. With more than one shard it also holds the accounts table, a
+routing index from account_name to card_id. Every shard has its own writer,
+so writes to accounts on different shards never wait on each other. The
+number of shards is recorded in the main file and can only be changed
+offline with bank_server.reshard.
+
+Account balances and atm bill counts are cached in front of sqlite. The
+cache is written through once the write that changed it has committed, so it
+is only correct if every writer goes through the same DB object; bank_server
+shares one between Bank and AdminBackend."""
 
 import sqlite3
+import threading
+import zlib
 import os
+from collections import namedtuple
+from .cache import LRUCache
+from .writer import DBWriter
+
+# Outcomes of DB.withdraw
+WITHDRAW_OKAY = 'okay'
+WITHDRAW_NO_ATM = 'no atm'
+WITHDRAW_ATM_FUNDS = 'atm funds'
+WITHDRAW_NO_CARD = 'no card'
+WITHDRAW_FUNDS = 'funds'
+
+# status is one of the WITHDRAW_* outcomes. balance and num_bills are the
+# values left after a successful withdrawal, None otherwise.
+WithdrawResult = namedtuple('WithdrawResult', ['status', 'balance', 'num_bills'])
+
+CARDS_SCHEMA = 'create table if not exists cards (account_name text not null unique, \
+                card_id text not null unique, balance integer, primary key (account_name, card_id));'
+ACCOUNTS_SCHEMA = 'create table if not exists accounts (account_name text primary key, \
+                   card_id text not null unique);'
+
+
+class ShardMismatch(Exception):
+    pass
+
+
+def shard_index(card_id, shard_count):
+    """index of the shard holding account: card_id"""
+    return (zlib.crc32(card_id) & 0xffffffff) % shard_count
+
+
+def shard_files(db_file, shard_path, shard_count):
+    """database files of every shard, main database file first"""
+    return [db_file] + [os.getcwd() + shard_path % num for num in range(1, shard_count)]
+
+
+def open_db(config):
+    """create a DB from the database and shards sections of config
+
+    Args:
+        config (dict): bank_server configuration
+
+    Returns:
+        (DB): database interface
+    """
+    db_config = config['database']
+    shard_config = config.get('shards', {})
+    return DB(db_init=db_config['db_init'], db_path=db_config['db_path'],
+              commit_window=db_config.get('commit_window_ms', 0) / 1000.0,
+              commit_max_ops=int(db_config.get('commit_max_ops', 1)),
+              cache_size=int(db_config.get('cache_size', 0)),
+              shard_count=int(shard_config.get('count', 1)),
+              shard_path=shard_config.get('path'))
+
+
+class Shard(object):
+    """One database file with per-thread read connections and a writer thread
+
+    Args:
+        db_file (str): path of the database file
+        commit_window (float): see DBWriter
+        commit_max_ops (int): see DBWriter
+    """
+    def __init__(self, db_file, commit_window=0, commit_max_ops=1):
+        super(Shard, self).__init__()
+        self.db_file = db_file
+        self.local = threading.local()
+        self.connect()
+        self.write_conn = sqlite3.connect(self.db_file, isolation_level=None,
+                                          check_same_thread=False)
+        self.write_cur = self.write_conn.cursor()
+        self.writer = DBWriter(self.write_conn, commit_window, commit_max_ops,
+                               name=os.path.basename(db_file))
+
+    def connect(self):
+        """open a WAL mode connection for the calling thread"""
+        self.local.db_conn = sqlite3.connect(self.db_file)
+        self.local.db_conn.execute('PRAGMA journal_mode=WAL;')
+        self.local.cur = self.local.db_conn.cursor()
+
+    @property
+    def db_conn(self):
+        """sqlite connection owned by the calling thread"""
+        if not hasattr(self.local, 'db_conn'):
+            self.connect()
+        return self.local.db_conn
+
+    @property
+    def cur(self):
+        """cursor of the connection owned by the calling thread"""
+        if not hasattr(self.local, 'cur'):
+            self.connect()
+        return self.local.cur
+
+    def close(self):
+        """close the database connection of the calling thread"""
+        self.db_conn.commit()
+        self.db_conn.close()
+        del self.local.db_conn
+        del self.local.cur
+
+    def read(self, statement, param):
+        """run a query on the calling thread's connection
+
+        Nothing is written, so nothing is committed.
+
+        Returns:
+            (tuple or None): first row of the result, None if there is none
+        """
+        self.cur.execute(statement, param)
+        return self.cur.fetchone()
+
+    def write(self, func, *args):
+        """apply func(shard, *args) on the writer thread
+
+        Returns:
+            Result of func, once the batch it was applied in has committed.
+        """
+        return self.writer.submit(func, self, *args).result()
+
+    def after_commit(self, func, *args):
+        """call func once the write being applied has committed"""
+        self.writer.after_commit(func, *args)
+
+    def savepoint(self, name):
+        """open savepoint: name inside the write being applied
+
+        Returns:
+            (int): mark to hand to rollback
+        """
+        self.write_cur.execute('SAVEPOINT %s;' % name)
+        return len(self.writer.on_commit)
+
+    def rollback(self, name, mark):
+        """undo everything since savepoint: name, including after_commit
+        calls registered since"""
+        self.write_cur.execute('ROLLBACK TO %s;' % name)
+        del self.writer.on_commit[mark:]
+
+    def release(self, name):
+        """close savepoint: name"""
+        self.write_cur.execute('RELEASE %s;' % name)
+
+    def insert_many(self, table, columns, unique, rows):
+        """insert rows into table with one executemany inside the write being
+        applied
+
+        Rows whose unique columns clash with a stored row or an earlier row
+        of the same call are left out rather than failing the rest.
+
+        Args:
+            table (str): table to insert into
+            columns (tuple): column names, in the order of each row
+            unique (tuple): names of the columns that must be unique
+            rows (list): tuples of column values
+
+        Returns:
+            (list): True for each row inserted, False for each left out
+        """
+        results = []
+        seen = dict((column, set()) for column in unique)
+        for row in rows:
+            values = dict(zip(columns, row))
+            clash = False
+            for column in unique:
+                if values[column] in seen[column]:
+                    clash = True
+                    break
+                self.write_cur.execute('SELECT 1 FROM %s WHERE %s = (?);' % (table, column),
+                                       (values[column],))
+                if self.write_cur.fetchone() is not None:
+                    clash = True
+                    break
+            if not clash:
+                for column in unique:
+                    seen[column].add(values[column])
+            results.append(not clash)
+
+        mark = self.savepoint('insert_many')
+        try:
+            self.write_cur.executemany('INSERT INTO %s(%s) values (%s);' % (
+                table, ', '.join(columns), ', '.join('?' * len(columns))),
+                [row for row, inserted in zip(rows, results) if inserted])
+        except sqlite3.Error:
+            self.rollback('insert_many', mark)
+            raise
+        finally:
+            self.release('insert_many')
+        return results
+
+    def modify(self, statement, param):
+        """reduce duplicate code"""
+        try:
+            self.write_cur.execute(statement, param)
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
 
 class DB(object):
     """Implements a Database interface for the bank server and admin interface"""
-    def __init__(self, db_mutex=None, db_init=None, db_path=None):
+    def __init__(self, db_init=None, db_path=None, commit_window=0,
+                 commit_max_ops=1, cache_size=0, shard_count=1, shard_path=None):
         super(DB, self).__init__()
-        self.db_conn = sqlite3.connect(os.getcwd() + db_path)
-        self.db_mutex = db_mutex
-        self.cur = self.db_conn.cursor()
-        if db_init and not os.path.isfile(os.getcwd() + db_path):
+        self.db_file = os.getcwd() + db_path
+        self.main = Shard(self.db_file, commit_window, commit_max_ops)
+        if db_init and not os.path.isfile(self.db_file):
             self.init_db(os.getcwd() + db_init)
+        self.check_shards(shard_count, shard_path)
+        self.shards = [self.main] + [Shard(db_file, commit_window, commit_max_ops)
+                                     for db_file in shard_files(self.db_file, shard_path, shard_count)[1:]]
+        for shard in self.shards[1:]:
+            shard.cur.execute(CARDS_SCHEMA)
+        if shard_count > 1:
+            self.main.cur.execute(ACCOUNTS_SCHEMA)
+        self.cards = LRUCache(cache_size, 'cards')
+        self.atms = LRUCache(cache_size, 'atms')
 
     def close(self):
-        """close the database connection"""
-        self.db_conn.commit()
-        self.db_conn.close()
+        """close the database connections of the calling thread"""
+        for shard in self.shards:
+            shard.close()
 
     def init_db(self, filepath):
         """initialize database with file at filepath"""
         with open(filepath, 'r') as file_handle:
             cmds = file_handle.read().replace('\n', '')
-        self.cur.executescript(cmds)
-        self.db_conn.commit()
+        self.main.cur.executescript(cmds)
+        self.main.db_conn.commit()
 
-    def lock_db(func):
-        """function wrapper for functions that require db access"""
-        def func_wrap(self, *args):
-            """acquire and release dbMuted if available"""
-            if self.db_mutex:
-                self.db_mutex.acquire()
-            result = func(self, *args)
-            self.db_conn.commit()
-            if self.db_mutex:
-                self.db_mutex.release()
-            return result
-        return func_wrap
+    def check_shards(self, shard_count, shard_path):
+        """make sure the main database file is split into shard_count shards
 
-    def modify(self, statement, param):
-        """reduce duplicate code"""
-        try:
-            self.cur.execute(statement, param)
+        A database without accounts takes on shard_count. Shard 0, the cards
+        table of the main file, may be empty while the other shards are not,
+        so the routing index and every shard file are checked too.
+
+        Raises:
+            ShardMismatch: if the accounts are already split some other way
+        """
+        stored = self.main.read('PRAGMA user_version;', ())[0] or 1
+        if stored == shard_count:
+            return
+        if self.has_accounts(stored, shard_path):
+            raise ShardMismatch('database has %d shards, config asks for %d; '
+                                'run bank_server.reshard' % (stored, shard_count))
+        self.main.db_conn.execute('PRAGMA user_version = %d;' % shard_count)
+
+    def has_accounts(self, shard_count, shard_path):
+        """whether any account is stored under the current shard_count"""
+        if self.main.read('SELECT 1 FROM cards LIMIT 1;', ()) is not None:
             return True
-        except sqlite3.IntegrityError:
+        if self.main.read("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'accounts';", ()):
+            if self.main.read('SELECT 1 FROM accounts LIMIT 1;', ()) is not None:
+                return True
+        if shard_count == 1 or not shard_path:
             return False
+        for db_file in shard_files(self.db_file, shard_path, shard_count)[1:]:
+            if not os.path.isfile(db_file):
+                continue
+            conn = sqlite3.connect(db_file)
+            try:
+                if conn.execute('SELECT 1 FROM cards LIMIT 1;').fetchone() is not None:
+                    return True
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                conn.close()
+        return False
+
+    def shard(self, card_id):
+        """shard holding account: card_id"""
+        return self.shards[shard_index(card_id, len(self.shards))]
+
+    def card_of(self, account_name):
+        """get card_id of account: account_name
+
+        Returns:
+            (string or None): Returns card_id on Success. None otherwise.
+        """
+        if len(self.shards) == 1:
+            result = self.main.read("SELECT card_id FROM cards WHERE account_name = (?);", (account_name,))
+        else:
+            result = self.main.read("SELECT card_id FROM accounts WHERE account_name = (?);", (account_name,))
+        if result is None:
+            return None
+        return result[0]
 
     ############################
     # BANK INTERFACE FUNCTIONS #
     ############################
 
-    @lock_db
+    def withdraw(self, atm_id, card_id, amount):
+        """withdraw amount from account: card_id at atm: atm_id
+
+        Both the atm and the account are debited with conditional updates, so
+        concurrent withdrawals can never overdraw either one. When the account
+        lives in the main database file both updates share one savepoint of
+        the writer's batch. Otherwise the bills are taken from the atm first
+        and handed back if the account cannot be debited; a crash in between
+        can only leave the atm reporting too few bills.
+
+        Returns:
+            (WithdrawResult): status is WITHDRAW_OKAY on Success, the
+                WITHDRAW_* outcome describing the failure otherwise.
+        """
+        shard = self.shard(card_id)
+        if shard is self.main:
+            return self.main.write(self._withdraw, atm_id, card_id, amount)
+
+        taken = self.main.write(self._take_bills, atm_id, amount)
+        if taken.status != WITHDRAW_OKAY:
+            return taken
+        debited = shard.write(self._debit, card_id, amount)
+        if debited.status != WITHDRAW_OKAY:
+            self.main.write(self._take_bills, atm_id, -amount)
+            return debited
+        return WithdrawResult(WITHDRAW_OKAY, debited.balance, taken.num_bills)
+
+    def _withdraw(self, shard, atm_id, card_id, amount):
+        """take bills and debit account inside one savepoint"""
+        mark = shard.savepoint('withdraw')
+        try:
+            taken = self._take_bills(shard, atm_id, amount)
+            if taken.status != WITHDRAW_OKAY:
+                return taken
+            debited = self._debit(shard, card_id, amount)
+            if debited.status != WITHDRAW_OKAY:
+                shard.rollback('withdraw', mark)
+                return debited
+            return WithdrawResult(WITHDRAW_OKAY, debited.balance, taken.num_bills)
+        except sqlite3.Error:
+            shard.rollback('withdraw', mark)
+            raise
+        finally:
+            shard.release('withdraw')
+
+    def _take_bills(self, shard, atm_id, amount):
+        """take amount bills from atm: atm_id if it holds that many"""
+        shard.write_cur.execute("UPDATE atms SET num_bills = num_bills - (?) WHERE \
+                                    atm_id = (?) AND num_bills >= (?);", (amount, atm_id, amount,))
+        if shard.write_cur.rowcount != 1:
+            shard.write_cur.execute("SELECT 1 FROM atms WHERE atm_id = (?);", (atm_id,))
+            if shard.write_cur.fetchone() is None:
+                return WithdrawResult(WITHDRAW_NO_ATM, None, None)
+            return WithdrawResult(WITHDRAW_ATM_FUNDS, None, None)
+        shard.write_cur.execute("SELECT num_bills FROM atms WHERE atm_id = (?);", (atm_id,))
+        num_bills = shard.write_cur.fetchone()[0]
+        shard.after_commit(self.atms.put, atm_id, num_bills)
+        return WithdrawResult(WITHDRAW_OKAY, None, num_bills)
+
+    def _debit(self, shard, card_id, amount):
+        """debit amount from account: card_id if its balance covers it"""
+        shard.write_cur.execute("UPDATE cards SET balance = balance - (?) WHERE \
+                                    card_id = (?) AND balance >= (?);", (amount, card_id, amount,))
+        if shard.write_cur.rowcount != 1:
+            shard.write_cur.execute("SELECT 1 FROM cards WHERE card_id = (?);", (card_id,))
+            if shard.write_cur.fetchone() is None:
+                return WithdrawResult(WITHDRAW_NO_CARD, None, None)
+            return WithdrawResult(WITHDRAW_FUNDS, None, None)
+        shard.write_cur.execute("SELECT balance FROM cards WHERE card_id = (?);", (card_id,))
+        balance = shard.write_cur.fetchone()[0]
+        shard.after_commit(self.cards.put, card_id, balance)
+        return WithdrawResult(WITHDRAW_OKAY, balance, None)
+
     def set_balance(self, card_id, balance):
         """set balance of account: card_id
 
         Returns:
             (bool): Returns True on Success. False otherwise.
         """
-        return self.modify("UPDATE cards SET balance = (?) WHERE \
-                                    card_id = (?);", (balance, card_id,))
+        return self.shard(card_id).write(self._set_balance, card_id, balance)
+
+    def _set_balance(self, shard, card_id, balance):
+        """set balance and write the stored value through to the cache"""
+        if not shard.modify("UPDATE cards SET balance = (?) WHERE \
+                                    card_id = (?);", (balance, card_id,)):
+            return False
+        if shard.write_cur.rowcount == 1:
+            shard.write_cur.execute("SELECT balance FROM cards WHERE card_id = (?);", (card_id,))
+            shard.after_commit(self.cards.put, card_id, shard.write_cur.fetchone()[0])
+        return True
 
-    @lock_db
     def get_balance(self, card_id):
         """get balance of account: card_id
 
         Returns:
             (string or None): Returns balance on Success. None otherwise.
         """
-        self.cur.execute("SELECT balance FROM cards WHERE card_id = (?);", (card_id,))
-        result = self.cur.fetchone()
+        balance = self.cards.get(card_id)
+        if balance is not None:
+            return balance
+        generation = self.cards.generation
+        result = self.shard(card_id).read("SELECT balance FROM cards WHERE card_id = (?);", (card_id,))
         if result is None:
             return None
+        self.cards.fill(card_id, result[0], generation)
         return result[0]
 
-    @lock_db
     def get_atm(self, atm_id):
         """get atm_id of atm: atm_id
         this is an obviously dumb function but maybe it can be expanded...
@@ -84,77 +431,242 @@ class DB(object):
         Returns:
             (string or None): Returns atm_id on Success. None otherwise.
         """
-        self.cur.execute("SELECT atm_id FROM atms WHERE atm_id = (?);", (atm_id,))
-        result = self.cur.fetchone()
-        if result is None:
+        if self.get_atm_num_bills(atm_id) is None:
             return None
-        return result[0]
+        return atm_id
 
-    @lock_db
     def get_atm_num_bills(self, atm_id):
         """get number of bills in atm: atm_id
 
         Returns:
             (string or None): Returns atm_id on Success. None otherwise.
         """
-        self.cur.execute("SELECT num_bills FROM atms WHERE atm_id = (?);", (atm_id,))
-        result = self.cur.fetchone()
+        num_bills = self.atms.get(atm_id)
+        if num_bills is not None:
+            return num_bills
+        generation = self.atms.generation
+        result = self.main.read("SELECT num_bills FROM atms WHERE atm_id = (?);", (atm_id,))
         if result is None:
             return None
+        self.atms.fill(atm_id, result[0], generation)
         return result[0]
 
-    @lock_db
     def set_atm_num_bills(self, atm_id, num_bills):
         """set number of bills in atm: atm_id
 
         Returns:
             (bool): Returns True on Success. False otherwise.
         """
-        return self.modify("UPDATE atms SET num_bills = (?) WHERE \
-                                    atm_id = (?);", (num_bills, atm_id,))
+        return self.main.write(self._set_atm_num_bills, atm_id, num_bills)
+
+    def _set_atm_num_bills(self, shard, atm_id, num_bills):
+        """set num_bills and write it through to the cache"""
+        if not shard.modify("UPDATE atms SET num_bills = (?) WHERE \
+                                    atm_id = (?);", (num_bills, atm_id,)):
+            return False
+        if shard.write_cur.rowcount == 1:
+            shard.after_commit(self.atms.put, atm_id, num_bills)
+        return True
 
     #############################
     # ADMIN INTERFACE FUNCTIONS #
     #############################
 
-    @lock_db
     def admin_create_account(self, account_name, card_id, amount):
         """create account with account_name, card_id, and amount
 
+        With more than one shard the account is entered in the routing index
+        first, which rejects duplicate names and card_ids across shards.
+
         Returns:
             (bool): Returns True on Success. False otherwise.
         """
-        return self.modify('INSERT INTO cards(account_name, card_id, balance) \
-                            values (?, ?, ?);', (account_name, card_id, amount,))
+        if len(self.shards) == 1:
+            return self.main.write(self._create_account, account_name, card_id, amount)
+
+        if not self.main.write(self._route_account, account_name, card_id):
+            return False
+        if self.shard(card_id).write(self._create_account, account_name, card_id, amount):
+            return True
+        self.main.write(self._unroute_account, account_name)
+        return False
+
+    def _create_account(self, shard, account_name, card_id, amount):
+        """insert account into the cards table of shard"""
+        if not shard.modify('INSERT INTO cards(account_name, card_id, balance) \
+                            values (?, ?, ?);', (account_name, card_id, amount,)):
+            return False
+        shard.after_commit(self.cards.put, card_id, amount)
+        return True
+
+    def _route_account(self, shard, account_name, card_id):
+        """insert account into the routing index"""
+        return shard.modify('INSERT INTO accounts(account_name, card_id) \
+                            values (?, ?);', (account_name, card_id,))
+
+    def _unroute_account(self, shard, account_name):
+        """remove account from the routing index"""
+        return shard.modify('DELETE FROM accounts WHERE account_name = (?);', (account_name,))
+
+    def admin_create_accounts(self, accounts):
+        """create every account in accounts
+
+        Each shard inserts its accounts with one executemany in a single
+        transaction. With more than one shard the routing index is filled the
+        same way first.
+
+        Args:
+            accounts (list): (account_name, card_id, amount) tuples
+
+        Returns:
+            (list): True for each account created, False for each rejected
+        """
+        accounts = [tuple(account) for account in accounts]
+        if len(self.shards) == 1:
+            return self.main.write(self._create_accounts, accounts)
+
+        routed = self.main.write(self._route_accounts, accounts)
+        results = list(routed)
+        by_shard = {}
+        for num, account in enumerate(accounts):
+            if routed[num]:
+                by_shard.setdefault(self.shard(account[1]), []).append(num)
+        for shard, nums in by_shard.items():
+            created = shard.write(self._create_accounts, [accounts[num] for num in nums])
+            for num, result in zip(nums, created):
+                results[num] = result
+        unrouted = [(accounts[num][0],) for num in range(len(accounts))
+                    if routed[num] and not results[num]]
+        if unrouted:
+            self.main.write(self._unroute_accounts, unrouted)
+        return results
+
+    def _create_accounts(self, shard, accounts):
+        """insert accounts into the cards table of shard"""
+        results = shard.insert_many('cards', ('account_name', 'card_id', 'balance'),
+                                    ('account_name', 'card_id'), accounts)
+        for account, result in zip(accounts, results):
+            if result:
+                shard.after_commit(self.cards.put, account[1], account[2])
+        return results
+
+    def _route_accounts(self, shard, accounts):
+        """insert accounts into the routing index"""
+        return shard.insert_many('accounts', ('account_name', 'card_id'), ('account_name', 'card_id'),
+                                 [account[:2] for account in accounts])
+
+    def _unroute_accounts(self, shard, account_names):
+        """remove accounts from the routing index"""
+        shard.write_cur.executemany('DELETE FROM accounts WHERE account_name = (?);', account_names)
 
-    @lock_db
     def admin_create_atm(self, atm_id):
         """create atm with atm_id
 
         Returns:
             (bool): Returns True on Success. False otherwise.
         """
-        return self.modify('INSERT INTO atms(atm_id, num_bills) values (?,?);', (atm_id, 128, ))
+        return self.main.write(self._create_atm, atm_id)
+
+    def _create_atm(self, shard, atm_id):
+        """insert atm with a full load of bills"""
+        if not shard.modify('INSERT INTO atms(atm_id, num_bills) values (?,?);', (atm_id, 128, )):
+            return False
+        shard.after_commit(self.atms.put, atm_id, 128)
+        return True
+
+    def admin_create_atms(self, atm_ids):
+        """create every atm in atm_ids with one executemany
+
+        Returns:
+            (list): True for each atm created, False for each rejected
+        """
+        return self.main.write(self._create_atms, list(atm_ids))
+
+    def _create_atms(self, shard, atm_ids):
+        """insert atms with a full load of bills"""
+        results = shard.insert_many('atms', ('atm_id', 'num_bills'), ('atm_id',),
+                                    [(atm_id, 128) for atm_id in atm_ids])
+        for atm_id, result in zip(atm_ids, results):
+            if result:
+                shard.after_commit(self.atms.put, atm_id, 128)
+        return results
 
-    @lock_db
     def admin_get_balance(self, account_name):
         """get balance of account: card_id
 
         Returns:
             (string or None): Returns balance on Success. None otherwise.
         """
-        self.cur.execute("SELECT balance FROM cards WHERE account_name = (?);", (account_name,))
-        result = self.cur.fetchone()
-        if result is None:
+        card_id = self.card_of(account_name)
+        if card_id is None:
             return False
-        return result[0]
+        balance = self.get_balance(card_id)
+        if balance is None:
+            return False
+        return balance
 
-    @lock_db
     def admin_set_balance(self, account_name, balance):
         """set balance of account: card_id
 
         Returns:
             (bool): Returns True on Success. False otherwise.
         """
-        return self.modify("UPDATE cards SET balance = (?) \
-                            WHERE account_name = (?);", (balance, account_name))
+        card_id = self.card_of(account_name)
+        if card_id is None:
+            return True
+        return self.set_balance(card_id, balance)
+
+    def admin_get_balances(self, account_names):
+        """get balance of every account in account_names
+
+        Returns:
+            (list): balance of each account, False for each not found
+        """
+        return [self.admin_get_balance(account_name) for account_name in account_names]
+
+    def admin_set_balances(self, balances):
+        """set balance of every account in balances
+
+        Each shard updates its accounts with one executemany in a single
+        transaction.
+
+        Args:
+            balances (list): (account_name, balance) tuples
+
+        Returns:
+            (list): True for each account updated, False for each not
+                found. admin_set_balance reports True for a missing
+                account; here it is False so a mistyped name shows up.
+        """
+        results = []
+        by_shard = {}
+        for num, (account_name, balance) in enumerate(balances):
+            card_id = self.card_of(account_name)
+            results.append(False)
+            if card_id is not None:
+                by_shard.setdefault(self.shard(card_id), []).append((num, card_id, balance))
+        for shard, updates in by_shard.items():
+            updated = shard.write(self._set_balances, [(card_id, balance) for _, card_id, balance in updates])
+            for (num, _, _), result in zip(updates, updated):
+                results[num] = result
+        return results
+
+    def _set_balances(self, shard, balances):
+        """set balances and write the stored values through to the cache"""
+        mark = shard.savepoint('set_balances')
+        try:
+            shard.write_cur.executemany("UPDATE cards SET balance = (?) WHERE card_id = (?);",
+                                        [(balance, card_id) for card_id, balance in balances])
+        except sqlite3.Error:
+            shard.rollback('set_balances', mark)
+            raise
+        finally:
+            shard.release('set_balances')
+        results = []
+        for card_id, _ in balances:
+            shard.write_cur.execute("SELECT balance FROM cards WHERE card_id = (?);", (card_id,))
+            row = shard.write_cur.fetchone()
+            if row is not None:
+                shard.after_commit(self.cards.put, card_id, row[0])
+            results.append(row is not None)
+        return results
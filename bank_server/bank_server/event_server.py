@@ -0,0 +1,390 @@
+""" Event Server
+This module implements an event driven XML-RPC server for the bank interface.
+
+One asyncore loop owns every ATM connection. Connections are kept open
+between requests (HTTP/1.1 keep-alive), so an ATM pays for TCP setup once
+instead of on every withdrawal, and an idle or slow ATM costs a socket rather
+than a thread. Parsed requests are dispatched on a bounded pool of executor
+threads, which is where the DB work happens. Responses go back through the
+loop in the order their requests arrived on the connection, so clients may
+pipeline requests.
+
+Once as many requests are in flight as the executor queue allows, the loop
+stops reading from connections until some complete, leaving new requests in
+the kernel's socket buffers rather than in memory.
+
+It speaks the same HTTP and XML-RPC as SimpleXMLRPCServer, so existing
+xmlrpclib clients work unchanged. The same functions can also be served over
+a newline delimited text protocol on a second port, which skips the HTTP and
+XML parsing entirely:
+
+    "balance <card_id>\n"
+    "OKAY 10\n"
+
+A request line is a command name followed by its arguments separated by
+spaces. The response line is whatever the registered function returns."""
+
+import asyncore
+import asynchat
+import socket
+import threading
+import logging
+from collections import deque
+from Queue import Queue
+from SimpleXMLRPCServer import SimpleXMLRPCDispatcher
+
+RPC_PATHS = ('/', '/RPC2')
+
+
+class Waker(asyncore.file_dispatcher):
+    """Lets executor threads wake the event loop
+
+    Args:
+        on_wake (function): called on the loop thread after wake
+        sock_map (dict): asyncore socket map of the loop
+    """
+    def __init__(self, on_wake, sock_map):
+        self.reader, self.writer = socket.socketpair()
+        self.writer.setblocking(False)
+        asyncore.file_dispatcher.__init__(self, self.reader.fileno(), map=sock_map)
+        self.on_wake = on_wake
+
+    def wake(self):
+        """wake the loop from any thread"""
+        try:
+            self.writer.send('x')
+        except socket.error:
+            pass
+
+    def writable(self):
+        return False
+
+    def handle_read(self):
+        self.recv(4096)
+        self.on_wake()
+
+
+class PipelinedChannel(asynchat.async_chat):
+    """Connection whose requests run on the executor and whose responses are
+    sent back in request order
+
+    Subclasses parse requests and call submit for each one.
+
+    Args:
+        sock (socket): accepted connection
+        server (EventServer): server that accepted it
+    """
+    def __init__(self, sock, server):
+        asynchat.async_chat.__init__(self, sock, map=server.sock_map)
+        self.server = server
+        self.slots = deque()
+        self.closing = False
+
+    def readable(self):
+        return (not self.closing and
+                len(self.slots) < self.server.max_pipeline and
+                self.server.has_capacity())
+
+    def submit(self, func, *args):
+        """run func(*args) on the executor; its result is sent once every
+        earlier response on this connection has been
+
+        func returns the bytes to send and whether to close the connection
+        after sending them.
+        """
+        slot = [None]
+        self.slots.append(slot)
+        self.server.submit(self, slot, func, args)
+
+    def complete(self, slot, result):
+        """called on the loop thread when a request finishes"""
+        slot[0] = result
+        while self.slots and self.slots[0][0] is not None:
+            data, close = self.slots.popleft()[0]
+            self.push(data)
+            if close:
+                self.closing = True
+                self.slots.clear()
+                self.close_when_done()
+
+    def internal_error(self):
+        """result sent when a request raised; closes the connection
+
+        Subclasses send an error their clients understand first; by default
+        nothing is sent.
+        """
+        return '', True
+
+    def handle_error(self):
+        logging.exception('%s: connection error', self.__class__.__name__)
+        self.close()
+
+
+class HTTPChannel(PipelinedChannel):
+    """XML-RPC over persistent HTTP connection
+
+    Requests whose headers or body are larger than max_header or max_body
+    bytes are refused and the connection closed, so no client can make the
+    bank buffer more than that.
+    """
+    max_header = 8192
+    max_body = 1 << 20
+
+    def __init__(self, sock, server):
+        PipelinedChannel.__init__(self, sock, server)
+        self.buffer = []
+        self.buffered = 0
+        self.headers = None
+        self.set_terminator('\r\n\r\n')
+
+    def collect_incoming_data(self, data):
+        if self.closing:
+            return
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.headers is None and self.buffered > self.max_header:
+            self.buffer = []
+            self.buffered = 0
+            self.fail(400, 'Request Header Too Large')
+
+    def found_terminator(self):
+        data = ''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        if self.closing:
+            return
+
+        if self.headers is None:
+            self.headers = self.parse_headers(data)
+            if self.headers is None:
+                self.fail(400, 'Bad Request')
+                return
+            length = self.headers[3]['content-length']
+            if length > self.max_body:
+                self.fail(413, 'Request Entity Too Large')
+                return
+            if length > 0:
+                self.set_terminator(length)
+                return
+            data = ''
+
+        command, path, version, headers = self.headers
+        self.headers = None
+        self.set_terminator('\r\n\r\n')
+
+        if command != 'POST':
+            self.fail(501, 'Unsupported method (%r)' % command)
+        elif path not in RPC_PATHS:
+            self.fail(404, 'Not Found')
+        else:
+            self.submit(self.rpc_response, data, self.keep_alive(version, headers))
+
+    def fail(self, code, message):
+        """answer with an HTTP error and stop reading requests"""
+        self.closing = True
+        self.submit(self.error_response, code, message)
+
+    def parse_headers(self, data):
+        """parse request line and headers
+
+        Returns:
+            (tuple or None): (command, path, version, headers) with header
+                names lowercased and content-length as int. None if the
+                request is malformed.
+        """
+        lines = data.split('\r\n')
+        words = lines[0].split()
+        if len(words) != 3:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        try:
+            headers['content-length'] = int(headers.get('content-length', 0))
+        except ValueError:
+            return None
+        if headers['content-length'] < 0:
+            return None
+        return words[0], words[1], words[2], headers
+
+    def keep_alive(self, version, headers):
+        """whether the client wants the connection kept open"""
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            return connection != 'close'
+        return connection == 'keep-alive'
+
+    def rpc_response(self, data, keep_alive):
+        """dispatch XML-RPC request body; runs on the executor"""
+        body = self.server._marshaled_dispatch(data)
+        return self.http_response(200, 'OK', body, keep_alive), not keep_alive
+
+    def internal_error(self):
+        return self.error_response(500, 'Internal Server Error')
+
+    def error_response(self, code, message):
+        """HTTP error response that closes the connection"""
+        return self.http_response(code, message, '', False), True
+
+    def http_response(self, code, message, body, keep_alive):
+        """frame body as an HTTP/1.1 response"""
+        return ('HTTP/1.1 %d %s\r\n'
+                'Content-Type: text/xml\r\n'
+                'Content-Length: %d\r\n'
+                'Connection: %s\r\n\r\n%s' % (code, message, len(body),
+                                              'keep-alive' if keep_alive else 'close', body))
+
+
+class LineChannel(PipelinedChannel):
+    """Newline delimited text commands over a persistent connection
+
+    Args:
+        sock (socket): accepted connection
+        server (EventServer): server that accepted it
+    """
+    max_line = 4096
+
+    def __init__(self, sock, server):
+        PipelinedChannel.__init__(self, sock, server)
+        self.buffer = []
+        self.buffered = 0
+        self.set_terminator('\n')
+
+    def collect_incoming_data(self, data):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered > self.max_line:
+            self.buffer = []
+            self.buffered = 0
+            self.closing = True
+            self.submit(self.line_response, 'ERROR request too long', True)
+
+    def found_terminator(self):
+        line = ''.join(self.buffer).strip()
+        self.buffer = []
+        self.buffered = 0
+        if self.closing:
+            return
+        words = line.split()
+        if not words:
+            return
+        command = self.server.line_commands.get(words[0])
+        if command is None:
+            self.submit(self.line_response, 'ERROR unknown command \'%s\'' % words[0][:64], False)
+            return
+        func, nargs = command
+        if len(words) - 1 != nargs:
+            self.submit(self.line_response, 'ERROR %s takes %d arguments' % (words[0], nargs), False)
+            return
+        self.submit(self.line_command, func, words[1:])
+
+    def line_command(self, func, args):
+        """run a registered command; runs on the executor"""
+        return self.line_response(func(*args), False)
+
+    def line_response(self, text, close):
+        return text + '\n', close
+
+    def internal_error(self):
+        return self.line_response('ERROR internal error', True)
+
+
+class Listener(asyncore.dispatcher):
+    """Accepts connections on addr and hands them to channel_class
+
+    Args:
+        addr (tuple): host and port to listen on
+        channel_class (class): PipelinedChannel subclass serving connections
+        server (EventServer): server the listener belongs to
+    """
+    def __init__(self, addr, channel_class, server):
+        asyncore.dispatcher.__init__(self, map=server.sock_map)
+        self.channel_class = channel_class
+        self.server = server
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(addr)
+        self.listen(socket.SOMAXCONN)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            sock, _ = pair
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.channel_class(sock, self.server)
+
+
+class EventServer(SimpleXMLRPCDispatcher):
+    """XML-RPC server running every connection on one asyncore loop
+
+    Functions are registered exactly as with SimpleXMLRPCServer.
+    Functions registered with register_line_command are also served over the
+    text protocol once listen_lines is called.
+
+    Args:
+        addr (tuple or None): host and port to serve XML-RPC on, or None to
+            serve only the text protocol
+        workers (int): number of executor threads running requests
+        max_pending (int): most requests queued or running on the executor
+        max_pipeline (int): most requests in flight on one connection
+    """
+    def __init__(self, addr, workers=8, max_pending=1024, max_pipeline=64):
+        SimpleXMLRPCDispatcher.__init__(self, allow_none=False, encoding=None)
+        self.sock_map = {}
+        self.max_pending = max_pending
+        self.max_pipeline = max_pipeline
+        self.pending = 0
+        self.jobs = Queue()
+        self.done = deque()
+        self.line_commands = {}
+        self.waker = Waker(self.finish, self.sock_map)
+        self.listeners = []
+        if addr is not None:
+            self.listeners.append(Listener(addr, HTTPChannel, self))
+        for num in range(workers):
+            thread_obj = threading.Thread(target=self.execute, name='bank-executor-%d' % num)
+            thread_obj.daemon = True
+            thread_obj.start()
+
+    def register_line_command(self, name, func, nargs):
+        """serve func as text command name taking nargs arguments"""
+        self.line_commands[name] = (func, nargs)
+
+    def listen_lines(self, addr):
+        """serve the text protocol on addr; call before serve_forever"""
+        self.listeners.append(Listener(addr, LineChannel, self))
+
+    def has_capacity(self):
+        """whether the executor can take another request"""
+        return self.pending < self.max_pending
+
+    def submit(self, channel, slot, func, args):
+        """queue func(*args) for the executor; called on the loop thread"""
+        self.pending += 1
+        self.jobs.put((channel, slot, func, args))
+
+    def execute(self):
+        """executor thread: run queued requests and hand results to the loop"""
+        while True:
+            channel, slot, func, args = self.jobs.get()
+            try:
+                result = func(*args)
+            except Exception:
+                logging.exception('event server: request failed')
+                result = channel.internal_error()
+            self.done.append((channel, slot, result))
+            self.waker.wake()
+
+    def finish(self):
+        """loop thread: deliver results of finished requests"""
+        while self.done:
+            channel, slot, result = self.done.popleft()
+            self.pending -= 1
+            if channel.connected:
+                channel.complete(slot, result)
+
+    def serve_forever(self):
+        """run the event loop"""
+        asyncore.loop(timeout=1, use_poll=True, map=self.sock_map)
@@ -0,0 +1,281 @@
+""" Metrics
+This module implements the counters, gauges and latency histograms the bank
+server keeps about itself, and the plaintext endpoint that serves them in the
+Prometheus exposition format.
+
+Every metric guards its own values with its own lock, and values that already
+live elsewhere, such as cache hit counts or writer queue depths, are read by
+callbacks at scrape time. A scrape therefore never waits on the database or
+its writer threads. Metrics are registered in REGISTRY when the modules using
+them are imported, so the endpoint lists them from the start."""
+
+import bisect
+import functools
+import threading
+import time
+import SocketServer
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def format_labels(names, values, extra=()):
+    """render label names and values as {name="value",...}"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in pairs)
+
+
+def format_value(value):
+    """render value as the exposition format expects"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric(object):
+    """Base of metrics with one value per combination of label values
+
+    Args:
+        name (str): metric name
+        doc (str): help text
+        labels (tuple, optional): label names
+    """
+    kind = 'untyped'
+
+    def __init__(self, name, doc, labels=()):
+        super(Metric, self).__init__()
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) of every sample"""
+        with self.lock:
+            values = self.values.items()
+        return [('', labels, (), value) for labels, value in sorted(values)]
+
+    def expose(self):
+        """lines describing this metric in the exposition format"""
+        lines = ['# HELP %s %s' % (self.name, self.doc), '# TYPE %s %s' % (self.name, self.kind)]
+        for suffix, labels, extra, value in self.samples():
+            lines.append('%s%s%s %s' % (self.name, suffix, format_labels(self.labels, labels, extra),
+                                        format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    """Count that only goes up"""
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        """add amount to the count for labels"""
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        """count for labels"""
+        with self.lock:
+            return self.values.get(labels, 0)
+
+
+class Gauge(Metric):
+    """Value that may go up and down"""
+    kind = 'gauge'
+
+    def set(self, value, labels=()):
+        """set the value for labels"""
+        with self.lock:
+            self.values[labels] = value
+
+
+class Callback(Metric):
+    """Metric whose values are read by func at scrape time
+
+    Args:
+        kind (str): 'counter' or 'gauge'
+        func (function): returns a dict of value by label values
+    """
+    def __init__(self, name, doc, labels, kind, func):
+        super(Callback, self).__init__(name, doc, labels)
+        self.kind = kind
+        self.func = func
+
+    def samples(self):
+        return [('', labels, (), value) for labels, value in sorted(self.func().items())]
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets
+
+    Args:
+        buckets (tuple, optional): increasing bucket upper bounds
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        """add value to the distribution for labels"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total = self.values.get(labels, (None, 0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self.values[labels] = (counts, total + value)
+
+    def time(self, labels=()):
+        """time a with block as one observation for labels"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self.lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self.values.items()]
+        samples = []
+        for labels, counts, total in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append(('_bucket', labels, (('le', format_value(bound)),), cumulative))
+            samples.append(('_sum', labels, (), total))
+            samples.append(('_count', labels, (), cumulative))
+        return samples
+
+
+class _Timer(object):
+    """Observes how long its with block took"""
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.time() - self.start, self.labels)
+
+
+class Registry(object):
+    """Metrics served by one exposition endpoint"""
+    def __init__(self):
+        super(Registry, self).__init__()
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        """add metric, replacing any earlier one of the same name
+
+        Returns:
+            (Metric): metric
+        """
+        with self.lock:
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, doc, labels=()):
+        """create and register a Counter"""
+        return self.register(Counter(name, doc, labels))
+
+    def gauge(self, name, doc, labels=()):
+        """create and register a Gauge"""
+        return self.register(Gauge(name, doc, labels))
+
+    def histogram(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        """create and register a Histogram"""
+        return self.register(Histogram(name, doc, labels, buckets))
+
+    def callback(self, name, doc, labels, kind, func):
+        """create and register a Callback"""
+        return self.register(Callback(name, doc, labels, kind, func))
+
+    def expose(self):
+        """every metric in the plaintext exposition format"""
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines.extend(metric.expose())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+RPC_REQUESTS = REGISTRY.counter('bank_rpc_requests_total',
+                                'RPC calls served, by interface, method and outcome',
+                                ('interface', 'method', 'outcome'))
+RPC_SECONDS = REGISTRY.histogram('bank_rpc_duration_seconds',
+                                 'Time spent serving RPC calls, by interface and method',
+                                 ('interface', 'method'))
+LOG_RECORDS_DROPPED = REGISTRY.counter('bank_log_records_dropped_total',
+                                       'Log records dropped because the log queue was full')
+
+
+def instrument(interface, failed):
+    """Decorator counting and timing every call of an RPC method
+
+    Args:
+        interface (str): 'bank' or 'admin'
+        failed (function): tells from a result whether the call failed
+
+    Each call is counted with outcome 'ok', 'error' if failed says so, or
+    'exception' if it raised.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def instrumented(*args):
+            outcome = 'exception'
+            start = time.time()
+            try:
+                result = func(*args)
+                outcome = 'error' if failed(result) else 'ok'
+                return result
+            finally:
+                RPC_SECONDS.observe(time.time() - start, (interface, func.__name__))
+                RPC_REQUESTS.inc((interface, func.__name__, outcome))
+        return instrumented
+    return decorate
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn, HTTPServer):
+    """HTTPServer serving each scrape on its own thread"""
+    daemon_threads = True
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the registry of the server on GET /metrics"""
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.expose()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_metrics(addr, registry=REGISTRY):
+    """serve registry over HTTP on addr from a daemon thread
+
+    Returns:
+        (ThreadedHTTPServer): the running server
+    """
+    server = ThreadedHTTPServer(addr, MetricsHandler)
+    server.registry = registry
+    thread_obj = threading.Thread(target=server.serve_forever, name='bank-metrics')
+    thread_obj.daemon = True
+    thread_obj.start()
+    return server
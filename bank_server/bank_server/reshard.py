@@ -0,0 +1,100 @@
+"""
+Offline tool that splits the bank_server accounts into the number of shards
+set in config.yaml.
+
+Stop the bank server and back up its database files before running:
+
+    python -m bank_server.reshard [config.yaml]
+
+Every account is read from the current shards, written to the shard its
+card_id hashes to under the new count, and the routing index and shard count
+in the main database file are rebuilt to match. Shard files no longer in use
+are removed.
+"""
+
+import os
+import sys
+import sqlite3
+import logging
+import yaml
+from .db import CARDS_SCHEMA, ACCOUNTS_SCHEMA, shard_index, shard_files
+
+
+def reshard(config):
+    """move every account into the shards config asks for
+
+    Args:
+        config (dict): bank_server configuration
+
+    Returns:
+        (int): number of accounts moved
+    """
+    db_file = os.getcwd() + config['database']['db_path']
+    shard_path = config.get('shards', {}).get('path')
+    shard_count = int(config.get('shards', {}).get('count', 1))
+
+    main_conn = sqlite3.connect(db_file, isolation_level=None)
+    old_count = main_conn.execute('PRAGMA user_version;').fetchone()[0] or 1
+    old_files = shard_files(db_file, shard_path, old_count)
+    new_files = shard_files(db_file, shard_path, shard_count)
+    logging.info('resharding %s from %d to %d shards', db_file, old_count, shard_count)
+
+    # Read every account from the current layout
+    accounts = []
+    for old_file in old_files:
+        conn = main_conn if old_file == db_file else sqlite3.connect(old_file)
+        accounts.extend(conn.execute('SELECT account_name, card_id, balance FROM cards;').fetchall())
+        if conn is not main_conn:
+            conn.close()
+
+    split = [[] for _ in new_files]
+    for account in accounts:
+        split[shard_index(str(account[1]), shard_count)].append(account)
+
+    # Write the shards other than the main database file
+    for num in range(1, shard_count):
+        conn = sqlite3.connect(new_files[num])
+        conn.execute('PRAGMA journal_mode=WAL;')
+        conn.execute('DROP TABLE IF EXISTS cards;')
+        conn.execute(CARDS_SCHEMA)
+        conn.executemany('INSERT INTO cards(account_name, card_id, balance) values (?, ?, ?);', split[num])
+        conn.commit()
+        conn.close()
+
+    # Rewrite shard 0, the routing index and the shard count in one transaction
+    main_conn.execute('BEGIN;')
+    main_conn.execute('DELETE FROM cards;')
+    main_conn.executemany('INSERT INTO cards(account_name, card_id, balance) values (?, ?, ?);', split[0])
+    main_conn.execute('DROP TABLE IF EXISTS accounts;')
+    if shard_count > 1:
+        main_conn.execute(ACCOUNTS_SCHEMA)
+        main_conn.executemany('INSERT INTO accounts(account_name, card_id) values (?, ?);',
+                              [(account[0], account[1]) for account in accounts])
+    main_conn.execute('PRAGMA user_version = %d;' % shard_count)
+    main_conn.execute('COMMIT;')
+    main_conn.close()
+
+    for old_file in old_files[len(new_files):]:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.isfile(old_file + suffix):
+                os.remove(old_file + suffix)
+
+    logging.info('moved %d accounts', len(accounts))
+    return len(accounts)
+
+
+def main():
+    """reshard the database described by the config file given on the
+    command line, or by config.yaml next to this file"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if len(sys.argv) > 1:
+        config_path = sys.argv[1]
+    else:
+        config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
+    with open(config_path, 'r') as ymlfile:
+        config = yaml.load(ymlfile)
+    reshard(config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+""" Server
+This module implements the XML-RPC server used by the bank interface.
+
+SimpleXMLRPCServer handles one request at a time, so every ATM queues behind
+whichever request is currently being served. PooledXMLRPCServer hands accepted
+connections to a fixed pool of worker threads instead. Each worker keeps its
+thread for the lifetime of the server, which lets DB keep one sqlite
+connection per worker rather than opening one per request."""
+
+import threading
+import SocketServer
+from Queue import Queue
+from SimpleXMLRPCServer import SimpleXMLRPCServer
+
+
+class ThreadPoolMixIn(SocketServer.ThreadingMixIn):
+    """Mix-in class to handle each request with a fixed pool of threads
+
+    Args:
+        workers (int): number of worker threads serving requests
+    """
+    daemon_threads = True
+
+    def start_workers(self, workers):
+        """start worker threads pulling requests off the request queue"""
+        self.requests = Queue()
+        for num in range(workers):
+            thread_obj = threading.Thread(target=self.process_request_worker,
+                                          name='bank-worker-%d' % num)
+            thread_obj.daemon = self.daemon_threads
+            thread_obj.start()
+
+    def process_request_worker(self):
+        """serve requests from the request queue forever"""
+        while True:
+            request, client_address = self.requests.get()
+            self.process_request_thread(request, client_address)
+
+    def process_request(self, request, client_address):
+        """queue request for the next free worker"""
+        self.requests.put((request, client_address))
+
+
+class PooledXMLRPCServer(ThreadPoolMixIn, SimpleXMLRPCServer):
+    """SimpleXMLRPCServer serving requests from a pool of worker threads
+
+    Args:
+        addr (tuple): host and port to listen on
+        workers (int): number of worker threads serving requests
+    """
+    def __init__(self, addr, workers=1, **kwargs):
+        SimpleXMLRPCServer.__init__(self, addr, **kwargs)
+        self.start_workers(workers)
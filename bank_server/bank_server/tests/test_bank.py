@@ -1,10 +1,13 @@
 from unittest import TestCase
 from multiprocessing import Process
 from bank_server import Bank, DB, AdminBackend
+from bank_server.__main__ import serve
 from bank_connection import BankConnection
 from admin_connection import AdminConnection
 import sys, os, yaml, threading, time
 import uuid
+import urllib2
+import xmlrpclib
 
 class TestBank(TestCase):
     # Create listening socket for bank testing
@@ -15,15 +18,9 @@ class TestBank(TestCase):
         with open(config_path, 'r') as ymlfile:
             config = yaml.load(ymlfile)
         cls.config = config
-        # Create database mutex for Bank and AdminBackend
-        db_mutex = threading.Lock()
-        ready_event = threading.Event()
-
-        # Run bank and its admin interface
-        cls.bank = Process(target=Bank, args=(config, db_mutex, ready_event))
-        cls.admin = Process(target=AdminBackend, args=(config, db_mutex, ready_event))
+        # Run bank and its admin interface in one process sharing one DB
+        cls.bank = Process(target=serve, args=(config,))
         cls.bank.start()
-        cls.admin.start()
 
         # Wait for bank and admin interface to initialize
         time.sleep(3)
@@ -35,7 +32,6 @@ class TestBank(TestCase):
     def tearDownClass(cls):
         print "Must kill test manually"
         cls.bank.terminate()
-        cls.admin.terminate()
 
     def test_check_balance_valid(self):
         bank_iface = BankConnection(self.config)
@@ -111,6 +107,27 @@ class TestBank(TestCase):
         self.assertTrue(res[6:] == 'withdraw command usage: withdraw <atm_id> <card_id> <amount>')
 
 
+    def test_withdraw_concurrent(self):
+        account_name = 'ophelia'
+        card_id = self.admin_iface.create_account(account_name, '10')
+        self.assertTrue(card_id)
+        atm_id = self.admin_iface.create_atm()
+        self.assertTrue(atm_id)
+
+        results = []
+        def withdraw():
+            bank_iface = BankConnection(self.config)
+            results.append(bank_iface.withdraw(atm_id, card_id, 3))
+        threads = [threading.Thread(target=withdraw) for _ in range(10)]
+        for thread_obj in threads:
+            thread_obj.start()
+        for thread_obj in threads:
+            thread_obj.join()
+
+        self.assertTrue(len([res for res in results if res[:4] == 'OKAY']) == 3)
+        bal = self.admin_iface.check_balance(account_name)
+        self.assertTrue(bal == 1)
+
     def test_admin_create_account_valid(self):
         account_name = 'test acav'
         amount = '5'
@@ -154,6 +171,85 @@ class TestBank(TestCase):
         res = self.admin_iface.check_balance('gerald')
         self.assertTrue(res == 15)
 
+    def test_admin_update_balance_seen_by_bank(self):
+        bank_iface = BankConnection(self.config)
+        account_name = 'wendell'
+        card_id = self.admin_iface.create_account(account_name, '30')
+        self.assertTrue(card_id)
+        res = bank_iface.check_balance(card_id)
+        self.assertTrue(int(res[5:]) == 30)
+        self.assertTrue(self.admin_iface.update_balance(account_name, 45))
+        res = bank_iface.check_balance(card_id)
+        self.assertTrue(int(res[5:]) == 45)
+
+    def test_admin_batch(self):
+        res = self.admin_iface.create_accounts([['batch1', '5'], ['batch2', 7], ['batch1', 9],
+                                                ['test1', 1], ['batch3', 'a'], ['batch4']])
+        self.assertTrue(res[0] and res[1])
+        self.assertFalse(res[2] or res[3] or res[4] or res[5])
+
+        res = self.admin_iface.check_balances(['batch1', 'batch2', 'nobody'])
+        self.assertTrue(res == [5, 7, False])
+
+        res = self.admin_iface.update_balances([['batch1', 11], ['nobody', 3], ['batch2', 12]])
+        self.assertTrue(res == [True, False, True])
+        res = self.admin_iface.check_balances(['batch1', 'batch2'])
+        self.assertTrue(res == [11, 12])
+
+        atm_ids = self.admin_iface.create_atms(3)
+        self.assertTrue(len(atm_ids) == 3 and all(atm_ids))
+        bank_iface = BankConnection(self.config)
+        card_ids = self.admin_iface.create_accounts([['batch5', 20]])
+        res = bank_iface.withdraw(atm_ids[2], card_ids[0], 4)
+        self.assertTrue(res[:4] == 'OKAY')
+        self.assertTrue(self.admin_iface.check_balances(['batch5']) == [16])
+
+    def test_admin_batch_limits(self):
+        max_batch = self.config['admin']['max_batch']
+        for count in (0, -1, 'many', max_batch + 1):
+            self.assertTrue(self.admin_iface.create_atms(count) is False)
+        self.assertTrue(self.admin_iface.create_accounts([['limit%d' % num, 1] for num in range(max_batch + 1)]) is False)
+        self.assertTrue(self.admin_iface.check_balances(['limit0'] * (max_batch + 1)) is False)
+        self.assertTrue(self.admin_iface.update_balances([['limit0', 1]] * (max_batch + 1)) is False)
+        # Nothing from the refused batch was created
+        self.assertTrue(self.admin_iface.check_balance('limit0') is False)
+        self.assertTrue(self.admin_iface.check_balances([]) == [])
+
+    def test_multicall(self):
+        multicall = xmlrpclib.MultiCall(self.admin_iface)
+        multicall.create_account('multi1', '8')
+        multicall.check_balance('multi1')
+        multicall.update_balance('multi1', 9)
+        multicall.check_balance('multi1')
+        res = tuple(multicall())
+        self.assertTrue(res[0] and res[1] == 8 and res[2] and res[3] == 9)
+
+        card_id = str(uuid.UUID('{50000000-0000-0000-0000-000000000000}'))
+        multicall = xmlrpclib.MultiCall(BankConnection(self.config))
+        multicall.check_balance(card_id)
+        multicall.check_balance('111')
+        res = tuple(multicall())
+        self.assertTrue(res[0][:4] == 'OKAY')
+        self.assertTrue(res[1][:5] == 'ERROR')
+
+    def committed_batches(self):
+        """write transactions the bank has committed to test.db so far"""
+        body = urllib2.urlopen('http://localhost:%d/metrics' % self.config['metrics']['port']).read()
+        for line in body.splitlines():
+            if line.startswith('bank_db_batch_writes_count{db="test.db"}'):
+                return float(line.split()[-1])
+        return 0
+
+    def test_admin_bulk_onboarding(self):
+        count = 300
+        before = self.committed_batches()
+        res = self.admin_iface.create_accounts([['bulk%d' % num, 10] for num in range(count)])
+        self.assertTrue(all(res))
+        self.assertEqual(len(res), count)
+        # Every account went in with one write transaction
+        self.assertEqual(self.committed_batches() - before, 1)
+        self.assertEqual(self.admin_iface.check_balance('bulk%d' % (count - 1)), 10)
+
     def test_admin_check_balance_valid(self):
         account_name = 'myrtle'
         amount = '20'
@@ -0,0 +1,188 @@
+from unittest import TestCase
+from multiprocessing import Process
+from bank_server import Bank
+from bank_server.event_server import EventServer, Listener, PipelinedChannel
+import os, yaml, copy, socket, threading, time
+import xmlrpclib
+
+
+class LineClient(object):
+    """Blocking client for the bank line protocol"""
+    def __init__(self, port):
+        self.sock = socket.create_connection(('localhost', port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.rfile = self.sock.makefile('rb')
+
+    def send(self, *lines):
+        self.sock.sendall(''.join(line + '\n' for line in lines))
+
+    def recv(self):
+        return self.rfile.readline().rstrip('\n')
+
+    def call(self, line):
+        self.send(line)
+        return self.recv()
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+class TestLineProtocol(TestCase):
+    # Start an event loop bank and a pooled bank, both serving the line protocol
+    @classmethod
+    def setUpClass(cls):
+        config_path = os.path.join(os.path.dirname(__file__), 'test_config.yaml')
+        with open(config_path, 'r') as ymlfile:
+            config = yaml.load(ymlfile)
+
+        cls.event_config = copy.deepcopy(config)
+        cls.event_config['bank']['port'] = config['bank']['port'] + 40
+        cls.event_config['bank']['line_port'] = config['bank']['port'] + 41
+        cls.event_config['bank']['frontend'] = 'event'
+
+        cls.pooled_config = copy.deepcopy(config)
+        cls.pooled_config['bank']['port'] = config['bank']['port'] + 50
+        cls.pooled_config['bank']['line_port'] = config['bank']['port'] + 51
+        cls.pooled_config['bank']['frontend'] = 'pooled'
+
+        cls.banks = []
+        for bank_config in (cls.event_config, cls.pooled_config):
+            bank = Process(target=Bank, args=(bank_config, threading.Event()))
+            bank.start()
+            cls.banks.append(bank)
+
+        # Wait for banks to initialize
+        time.sleep(3)
+
+    @classmethod
+    def tearDownClass(cls):
+        for bank in cls.banks:
+            bank.terminate()
+
+    def test_commands(self):
+        card_id = '50000000-0000-0000-0000-000000000000'
+        for config in (self.event_config, self.pooled_config):
+            client = LineClient(config['bank']['line_port'])
+            balance = client.call('balance ' + card_id)
+            self.assertEqual(balance[:5], 'OKAY ')
+            self.assertEqual(client.call('balance not-a-card'),
+                             'ERROR check_balance command usage: balance <card_id>')
+            self.assertEqual(client.call('withdraw ' + card_id), 'ERROR withdraw takes 3 arguments')
+            self.assertEqual(client.call('deposit ' + card_id + ' 5'), 'ERROR unknown command \'deposit\'')
+            self.assertEqual(client.call('withdraw missing-atm ' + card_id + ' 1'),
+                             'ERROR could not lookup atm \'missing-atm\'')
+            # Connection still usable after errors
+            self.assertEqual(client.call('balance ' + card_id), balance)
+            client.close()
+
+    def test_pipelining(self):
+        card_id = '50000000-0000-0000-0000-000000000000'
+        client = LineClient(self.event_config['bank']['line_port'])
+        balance = client.call('balance ' + card_id)
+        lines = []
+        for num in range(200):
+            if num % 3 == 0:
+                lines.append('bogus %d' % num)
+            else:
+                lines.append('balance ' + card_id)
+        client.send(*lines)
+        for num in range(200):
+            if num % 3 == 0:
+                self.assertEqual(client.recv(), 'ERROR unknown command \'bogus\'')
+            else:
+                self.assertEqual(client.recv(), balance)
+        client.close()
+
+    def test_wire_bytes(self):
+        card_id = '50000000-0000-0000-0000-000000000000'
+
+        # One check_balance over XML-RPC, with the HTTP framing xmlrpclib uses
+        body = xmlrpclib.dumps((card_id,), 'check_balance')
+        request = ('POST /RPC2 HTTP/1.1\r\nHost: localhost\r\nContent-Type: text/xml\r\n'
+                   'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+        sock = socket.create_connection(('localhost', self.event_config['bank']['port']))
+        sock.sendall(request)
+        rfile = sock.makefile('rb')
+        headers = ''
+        while not headers.endswith('\r\n\r\n'):
+            headers += rfile.readline()
+        length = [int(line.split(':')[1]) for line in headers.splitlines()
+                  if line.lower().startswith('content-length:')][0]
+        response = headers + rfile.read(length)
+        rfile.close()
+        sock.close()
+        xmlrpc = len(request) + len(response)
+        self.assertEqual(xmlrpclib.loads(response.split('\r\n\r\n', 1)[1])[0][0][:5], 'OKAY ')
+
+        # And over the line protocol
+        client = LineClient(self.event_config['bank']['line_port'])
+        request = 'balance ' + card_id
+        response = client.call(request)
+        client.close()
+        self.assertEqual(response[:5], 'OKAY ')
+        line = len(request) + len(response) + 2
+        self.assertLess(line * 5, xmlrpc)
+
+
+class FailingChannel(PipelinedChannel):
+    """channel whose every request raises, leaving internal_error to the base"""
+    def __init__(self, sock, server):
+        PipelinedChannel.__init__(self, sock, server)
+        self.set_terminator('\n')
+
+    def collect_incoming_data(self, data):
+        pass
+
+    def found_terminator(self):
+        self.submit(self.fail)
+
+    def fail(self):
+        raise ValueError('request failed')
+
+
+class TestInternalError(TestCase):
+    def test_default_closes(self):
+        server = EventServer(None, workers=1)
+        listener = Listener(('127.0.0.1', 0), FailingChannel, server)
+        thread_obj = threading.Thread(target=server.serve_forever)
+        thread_obj.daemon = True
+        thread_obj.start()
+
+        client = LineClient(listener.getsockname()[1])
+        client.sock.settimeout(5)
+        client.send('anything')
+        self.assertEqual(client.recv(), '')
+        client.close()
+
+
+class TestHTTPLimits(TestCase):
+    def setUp(self):
+        self.server = EventServer(('127.0.0.1', 0), workers=1)
+        thread_obj = threading.Thread(target=self.server.serve_forever)
+        thread_obj.daemon = True
+        thread_obj.start()
+
+    def request(self, data):
+        """send data and return the status line of the answer"""
+        client = LineClient(self.server.listeners[0].getsockname()[1])
+        client.sock.settimeout(5)
+        self.addCleanup(client.close)
+        try:
+            client.sock.sendall(data)
+        except socket.error:
+            # Closed on us before everything was sent
+            pass
+        return client.recv().rstrip('\r')
+
+    def test_header_too_large(self):
+        status = self.request('POST /RPC2 HTTP/1.1\r\nX-Pad: %s\r\n\r\n' % ('a' * 100000))
+        self.assertEqual(status, 'HTTP/1.1 400 Request Header Too Large')
+
+    def test_body_too_large(self):
+        status = self.request('POST /RPC2 HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % (1 << 30))
+        self.assertEqual(status, 'HTTP/1.1 413 Request Entity Too Large')
+
+    def test_negative_length(self):
+        status = self.request('POST /RPC2 HTTP/1.1\r\nContent-Length: -5\r\n\r\n')
+        self.assertEqual(status, 'HTTP/1.1 400 Bad Request')
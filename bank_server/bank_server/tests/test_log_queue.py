@@ -0,0 +1,55 @@
+from unittest import TestCase
+from bank_server import log_queue
+from bank_server.metrics import LOG_RECORDS_DROPPED
+import logging, threading
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class TestLogQueue(TestCase):
+    def setUp(self):
+        self.log = logging.getLogger('test_log_queue')
+        self.log.propagate = False
+        self.addCleanup(setattr, self.log, 'handlers', [])
+
+    def test_listener_writes_records(self):
+        target = ListHandler()
+        listener = log_queue.start_queue_logging(self.log, [target])
+        self.log.warning('admin create_atms created %d of %d', 2, 3)
+        listener.stop()
+        self.assertEqual(target.messages, ['admin create_atms created 2 of 3'])
+
+    def test_drops_counted(self):
+        before = LOG_RECORDS_DROPPED.get()
+        queue_handler = log_queue.QueueLogHandler(capacity=1, on_drop=LOG_RECORDS_DROPPED.inc)
+        self.log.addHandler(queue_handler)
+        self.log.warning('kept')
+        self.log.warning('dropped')
+        self.assertEqual(queue_handler.dropped, 1)
+        self.assertEqual(LOG_RECORDS_DROPPED.get() - before, 1)
+
+        target = ListHandler()
+        listener = log_queue.QueueLogListener(queue_handler, [target])
+        listener.start()
+        listener.stop()
+        self.assertEqual(target.messages, ['kept', 'Log queue full, dropped 1 records (1 in total)'])
+
+    def test_drops_counted_across_threads(self):
+        queue_handler = log_queue.QueueLogHandler(capacity=1)
+
+        def emit():
+            for _ in range(1000):
+                queue_handler.emit(logging.makeLogRecord({'msg': 'dropped'}))
+        threads = [threading.Thread(target=emit) for _ in range(8)]
+        for thread_obj in threads:
+            thread_obj.start()
+        for thread_obj in threads:
+            thread_obj.join()
+        self.assertEqual(queue_handler.dropped, 8 * 1000 - 1)
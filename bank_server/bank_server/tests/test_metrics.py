@@ -0,0 +1,72 @@
+from unittest import TestCase
+from bank_server import metrics
+from bank_server.db import DB
+import os, sqlite3, urllib2
+
+
+class TestMetrics(TestCase):
+    db_path = '/bank_server/tests/metrics_test.db'
+
+    @classmethod
+    def remove_db_files(cls):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.isfile(os.getcwd() + cls.db_path + suffix):
+                os.remove(os.getcwd() + cls.db_path + suffix)
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_histogram(self):
+        histogram = self.registry.histogram('test_seconds', 'Test latency', ('method',),
+                                            buckets=(.1, 1))
+        for value in (.05, .1, .5, 2):
+            histogram.observe(value, ('withdraw',))
+        lines = self.registry.expose().splitlines()
+        self.assertEqual(lines[:2], ['# HELP test_seconds Test latency', '# TYPE test_seconds histogram'])
+        self.assertIn('test_seconds_bucket{method="withdraw",le="0.1"} 2.0', lines)
+        self.assertIn('test_seconds_bucket{method="withdraw",le="1.0"} 3.0', lines)
+        self.assertIn('test_seconds_bucket{method="withdraw",le="+Inf"} 4.0', lines)
+        self.assertIn('test_seconds_sum{method="withdraw"} 2.65', lines)
+        self.assertIn('test_seconds_count{method="withdraw"} 4.0', lines)
+
+    def test_instrument(self):
+        @metrics.instrument('test', lambda result: result.startswith('ERROR'))
+        def lookup(card_id):
+            if card_id is None:
+                raise ValueError(card_id)
+            return 'OKAY 10' if card_id else 'ERROR no card'
+
+        before = dict((outcome, metrics.RPC_REQUESTS.get(('test', 'lookup', outcome)))
+                      for outcome in ('ok', 'error', 'exception'))
+        self.assertEqual(lookup('card'), 'OKAY 10')
+        self.assertEqual(lookup(''), 'ERROR no card')
+        self.assertRaises(ValueError, lookup, None)
+        for outcome in ('ok', 'error', 'exception'):
+            self.assertEqual(metrics.RPC_REQUESTS.get(('test', 'lookup', outcome)), before[outcome] + 1)
+
+    def test_db_metrics_endpoint(self):
+        self.remove_db_files()
+        self.addCleanup(self.remove_db_files)
+        conn = sqlite3.connect(os.getcwd() + self.db_path)
+        with open(os.getcwd() + '/bank_server/tests/test_db.sql', 'r') as file_handle:
+            conn.executescript(file_handle.read())
+        conn.commit()
+        conn.close()
+        db_obj = DB(db_path=self.db_path, cache_size=16)
+        card_id = '50000000-0000-0000-0000-000000000000'
+        self.assertTrue(db_obj.set_balance(card_id, 20))
+        self.assertEqual(db_obj.get_balance(card_id), 20)
+
+        server = metrics.serve_metrics(('127.0.0.1', 0))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        response = urllib2.urlopen('http://127.0.0.1:%d/metrics' % server.server_address[1])
+        self.assertTrue(response.info()['Content-Type'].startswith('text/plain'))
+        body = response.read()
+        label = 'db="metrics_test.db"'
+        self.assertIn('bank_db_commit_seconds_count{%s}' % label, body)
+        self.assertIn('bank_db_write_wait_seconds_count{%s}' % label, body)
+        self.assertIn('bank_db_transaction_seconds_count{%s}' % label, body)
+        self.assertIn('bank_db_write_queue_depth{%s} 0.0' % label, body)
+        self.assertIn('bank_cache_hits_total{cache="cards"}', body)
+        self.assertIn('bank_cache_hit_ratio{cache="cards"}', body)
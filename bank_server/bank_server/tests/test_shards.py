@@ -0,0 +1,139 @@
+from unittest import TestCase
+from bank_server import db
+from bank_server.reshard import reshard
+import os, yaml, copy, sqlite3, uuid
+
+
+class TestShards(TestCase):
+    # Build a fresh database from test_db.sql and split it into 4 shards
+    @classmethod
+    def setUpClass(cls):
+        config_path = os.path.join(os.path.dirname(__file__), 'test_config.yaml')
+        with open(config_path, 'r') as ymlfile:
+            config = yaml.load(ymlfile)
+        config['database']['db_path'] = '/bank_server/tests/shards_test.db'
+        config['shards']['path'] = '/bank_server/tests/shards_test_%d.db'
+        cls.config = config
+        cls.db_files = db.shard_files(os.getcwd() + config['database']['db_path'],
+                                      config['shards']['path'], 4)
+        cls.remove_db_files()
+
+        conn = sqlite3.connect(cls.db_files[0])
+        with open(os.getcwd() + config['database']['db_init'], 'r') as file_handle:
+            conn.executescript(file_handle.read())
+        conn.commit()
+        conn.close()
+
+        cls.sharded_config = copy.deepcopy(config)
+        cls.sharded_config['shards']['count'] = 4
+        reshard(cls.sharded_config)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.remove_db_files()
+
+    @classmethod
+    def remove_db_files(cls):
+        for db_file in cls.db_files:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.isfile(db_file + suffix):
+                    os.remove(db_file + suffix)
+
+    def test_all(self):
+        db_obj = db.open_db(self.sharded_config)
+        self.assertEqual(len(db_obj.shards), 4)
+        atm_id = '40000000-0000-0000-0000-000000000000'
+        card_id = '50000000-0000-0000-0000-000000000000'
+
+        # account from test_db.sql was moved to its shard
+        self.assertEqual(db_obj.get_balance(card_id), 10)
+        self.assertEqual(db_obj.admin_get_balance('test1'), 10)
+
+        # spread new accounts over every shard
+        card_ids = {}
+        for num in range(32):
+            new_card_id = str(uuid.uuid4())
+            self.assertTrue(db_obj.admin_create_account('acct%d' % num, new_card_id, num + 1))
+            card_ids['acct%d' % num] = new_card_id
+        self.assertEqual(set(db.shard_index(new_card_id, 4) for new_card_id in card_ids.values()),
+                         set(range(4)))
+        self.assertFalse(db_obj.admin_create_account('acct0', str(uuid.uuid4()), 1))
+        self.assertFalse(db_obj.admin_create_account('acct_dup', card_ids['acct1'], 1))
+
+        for account_name, new_card_id in card_ids.items():
+            self.assertEqual(db_obj.admin_get_balance(account_name), int(account_name[4:]) + 1)
+
+        # withdrawals from accounts on every shard
+        for account_name in ('acct10', 'acct11', 'acct12', 'acct13'):
+            result = db_obj.withdraw(atm_id, card_ids[account_name], 2)
+            self.assertEqual(result.status, db.WITHDRAW_OKAY)
+            self.assertEqual(result.balance, int(account_name[4:]) - 1)
+        result = db_obj.withdraw(atm_id, card_ids['acct0'], 5)
+        self.assertEqual(result.status, db.WITHDRAW_FUNDS)
+        self.assertEqual(db_obj.get_atm_num_bills(atm_id), 120)
+
+        self.assertTrue(db_obj.admin_set_balance('acct5', 100))
+        self.assertEqual(db_obj.admin_get_balance('acct5'), 100)
+
+        # batch operations spanning every shard
+        batch = [('bulk%d' % num, str(uuid.uuid4()), num) for num in range(16)]
+        batch.append(('acct1', str(uuid.uuid4()), 1))
+        batch.append(('bulk_dup', card_ids['acct2'], 1))
+        batch.append(('bulk0', str(uuid.uuid4()), 1))
+        self.assertEqual(db_obj.admin_create_accounts(batch), [True] * 16 + [False] * 3)
+        self.assertEqual(db_obj.admin_get_balances(['bulk3', 'bulk15', 'acct1', 'nobody']),
+                         [3, 15, 2, False])
+        self.assertEqual(db_obj.admin_set_balances([('bulk%d' % num, 50) for num in range(16)] +
+                                                   [('nobody', 50)]),
+                         [True] * 16 + [False])
+        self.assertEqual(db_obj.admin_get_balances(['bulk%d' % num for num in range(16)]), [50] * 16)
+        self.assertEqual(db_obj.card_of('bulk_dup'), None)
+        self.assertTrue(db_obj.admin_create_accounts([('bulk_dup', str(uuid.uuid4()), 1)]) == [True])
+
+        # a 4 shard database refuses to open as 1 shard
+        self.assertRaises(db.ShardMismatch, db.open_db, self.config)
+
+        # merging back into one shard keeps every account
+        self.assertEqual(reshard(self.config), 50)
+        self.assertFalse(os.path.isfile(self.db_files[1]))
+        db_obj = db.open_db(self.config)
+        self.assertEqual(db_obj.admin_get_balance('acct5'), 100)
+        self.assertEqual(db_obj.admin_get_balance('acct10'), 9)
+        self.assertEqual(db_obj.get_balance(card_id), 10)
+
+    def test_empty_shard_zero(self):
+        config = copy.deepcopy(self.sharded_config)
+        config['database']['db_path'] = '/bank_server/tests/shards_empty.db'
+        config['shards']['path'] = '/bank_server/tests/shards_empty_%d.db'
+        config['shards']['count'] = 2
+        db_files = db.shard_files(os.getcwd() + config['database']['db_path'],
+                                  config['shards']['path'], 3)
+
+        def remove_db_files():
+            for db_file in db_files:
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.isfile(db_file + suffix):
+                        os.remove(db_file + suffix)
+        remove_db_files()
+        self.addCleanup(remove_db_files)
+        conn = sqlite3.connect(db_files[0])
+        with open(os.getcwd() + config['database']['db_init'], 'r') as file_handle:
+            conn.executescript(file_handle.read())
+        conn.execute('DELETE FROM cards;')
+        conn.commit()
+        conn.close()
+
+        # The only account lives in shard 1, leaving the main cards table empty
+        db_obj = db.open_db(config)
+        card_id = next(card_id for card_id in (str(uuid.uuid4()) for _ in range(100))
+                       if db.shard_index(card_id, 2) == 1)
+        self.assertTrue(db_obj.admin_create_account('solo', card_id, 5))
+        conn = sqlite3.connect(db_files[0])
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM cards;').fetchone()[0], 0)
+        conn.close()
+
+        for count in (1, 3):
+            config['shards']['count'] = count
+            self.assertRaises(db.ShardMismatch, db.open_db, config)
+        config['shards']['count'] = 2
+        self.assertEqual(db.open_db(config).admin_get_balance('solo'), 5)
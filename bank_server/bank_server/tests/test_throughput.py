@@ -0,0 +1,75 @@
+from unittest import TestCase
+from multiprocessing import Process
+from bank_server import Bank
+from bank_server.db import DB
+import os, yaml, copy, socket, sqlite3, threading, time
+import xmlrpclib
+
+
+class TestWAL(TestCase):
+    db_path = '/bank_server/tests/wal_test.db'
+
+    @classmethod
+    def remove_db_files(cls):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.isfile(os.getcwd() + cls.db_path + suffix):
+                os.remove(os.getcwd() + cls.db_path + suffix)
+
+    def test_read_during_write(self):
+        self.remove_db_files()
+        self.addCleanup(self.remove_db_files)
+        conn = sqlite3.connect(os.getcwd() + self.db_path)
+        with open(os.getcwd() + '/bank_server/tests/test_db.sql', 'r') as file_handle:
+            conn.executescript(file_handle.read())
+        conn.close()
+        db_obj = DB(db_path=self.db_path)
+        card_id = '50000000-0000-0000-0000-000000000000'
+
+        # Another connection holds a write transaction open
+        conn = sqlite3.connect(os.getcwd() + self.db_path, isolation_level=None)
+        self.addCleanup(conn.close)
+        conn.execute('BEGIN EXCLUSIVE;')
+        conn.execute('UPDATE cards SET balance = 0 WHERE card_id = (?);', (card_id,))
+
+        # Readers still see the last committed balance instead of waiting
+        self.assertEqual(db_obj.get_balance(card_id), 10)
+        conn.execute('COMMIT;')
+        self.assertEqual(db_obj.get_balance(card_id), 0)
+
+
+class TestThroughput(TestCase):
+    # Start an event loop bank on its own port
+    @classmethod
+    def setUpClass(cls):
+        config_path = os.path.join(os.path.dirname(__file__), 'test_config.yaml')
+        with open(config_path, 'r') as ymlfile:
+            config = yaml.load(ymlfile)
+
+        cls.event_config = copy.deepcopy(config)
+        cls.event_config['bank']['port'] = config['bank']['port'] + 30
+        cls.event_config['bank']['workers'] = 8
+        cls.event_config['bank']['frontend'] = 'event'
+        cls.event_config['bank'].pop('line_port', None)
+
+        cls.bank = Process(target=Bank, args=(cls.event_config, threading.Event()))
+        cls.bank.start()
+
+        # Wait for bank to initialize
+        time.sleep(3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bank.terminate()
+
+    def test_event_idle_connections(self):
+        # Many more open connections than executor threads
+        port = self.event_config['bank']['port']
+        card_id = '50000000-0000-0000-0000-000000000000'
+        idle = [socket.create_connection(('localhost', port)) for _ in range(64)]
+        try:
+            bank_iface = xmlrpclib.ServerProxy('http://localhost:' + str(port))
+            for _ in range(10):
+                self.assertEqual(bank_iface.check_balance(card_id)[:4], 'OKAY')
+        finally:
+            for sock in idle:
+                sock.close()
@@ -0,0 +1,172 @@
+from unittest import TestCase
+from bank_server import db
+from bank_server.writer import DBWriter, BATCH_WRITES
+import os, sqlite3, threading, time
+
+
+class RecordingConn(object):
+    """stands in for the writer's connection, recording what is run on it"""
+    def __init__(self, commit_delay=0):
+        self.statements = []
+        self.commit_delay = commit_delay
+        self.failing = []
+
+    def execute(self, statement):
+        if statement in self.failing:
+            self.failing.remove(statement)
+            raise sqlite3.OperationalError(statement)
+        if statement == 'COMMIT;':
+            time.sleep(self.commit_delay)
+        self.statements.append(statement)
+
+    def fail(self, *statements):
+        """make the next run of each of statements raise"""
+        self.failing = list(statements)
+
+    def write(self, num):
+        self.statements.append('write %d' % num)
+        return num
+
+    def batches(self):
+        """number of writes in each committed batch"""
+        sizes = [0]
+        for statement in self.statements:
+            if statement == 'COMMIT;':
+                sizes.append(0)
+            elif statement.startswith('write'):
+                sizes[-1] += 1
+        return sizes[:-1]
+
+
+class TestWriter(TestCase):
+    db_path = '/bank_server/tests/writer_test.db'
+
+    @classmethod
+    def remove_db_files(cls):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.isfile(os.getcwd() + cls.db_path + suffix):
+                os.remove(os.getcwd() + cls.db_path + suffix)
+
+    def hold_writer(self, writer):
+        """keep writer busy until the returned event is set"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def wait():
+            started.set()
+            release.wait()
+        writer.submit(wait)
+        started.wait()
+        return release
+
+    def test_batch_up_to_max_ops(self):
+        conn = RecordingConn()
+        writer = DBWriter(conn, commit_window=0, commit_max_ops=4)
+        release = self.hold_writer(writer)
+        futures = [writer.submit(conn.write, num) for num in range(10)]
+        release.set()
+        self.assertEqual([future.result() for future in futures], range(10))
+        # The held write commits alone, then the queued ones 4 at a time
+        self.assertEqual(conn.batches(), [0, 4, 4, 2])
+
+    def test_window_bounds_wait(self):
+        conn = RecordingConn()
+        writer = DBWriter(conn, commit_window=.2, commit_max_ops=32)
+        start = time.time()
+        self.assertEqual(writer.submit(conn.write, 0).result(), 0)
+        elapsed = time.time() - start
+        self.assertGreaterEqual(elapsed, .2)
+        self.assertLess(elapsed, .7)
+
+        # A full batch commits without waiting out the window
+        writer = DBWriter(conn, commit_window=5, commit_max_ops=4)
+        start = time.time()
+        futures = [writer.submit(conn.write, num) for num in range(4)]
+        for future in futures:
+            future.result()
+        self.assertLess(time.time() - start, 1)
+
+    def test_result_after_commit(self):
+        conn = RecordingConn(commit_delay=.2)
+        writer = DBWriter(conn, commit_window=0, commit_max_ops=1)
+        self.assertEqual(writer.submit(conn.write, 7).result(), 7)
+        self.assertIn('COMMIT;', conn.statements[conn.statements.index('write 7'):])
+
+    def test_failed_withdraw_in_batch(self):
+        self.remove_db_files()
+        self.addCleanup(self.remove_db_files)
+        conn = sqlite3.connect(os.getcwd() + self.db_path)
+        with open(os.getcwd() + '/bank_server/tests/test_db.sql', 'r') as file_handle:
+            conn.executescript(file_handle.read())
+        conn.execute("insert into cards (account_name, card_id, balance) values ('test2', '50000000-0000-0000-0000-000000000001', 100);")
+        conn.commit()
+        conn.close()
+
+        db_obj = db.DB(db_path=self.db_path, commit_window=1, commit_max_ops=2)
+        atm_id = '40000000-0000-0000-0000-000000000000'
+        labels = (os.path.basename(db_obj.db_file),)
+        counts, total = BATCH_WRITES.values.get(labels, ([], 0))
+        before = (sum(counts), total)
+        results = {}
+
+        def withdraw(card_id, amount):
+            results[card_id] = db_obj.withdraw(atm_id, card_id, amount)
+        threads = [threading.Thread(target=withdraw, args=('50000000-0000-0000-0000-000000000000', 20)),
+                   threading.Thread(target=withdraw, args=('50000000-0000-0000-0000-000000000001', 5))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Both withdrawals were applied in one batch of two
+        counts, total = BATCH_WRITES.values[labels]
+        self.assertEqual((sum(counts) - before[0], total - before[1]), (1, 2))
+        self.assertEqual(results['50000000-0000-0000-0000-000000000000'].status, db.WITHDRAW_FUNDS)
+        self.assertEqual(results['50000000-0000-0000-0000-000000000001'],
+                         db.WithdrawResult(db.WITHDRAW_OKAY, 95, 123))
+
+        # Only the failed withdrawal's bills were handed back
+        conn = sqlite3.connect(os.getcwd() + self.db_path)
+        self.assertEqual(conn.execute('SELECT num_bills FROM atms;').fetchone()[0], 123)
+        self.assertEqual(sorted(conn.execute('SELECT balance FROM cards;').fetchall()), [(10,), (95,)])
+        conn.close()
+
+    def test_failed_write_undone(self):
+        conn = sqlite3.connect(':memory:', isolation_level=None, check_same_thread=False)
+        conn.execute('create table rows (num integer);')
+        writer = DBWriter(conn, commit_window=1, commit_max_ops=2)
+        hooks = []
+
+        def insert(num, fail):
+            conn.execute('insert into rows values (?);', (num,))
+            writer.after_commit(hooks.append, num)
+            if fail:
+                raise ValueError(num)
+            return num
+        failed = writer.submit(insert, 1, True)
+        applied = writer.submit(insert, 2, False)
+        self.assertRaises(ValueError, failed.result)
+        self.assertEqual(applied.result(), 2)
+        self.assertEqual(conn.execute('select num from rows;').fetchall(), [(2,)])
+        self.assertEqual(hooks, [2])
+
+    def test_survives_failed_hook(self):
+        conn = RecordingConn()
+        writer = DBWriter(conn, commit_window=0, commit_max_ops=1)
+        hooks = []
+
+        def write(num):
+            writer.after_commit(int, 'not a number')
+            writer.after_commit(hooks.append, num)
+            return num
+        self.assertEqual(writer.submit(write, 1).result(), 1)
+        self.assertEqual(writer.submit(write, 2).result(), 2)
+        self.assertEqual(hooks, [1, 2])
+
+    def test_survives_failed_rollback(self):
+        conn = RecordingConn()
+        writer = DBWriter(conn, commit_window=0, commit_max_ops=1)
+        conn.fail('COMMIT;', 'ROLLBACK;')
+        self.assertRaises(sqlite3.OperationalError, writer.submit(conn.write, 1).result)
+        self.assertEqual(writer.submit(conn.write, 2).result(), 2)
+        self.assertEqual(conn.statements.count('COMMIT;'), 1)
@@ -0,0 +1,240 @@
+""" Writer
+This module implements the thread that applies every write to the
+bank_server database.
+
+Callers hand DBWriter a write and get a Future back. The writer thread owns
+the only write connection: it drains whatever writes are queued, applies them
+in one transaction, commits once and then resolves each Future. Writes that
+arrive while a commit is in flight simply make the next batch bigger, so the
+number of commits drops as load rises.
+
+Each write runs inside its own savepoint, so a write that raises is undone
+without taking the rest of its batch with it."""
+
+import logging
+import sqlite3
+import threading
+import time
+import weakref
+from Queue import Queue, Empty
+from .metrics import REGISTRY
+
+WRITE_WAIT_SECONDS = REGISTRY.histogram('bank_db_write_wait_seconds',
+                                        'Time writes wait for the writer to start their transaction',
+                                        ('db',))
+TRANSACTION_SECONDS = REGISTRY.histogram('bank_db_transaction_seconds',
+                                         'Time the writer holds a write transaction open, commit included',
+                                         ('db',))
+COMMIT_SECONDS = REGISTRY.histogram('bank_db_commit_seconds', 'Time taken by each COMMIT', ('db',))
+BATCH_WRITES = REGISTRY.histogram('bank_db_batch_writes', 'Writes applied per transaction', ('db',),
+                                  buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+COMMIT_FAILURES = REGISTRY.counter('bank_db_commit_failures_total',
+                                   'Write transactions that failed to begin or commit', ('db',))
+
+# Writers of every open database, for the queue depth gauge
+WRITERS = weakref.WeakSet()
+
+
+def queue_depths():
+    """writes queued for each writer, by db label"""
+    depths = {}
+    for writer in list(WRITERS):
+        depths[(writer.name,)] = depths.get((writer.name,), 0) + writer.queue.qsize()
+    return depths
+
+
+REGISTRY.callback('bank_db_write_queue_depth', 'Writes waiting for the writer', ('db',), 'gauge',
+                  queue_depths)
+
+
+class Future(object):
+    """Result of a write that DBWriter has not applied yet"""
+    def __init__(self):
+        super(Future, self).__init__()
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def set_result(self, value):
+        """resolve with value and wake the waiting caller"""
+        self.value = value
+        self.done.set()
+
+    def set_exception(self, error):
+        """resolve with error and wake the waiting caller"""
+        self.error = error
+        self.done.set()
+
+    def result(self):
+        """block until resolved
+
+        Returns:
+            Value the write returned.
+
+        Raises:
+            Whatever the write raised, or the sqlite3.Error that failed its
+            transaction.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class DBWriter(object):
+    """Thread applying queued writes in batched transactions
+
+    Args:
+        db_conn (sqlite3.Connection): connection in autocommit mode
+            (isolation_level=None) that all writes run on. Only the writer
+            thread uses it.
+        commit_window (float): how long in seconds the writer waits for more
+            writes to join a batch after the first one arrives
+        commit_max_ops (int): most writes applied in one transaction
+        name (str, optional): label of the database in metrics
+    """
+    def __init__(self, db_conn, commit_window=0, commit_max_ops=1, name='db'):
+        super(DBWriter, self).__init__()
+        self.db_conn = db_conn
+        self.commit_window = commit_window
+        self.commit_max_ops = max(commit_max_ops, 1)
+        self.name = name
+        self.queue = Queue()
+        self.on_commit = []
+        self.thread = threading.Thread(target=self.run, name='db-writer')
+        self.thread.daemon = True
+        self.thread.start()
+        WRITERS.add(self)
+
+    def submit(self, func, *args):
+        """queue func to be applied by the writer thread
+
+        Returns:
+            (Future): resolved once func's batch has committed
+        """
+        future = Future()
+        if threading.current_thread() is self.thread:
+            # Already applying a batch, so func just joins it
+            value, error = self.call(func, args)
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
+            return future
+        self.queue.put((func, args, future, time.time()))
+        return future
+
+    def after_commit(self, func, *args):
+        """call func once the batch being applied has committed
+
+        Only valid from inside a write. func is called on the writer thread
+        in commit order, and not at all if the commit fails.
+        """
+        self.on_commit.append((func, args))
+
+    def run(self):
+        """apply batches of queued writes forever"""
+        while True:
+            batch = self.next_batch()
+            try:
+                self.apply(batch)
+            except Exception as err:
+                # Keep the thread alive so later writes still get applied
+                logging.exception('db writer %s failed to apply a batch', self.name)
+                self.rollback()
+                for _, _, future, _ in batch:
+                    if not future.done.is_set():
+                        future.set_exception(err)
+
+    def next_batch(self):
+        """block for the next write and gather whatever joins it
+
+        Returns:
+            (list): queued (func, args, future, time submitted) writes
+        """
+        batch = [self.queue.get()]
+        deadline = time.time() + self.commit_window
+        while len(batch) < self.commit_max_ops:
+            remaining = deadline - time.time()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return batch
+
+    def call(self, func, args):
+        """apply func(*args) inside a savepoint of its own
+
+        If func raises, what it wrote and the after_commit calls it made are
+        undone, and the rest of the batch commits without them.
+
+        Returns:
+            (tuple): func's result and None, or None and what func raised
+
+        Raises:
+            sqlite3.Error: if the savepoint can't be opened, undone or closed,
+                which fails the whole batch
+        """
+        mark = len(self.on_commit)
+        self.db_conn.execute('SAVEPOINT batch_write;')
+        try:
+            value, error = func(*args), None
+        except Exception as err:
+            self.db_conn.execute('ROLLBACK TO batch_write;')
+            del self.on_commit[mark:]
+            value, error = None, err
+        self.db_conn.execute('RELEASE batch_write;')
+        return value, error
+
+    def rollback(self):
+        """roll back the transaction being applied, if there still is one"""
+        try:
+            self.db_conn.execute('ROLLBACK;')
+        except sqlite3.Error as err:
+            logging.info('db writer %s: rollback failed: %s', self.name, err)
+
+    def apply(self, batch):
+        """apply batch in one transaction and resolve its futures"""
+        self.on_commit = []
+        labels = (self.name,)
+        begin = time.time()
+        for _, _, _, submitted in batch:
+            WRITE_WAIT_SECONDS.observe(begin - submitted, labels)
+        BATCH_WRITES.observe(len(batch), labels)
+        try:
+            self.db_conn.execute('BEGIN IMMEDIATE;')
+        except sqlite3.Error as err:
+            COMMIT_FAILURES.inc(labels)
+            for _, _, future, _ in batch:
+                future.set_exception(err)
+            return
+
+        results = []
+        try:
+            for func, args, future, _ in batch:
+                results.append((future,) + self.call(func, args))
+            commit = time.time()
+            self.db_conn.execute('COMMIT;')
+        except sqlite3.Error as err:
+            self.rollback()
+            COMMIT_FAILURES.inc(labels)
+            for _, _, future, _ in batch:
+                future.set_exception(err)
+            return
+        end = time.time()
+        COMMIT_SECONDS.observe(end - commit, labels)
+        TRANSACTION_SECONDS.observe(end - begin, labels)
+
+        for func, args in self.on_commit:
+            try:
+                func(*args)
+            except Exception:
+                logging.exception('db writer %s: after_commit call %r failed', self.name, func)
+        for future, value, error in results:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)
@@ -0,0 +1,8 @@
+"""Benchmarks of the bank server
+
+Each module times one part of the bank and prints what it measured. They
+are not tests and assert nothing; run one from the bank_server directory,
+for example:
+
+    python -m bench.throughput
+"""
@@ -0,0 +1,67 @@
+"""check_balance latency over XML-RPC and the line protocol
+
+Starts an event loop bank from the test configuration and prints the
+average check_balance latency over XML-RPC, over the line protocol one
+request at a time, and over the line protocol with every request
+pipelined.
+"""
+
+from multiprocessing import Process
+from bank_server import Bank
+import argparse, copy, os, socket, threading, time
+import xmlrpclib
+import yaml
+
+CARD_ID = '50000000-0000-0000-0000-000000000000'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+    requests = args.requests
+
+    config_path = os.path.join('bank_server', 'tests', 'test_config.yaml')
+    with open(config_path, 'r') as ymlfile:
+        config = yaml.load(ymlfile)
+    bank_config = copy.deepcopy(config)
+    bank_config['bank']['port'] = config['bank']['port'] + 40
+    bank_config['bank']['line_port'] = config['bank']['port'] + 41
+    bank_config['bank']['frontend'] = 'event'
+    bank = Process(target=Bank, args=(bank_config, threading.Event()))
+    bank.start()
+
+    # Wait for bank to initialize
+    time.sleep(3)
+    try:
+        bank_iface = xmlrpclib.ServerProxy('http://localhost:' + str(bank_config['bank']['port']))
+        start = time.time()
+        for _ in range(requests):
+            bank_iface.check_balance(CARD_ID)
+        xmlrpc = (time.time() - start) / requests
+
+        sock = socket.create_connection(('localhost', bank_config['bank']['line_port']))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        rfile = sock.makefile('rb')
+        start = time.time()
+        for _ in range(requests):
+            sock.sendall('balance %s\n' % CARD_ID)
+            rfile.readline()
+        line = (time.time() - start) / requests
+
+        start = time.time()
+        sock.sendall('balance %s\n' % CARD_ID * requests)
+        for _ in range(requests):
+            rfile.readline()
+        pipelined = (time.time() - start) / requests
+        rfile.close()
+        sock.close()
+    finally:
+        bank.terminate()
+
+    print 'check_balance latency: xmlrpc %.3fms, line %.3fms, line pipelined %.3fms' % (
+        xmlrpc * 1000, line * 1000, pipelined * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Account onboarding time, one at a time and in bulk
+
+Starts the bank and its admin interface from the test configuration and
+prints how long creating accounts takes with one create_account call each
+and with a single create_accounts call.
+"""
+
+from multiprocessing import Process
+from bank_server.__main__ import serve
+import argparse, os, time, uuid
+import xmlrpclib
+import yaml
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=300)
+    args = parser.parse_args()
+    count = args.accounts
+
+    config_path = os.path.join('bank_server', 'tests', 'test_config.yaml')
+    with open(config_path, 'r') as ymlfile:
+        config = yaml.load(ymlfile)
+    bank = Process(target=serve, args=(config,))
+    bank.start()
+
+    # Wait for bank and admin interface to initialize
+    time.sleep(3)
+    try:
+        admin_iface = xmlrpclib.ServerProxy('http://localhost:' + str(config['admin']['port']))
+        # Fresh names, so the bench can run against the same database again
+        prefix = uuid.uuid4().hex[:8]
+        start = time.time()
+        for num in range(count):
+            admin_iface.create_account('%s-single%d' % (prefix, num), 10)
+        single = time.time() - start
+
+        start = time.time()
+        admin_iface.create_accounts([['%s-bulk%d' % (prefix, num), 10] for num in range(count)])
+        bulk = time.time() - start
+    finally:
+        bank.terminate()
+
+    print 'create %d accounts: one at a time %.3fs, create_accounts %.3fs' % (count, single, bulk)
+
+
+if __name__ == '__main__':
+    main()
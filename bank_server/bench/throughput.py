@@ -0,0 +1,92 @@
+"""check_balance throughput of the bank frontends
+
+Starts a single worker bank, a pooled bank and an event loop bank side by
+side from the test configuration, and prints how many check_balance
+requests per second each serves to several clients while one other ATM
+sits on a stalled connection.
+"""
+
+from multiprocessing import Process
+from bank_server import Bank
+import argparse, copy, os, socket, threading, time
+import xmlrpclib
+import yaml
+
+CARD_ID = '50000000-0000-0000-0000-000000000000'
+
+
+def slow_check_balance(port, card_id, delay):
+    """check_balance from a client that stalls for delay seconds between
+    sending its headers and its body, like an ATM on a flaky link"""
+    body = xmlrpclib.dumps((card_id,), 'check_balance')
+    sock = socket.create_connection(('localhost', port))
+    sock.sendall('POST /RPC2 HTTP/1.0\r\n'
+                 'Content-Type: text/xml\r\n'
+                 'Content-Length: %d\r\n\r\n' % len(body))
+    time.sleep(delay)
+    sock.sendall(body)
+    while sock.recv(4096):
+        pass
+    sock.close()
+
+
+def throughput(port, clients, requests, stall):
+    """check_balance requests per second served to clients while one
+    other ATM sits on a stalled connection"""
+    stalled = threading.Thread(target=slow_check_balance, args=(port, CARD_ID, stall))
+    stalled.start()
+    # Give the bank time to accept the stalled connection
+    time.sleep(.1)
+
+    def client():
+        bank_iface = xmlrpclib.ServerProxy('http://localhost:' + str(port))
+        for _ in range(requests):
+            bank_iface.check_balance(CARD_ID)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.time()
+    for thread_obj in threads:
+        thread_obj.start()
+    for thread_obj in threads:
+        thread_obj.join()
+    elapsed = time.time() - start
+    stalled.join()
+    return clients * requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--stall', type=float, default=1.0)
+    args = parser.parse_args()
+
+    config_path = os.path.join('bank_server', 'tests', 'test_config.yaml')
+    with open(config_path, 'r') as ymlfile:
+        config = yaml.load(ymlfile)
+
+    frontends = (('1 worker', 'pooled', 1), ('8 workers', 'pooled', 8), ('event loop', 'event', 8))
+    banks = []
+    for offset, (name, frontend, workers) in enumerate(frontends):
+        bank_config = copy.deepcopy(config)
+        bank_config['bank']['port'] = config['bank']['port'] + 10 * (offset + 1)
+        bank_config['bank']['frontend'] = frontend
+        bank_config['bank']['workers'] = workers
+        bank_config['bank'].pop('line_port', None)
+        bank = Process(target=Bank, args=(bank_config, threading.Event()))
+        bank.start()
+        banks.append((name, bank_config['bank']['port'], bank))
+
+    # Wait for banks to initialize
+    time.sleep(3)
+    try:
+        for name, port, _ in banks:
+            print 'check_balance req/s, %s: %.1f' % (name, throughput(port, args.clients,
+                                                                     args.requests, args.stall))
+    finally:
+        for _, _, bank in banks:
+            bank.terminate()
+
+
+if __name__ == '__main__':
+    main()